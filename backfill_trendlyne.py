@@ -1,15 +1,25 @@
 """
 Backfill historical option chain data from Trendlyne SmartOptions API.
 This populates a local SQLite database with 1-minute interval historical data.
+Snapshots are stored once in the collector DB's option_data (see trendlyne_ingest.py);
+option_chain_details / option_aggregates there are views over it. DB stays an
+OptionDatabase whose snapshot readers cover option_data as well as the monthly files.
+LiveSnapshotService fetches many symbols' chains concurrently, minute by minute.
 """
-import requests
 import time
-import sqlite3
+import asyncio
 import os
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
- 
+from clients import TrendlyneClient, RateLimiter
+from database import Database, OptionDatabase
+from rollups import RollupManager
+from trendlyne_ingest import SnapshotIngestor, canonical_symbol, snapshot_rows
+from trading_calendar import TradingCalendar, slot_strings
+from profiling import Profiler, add_profiling_args, profiler_from_args
+
 
 # Upstox SDK
 try:
@@ -21,268 +31,38 @@ except ImportError:
     UPSTOX_AVAILABLE = False
     print("[WARN] Upstox SDK not found. Option Chain will rely on Trendlyne only.")
 
-# ==========================================================================
-# 1. DATABASE LAYER (SQLite)
-# ==========================================================================
-class OptionDatabase:
-    def __init__(self, master_db_path="sos_master_data.db"):
-        self.master_db_path = master_db_path
-        self._init_master_db()
-
-    def _get_timeseries_db_path(self):
-        """Returns the DB path for the current month, e.g., 'sos_timeseries_2023_12.db'"""
-        return f"sos_timeseries_{datetime.now().strftime('%Y_%m')}.db"
-
-    def _get_connection(self, db_path):
-        """Establishes a connection and enables WAL mode."""
-        conn = sqlite3.connect(db_path, timeout=10)
-        conn.execute("PRAGMA journal_mode=WAL;")
-        return conn
-
-    def _init_master_db(self):
-        conn = self._get_connection(self.master_db_path)
-        cursor = conn.cursor()
-        # This table is for static, slowly changing data
-        cursor.execute('''CREATE TABLE IF NOT EXISTS pcr_history (
-                            symbol TEXT,
-                            date TEXT,
-                            pcr REAL,
-                            call_oi INTEGER,
-                            put_oi INTEGER,
-                            PRIMARY KEY (symbol, date)
-                          )''')
-        conn.commit()
-        conn.close()
-
-    def _init_timeseries_db(self, db_path):
-        """Initializes tables in the monthly timeseries database."""
-        conn = self._get_connection(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS option_aggregates (
-                            symbol TEXT, date TEXT, timestamp TEXT, expiry TEXT,
-                            call_oi INTEGER, put_oi INTEGER, pcr REAL,
-                            PRIMARY KEY (symbol, date, timestamp)
-                          )''')
-        cursor.execute('''CREATE TABLE IF NOT EXISTS option_chain_details (
-                            symbol TEXT, date TEXT, timestamp TEXT, strike REAL,
-                            call_oi INTEGER, put_oi INTEGER, call_oi_chg INTEGER, put_oi_chg INTEGER,
-                            PRIMARY KEY (symbol, date, timestamp, strike)
-                          )''')
-        cursor.execute('''CREATE TABLE IF NOT EXISTS market_depth_history (
-                            timestamp INTEGER, symbol TEXT, rvol REAL, pcr REAL, adv_dec_ratio REAL,
-                            PRIMARY KEY (timestamp, symbol)
-                          )''')
-        conn.commit()
-        conn.close()
-
-    def save_snapshot(self, symbol, trading_date, timestamp, expiry, aggregates, details):
-        db_path = self._get_timeseries_db_path()
-        self._init_timeseries_db(db_path) # Ensures table exists
-        conn = self._get_connection(db_path)
-        cursor = conn.cursor()
-        try:
-            # Save Aggregates
-            cursor.execute("""INSERT OR REPLACE INTO option_aggregates
-                              VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                           (symbol, trading_date, timestamp, expiry,
-                            aggregates['call_oi'], aggregates['put_oi'], aggregates['pcr']))
-
-            # Save Details
-            for strike, d in details.items():
-                cursor.execute("""INSERT OR REPLACE INTO option_chain_details
-                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                               (symbol, trading_date, timestamp, float(strike),
-                                d['call_oi'], d['put_oi'], d['call_oi_chg'], d['put_oi_chg']))
-
-            conn.commit()
-        except Exception as e:
-            print(f"[DB ERROR] {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-
-    def save_market_depth(self, ts, symbol, rvol, pcr, ratio):
-        db_path = self._get_timeseries_db_path()
-        self._init_timeseries_db(db_path)
-        conn = self._get_connection(db_path)
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT OR REPLACE INTO market_depth_history VALUES (?, ?, ?, ?, ?)",
-                           (ts, symbol, rvol, pcr, ratio))
-            conn.commit()
-        except Exception as e:
-            print(f"[DB DEPTH ERROR] {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-
-    def save_breadth(self, trading_date, timestamp, data):
-        # This data is transient and might not need historical persistence in this context
-        # If required, it should go into the timeseries DB.
-        # For now, this can be a no-op or write to a log.
-        pass
-
-    def get_latest_breadth(self):
-        # This would require querying the latest timeseries DB, which is complex.
-        # Market breadth is better handled live.
-        return None
-
-    def get_latest_aggregates(self, symbol):
-        db_path = self._get_timeseries_db_path()
-        if not os.path.exists(db_path): return None
-        conn = self._get_connection(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""SELECT * FROM option_aggregates
-                          WHERE symbol=?
-                          ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return {
-                'symbol': row[0],
-                'date': row[1],
-                'timestamp': row[2],
-                'expiry': row[3],
-                'call_oi': row[4],
-                'put_oi': row[5],
-                'pcr': row[6]
-            }
-        return None
-
-    def get_latest_chain(self, symbol):
-        db_path = self._get_timeseries_db_path()
-        if not os.path.exists(db_path): return []
-        conn = self._get_connection(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""SELECT date, timestamp FROM option_chain_details
-                          WHERE symbol=?
-                          ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
-        last = cursor.fetchone()
-        if not last:
-            conn.close()
-            return []
-
-        d, ts = last
-        cursor.execute("""SELECT * FROM option_chain_details
-                          WHERE symbol=? AND date=? AND timestamp=?""", (symbol, d, ts))
-        rows = cursor.fetchall()
-        conn.close()
-
-        return [{
-            'strike': r[3], 'call_oi': r[4], 'put_oi': r[5],
-            'call_oi_chg': r[6], 'put_oi_chg': r[7]
-        } for r in rows]
-
-    def save_daily_stats(self, symbol, trading_date, pcr, call_oi, put_oi):
-        conn = self._get_connection(self.master_db_path)
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT OR REPLACE INTO pcr_history VALUES (?, ?, ?, ?, ?)",
-                           (symbol, trading_date, pcr, call_oi, put_oi))
-            conn.commit()
-        except Exception as e:
-            print(f"[DB STATS ERROR] {e}")
-        finally:
-            conn.close()
-
-    def get_pcr_history(self, symbol, days=30):
-        conn = self._get_connection(self.master_db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM pcr_history WHERE symbol=? ORDER BY date DESC LIMIT ?", (symbol, days))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-
-# Keep a cache to avoid repeated API calls
-STOCK_ID_CACHE = {}
-EXPIRY_CACHE = {}  # Cache for expiry dates
-DB = OptionDatabase()
+def load_config(path="config.json"):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+CONFIG = load_config()
+# Stock IDs and expiries are cached persistently by the client
+TL = TrendlyneClient()
+# Snapshots go to the collector DB; DB keeps the reader/writer API SOS callers use
+STORE = Database(CONFIG.get("db_name", "options_data.db"))
+DB = OptionDatabase(CONFIG.get("master_db_name", "sos_master_data.db"), chain_db=STORE)
+INGEST = SnapshotIngestor(STORE, TL)
+ROLLUPS = RollupManager(STORE, DB)
+# Holidays and session hours come from the on-disk calendar cache
+CAL = TradingCalendar.from_config(CONFIG)
 
 def get_stock_id_for_symbol(symbol):
     """Automatically lookup Trendlyne stock ID for a given symbol"""
-    if symbol in STOCK_ID_CACHE:
-        return STOCK_ID_CACHE[symbol]
-
-    search_url = "https://smartoptions.trendlyne.com/phoenix/api/search-contract-stock/"
-    params = {'query': symbol.lower()}
-
-    try:
-        response = requests.get(search_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        if data and 'body' in data and 'data' in data['body'] and len(data['body']['data']) > 0:
-            # Match strictly or take first
-            for item in data['body']['data']:
-                if item.get('stock_code', '').upper() == symbol.upper():
-                    stock_id = item['stock_id']
-                    STOCK_ID_CACHE[symbol] = stock_id
-                    return stock_id
-
-            stock_id = data['body']['data'][0]['stock_id']
-            STOCK_ID_CACHE[symbol] = stock_id
-            return stock_id
-        return None
-    except Exception as e:
-        print(f"[ERROR] Stock Lookup {symbol}: {e}")
-        return None
-
-def backfill_from_trendlyne(symbol, stock_id, expiry_date_str, timestamp_snapshot):
-    """Fetch and save historical OI data from Trendlyne for a specific timestamp snapshot"""
-
-    url = f"https://smartoptions.trendlyne.com/phoenix/api/live-oi-data/"
-    params = {
-        'stockId': stock_id,
-        'expDateList': expiry_date_str,
-        'minTime': "09:15",
-        'maxTime': timestamp_snapshot
-    }
+    stock_id = TL.get_stock_id_for_symbol(symbol)
+    if not stock_id:
+        print(f"[ERROR] Stock Lookup {symbol}: not found")
+    return stock_id
 
+def backfill_from_trendlyne(symbol, stock_id, expiry_date_str, timestamp_snapshot, stored=None):
+    """
+    Fetch and save the Trendlyne OI snapshot for a specific timestamp, unless
+    that minute is already in option_data. stored: INGEST.stored_slots() result
+    to check against (looked up when None).
+    """
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        print(f"Fetched data for {symbol} at {timestamp_snapshot} from Trendlyne.")
-        # print(data)
-        if data['head']['status'] != '0':
-            return False
-
-        body = data['body']
-        oi_data = body.get('oiData', {})
-        input_data = body.get('inputData', {})
-
-        trading_date = input_data.get('tradingDate', date.today().strftime("%Y-%m-%d"))
-        expiry = input_data.get('expDateList', [expiry_date_str])[0]
-
-        total_call_oi = 0
-        total_put_oi = 0
-        details = {}
-
-        for strike_str, strike_data in oi_data.items():
-            c_oi = int(strike_data.get('callOi', 0))
-            p_oi = int(strike_data.get('putOi', 0))
-            total_call_oi += c_oi
-            total_put_oi += p_oi
-
-            details[strike_str] = {
-                'call_oi': c_oi,
-                'put_oi': p_oi,
-                'call_oi_chg': int(strike_data.get('callOiChange', 0)),
-                'put_oi_chg': int(strike_data.get('putOiChange', 0))
-            }
-
-            print(f"Strike {strike_str}: Call OI={c_oi}, Put OI={p_oi}")
-        pcr = round(total_put_oi / total_call_oi, 2) if total_call_oi > 0 else 1.0
-
-        aggregates = {
-            'call_oi': total_call_oi,
-            'put_oi': total_put_oi,
-            'pcr': pcr
-        }
-
-        DB.save_snapshot(symbol, trading_date, timestamp_snapshot, expiry, aggregates, details)
-        return True
-
+        return INGEST.ingest(canonical_symbol(symbol), stock_id, expiry_date_str, timestamp_snapshot, stored=stored)
     except Exception as e:
         print(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
         return False
@@ -299,31 +79,11 @@ def fetch_live_snapshot(symbol):
     if not stock_id:
         return []
 
-    # Get Expiry (cached)
-    expiry = EXPIRY_CACHE.get(symbol)
-    # Simple validation: if expiry is in the past, refresh
-    if expiry:
-        try:
-             exp_date = datetime.strptime(expiry, "%Y-%m-%d").date()
-             if date.today() > exp_date:
-                 expiry = None
-        except:
-             expiry = None
-
-    if not expiry:
-        try:
-             expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
-             resp = requests.get(expiry_url, timeout=5)
-             expiry_list = resp.json().get('body', {}).get('expiryDates', [])
-             if expiry_list:
-                 expiry = expiry_list[0]
-                 EXPIRY_CACHE[symbol] = expiry
-        except Exception as e:
-             print(f"[WARN] Failed to fetch expiry for {symbol}: {e}")
-             pass
-
+    # Get Expiry (cached; a passed expiry is refreshed by the cache)
+    expiry = TL.get_expiry_for_date(stock_id, date.today().strftime("%Y-%m-%d"))
     if not expiry:
-        return DB.get_latest_chain(symbol)
+        print(f"[WARN] Failed to fetch expiry for {symbol}")
+        return STORE.get_latest_chain(canonical_symbol(symbol))
 
     # Timestamp
     ts = datetime.now().strftime("%H:%M")
@@ -333,20 +93,154 @@ def fetch_live_snapshot(symbol):
     success = backfill_from_trendlyne(symbol, stock_id, expiry, ts)
 
     # Return latest from DB (whether update succeeded or not, we return best available)
-    return DB.get_latest_chain(symbol)
+    return STORE.get_latest_chain(canonical_symbol(symbol))
+
+def fetch_live_snapshots(symbols, service=None):
+    """
+    fetch_live_snapshot for many symbols at once: {symbol: chain}. Pass a
+    long-lived service when calling repeatedly; without one, a service is
+    built and closed for this call.
+    """
+    if service is None:
+        with LiveSnapshotService(symbols) as service:
+            return fetch_live_snapshots(symbols, service)
+    asyncio.run(service.snapshot())
+    return {symbol: service.db.get_latest_chain(canonical_symbol(symbol)) for symbol in symbols}
 
 def generate_time_intervals(start_time="09:15", end_time="15:30", interval_minutes=1):
     """Generate time strings in HH:MM format with 1-minute default"""
-    start = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-    current = start
-    times = []
-    while current <= end:
-        times.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=interval_minutes)
-    return times
-
-def run_backfill(symbols_list=None, full_run=False):
+    return slot_strings(start_time, end_time, interval_minutes)
+
+class LiveSnapshotService:
+    """
+    Trendlyne fallback for when NSE is down. Every symbol's chain for a minute
+    is requested at once: asyncio fans the blocking client calls out to worker
+    threads sharing the client's pooled keep-alive session, and the minute's
+    chains are written in one transaction. Symbols already stored for that
+    minute (e.g. by the collector) are not requested. DB reads and writes run
+    on the worker threads too, so the event loop never blocks on SQLite.
+    Close it (or use it as a context manager) to stop the workers.
+    """
+    def __init__(self, symbols, db=None, tl=None, max_concurrency=8, requests_per_second=None, profiler=None):
+        """
+        symbols: Trendlyne ('NIFTY') or collector ('NSE|INDEX|NIFTY') symbols
+        requests_per_second: request budget shared by the workers (None: unlimited)
+        profiler: Profiler with one cycle per minute snapshot
+        """
+        self.symbols = [canonical_symbol(s) for s in symbols]
+        self.db = db or STORE
+        self.tl = tl or TL
+        self.rate_limiter = RateLimiter(1.0 / requests_per_second) if requests_per_second else None
+        self.profiler = profiler or Profiler("live_snapshots", install_signals=False)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="trendlyne")
+        self._contracts = {}
+        self.stats = {s: {'ok': 0, 'failed': 0, 'skipped': 0, 'rows': 0, 'latencies': []} for s in self.symbols}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _contract(self, symbol, date_str):
+        """(stock_id, expiry) of symbol on date_str; resolved once per day, retried while unknown."""
+        contract = self._contracts.get((symbol, date_str))
+        if contract is None:
+            stock_id = self.tl.get_stock_id_for_symbol(symbol.split('|')[-1])
+            expiry = self.tl.get_expiry_for_date(stock_id, date_str) if stock_id else None
+            if not expiry:
+                print(f"[SKIP] No stock ID/expiry for {symbol} on {date_str}")
+                return None
+            contract = self._contracts[(symbol, date_str)] = (stock_id, expiry)
+        return contract
+
+    def _fetch(self, symbol, ts_hhmm, date_str):
+        """Worker thread: (option rows or None, request seconds), or None without a contract."""
+        contract = self._contract(symbol, date_str)
+        if contract is None:
+            return None
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        start = time.perf_counter()
+        body = self.tl.get_oi_snapshot(contract[0], contract[1], ts_hhmm)
+        elapsed = time.perf_counter() - start
+        return (snapshot_rows(body, symbol, contract[1], ts_hhmm, date_str) if body else None), elapsed
+
+    async def snapshot(self, ts_hhmm=None, date_str=None):
+        """
+        Fetches every symbol's chain at ts_hhmm (default: the current minute)
+        concurrently and stores them in one write. Returns the symbols stored.
+        """
+        now = datetime.now()
+        ts_hhmm = ts_hhmm or now.strftime("%H:%M")
+        date_str = date_str or now.strftime("%Y-%m-%d")
+        loop = asyncio.get_running_loop()
+        stored = await loop.run_in_executor(self._executor, self.db.minute_symbols, f"{date_str} {ts_hhmm}")
+        pending = [s for s in self.symbols if s not in stored]
+        for symbol in self.symbols:
+            if symbol in stored: self.stats[symbol]['skipped'] += 1
+
+        results = await asyncio.gather(*(loop.run_in_executor(self._executor, self._fetch, symbol, ts_hhmm, date_str)
+                                         for symbol in pending), return_exceptions=True)
+        rows, done = [], []
+        for symbol, result in zip(pending, results):
+            st = self.stats[symbol]
+            if isinstance(result, Exception):
+                print(f"[ERROR] Fetch {symbol} @ {ts_hhmm}: {result}")
+            if isinstance(result, Exception) or result is None or not result[0]:
+                st['failed'] += 1
+                continue
+            option_rows, elapsed = result
+            st['ok'] += 1
+            st['rows'] += len(option_rows)
+            st['latencies'].append(elapsed)
+            rows.extend(option_rows)
+            done.append(symbol)
+        if rows:
+            await loop.run_in_executor(self._executor, self.db.save_option_rows, rows)
+        return done
+
+    async def backfill(self, time_slots, date_str=None):
+        """Snapshots slot after slot, all symbols of a slot at once."""
+        for ts in time_slots:
+            with self.profiler.cycle(ts):
+                await self.snapshot(ts, date_str)
+
+    async def run(self, calendar=None):
+        """Snapshots the current minute once a minute, from the open until the session is over."""
+        calendar = calendar or CAL
+        if calendar.session() is None:
+            print(f"[SKIP] {date.today()} is not a trading day")
+            return
+        while not calendar.is_session_over():
+            now = datetime.now()
+            if calendar.is_market_open(now):
+                with self.profiler.cycle(now.strftime("%H:%M")):
+                    start = time.perf_counter()
+                    done = await self.snapshot(now.strftime("%H:%M"), now.strftime("%Y-%m-%d"))
+                print(f"[Live] {now:%H:%M} {len(done)}/{len(self.symbols)} chains stored in {time.perf_counter() - start:.2f}s")
+            now = datetime.now()
+            await asyncio.sleep(60 - now.second - now.microsecond / 1e6)
+
+    def report(self):
+        """Per-symbol outcome counts and request latency (p50/p95/max)."""
+        for symbol, st in self.stats.items():
+            lat = sorted(st['latencies'])
+            latency = (f"p50={lat[len(lat) // 2] * 1000:.0f}ms p95={lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000:.0f}ms "
+                       f"max={lat[-1] * 1000:.0f}ms") if lat else "no successful requests"
+            print(f"[Live] {symbol:<22} ok={st['ok']} failed={st['failed']} skipped={st['skipped']} {latency}")
+
+def run_backfill(symbols_list=None, full_run=False, profiler=None, service=None):
+    """
+    Backfills the session so far (or its last 15 minutes) for symbols_list.
+    service: LiveSnapshotService to fetch with, left open (default: one over
+             symbols_list, closed when done)
+    """
+    # One profiler cycle per fetched slot
+    profiler = profiler or Profiler("backfill_trendlyne", install_signals=False)
     if not symbols_list:
         symbols_list = ["NIFTY", "BANKNIFTY", "RELIANCE", "SBIN", "HDFCBANK"]
 
@@ -358,16 +252,18 @@ def run_backfill(symbols_list=None, full_run=False):
     print("=" * 60)
 
     now = datetime.now()
-    market_open = now.replace(hour=9, minute=15, second=0, microsecond=0)
+    hours = CAL.session(now.date())
+    if hours is None:
+        print(f"[SKIP] {now.date()} is not a trading day")
+        return
+    session_start, session_end = hours
 
-    start_time_str = "09:15"
+    start_time_str = session_start.strftime("%H:%M")
 
-    if now < market_open:
-        end_time_str = "15:30"
-    elif now > now.replace(hour=15, minute=30, second=0, microsecond=0):
-        end_time_str = "15:30"
-    else:
+    if session_start <= now.time() <= session_end:
         end_time_str = now.strftime("%H:%M")
+    else:
+        end_time_str = session_end.strftime("%H:%M")
 
     if not full_run:
         end_dt = datetime.strptime(end_time_str, "%H:%M")
@@ -375,48 +271,47 @@ def run_backfill(symbols_list=None, full_run=False):
         start_time_str = start_dt.strftime("%H:%M")
 
         # Ensure we don't request data from before market open
-        if start_dt.time() < market_open.time():
-            start_time_str = "09:15"
+        if start_dt.time() < session_start:
+            start_time_str = session_start.strftime("%H:%M")
 
     time_slots = generate_time_intervals(start_time=start_time_str, end_time=end_time_str)
     print(f"Time Slots: {len(time_slots)} ({start_time_str} to {end_time_str}) | Symbols: {len(symbols_list)}")
 
-    for symbol in symbols_list:
-        stock_id = get_stock_id_for_symbol(symbol)
-        if not stock_id:
-            print(f"[SKIP] No Stock ID for {symbol}")
-            continue
-
-        try:
-            # Fetch Expiry
-            expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
-            resp = requests.get(expiry_url, timeout=10)
-            expiry_list = resp.json().get('body', {}).get('expiryDates', [])
-            if not expiry_list:
-                print(f"[SKIP] No Expiry for {symbol}")
-                continue
-
-            nearest_expiry = expiry_list[0]
-            print(f"Syncing {symbol} | Expiry: {nearest_expiry}...")
-
-            success_count = 0
-            for ts in time_slots:
-                if backfill_from_trendlyne(symbol, stock_id, nearest_expiry, ts):
-                    success_count += 1
-
-                # Sleep briefly to avoid rate limits
-                if success_count % 10 == 0:
-                    time.sleep(0.1)
-
-            print(f"[OK] {symbol}: Captured {success_count}/{len(time_slots)} points")
-        except Exception as e:
-            print(f"[FAIL] {symbol}: {e}")
+    # All symbols of a slot are fetched together; minutes already stored are not fetched again
+    if service is None:
+        with LiveSnapshotService(symbols_list, profiler=profiler) as service:
+            asyncio.run(service.backfill(time_slots))
+    else:
+        asyncio.run(service.backfill(time_slots))
+    service.report()
+    today = date.today().strftime("%Y-%m-%d")
+    touched = [symbol for symbol, st in service.stats.items() if st['ok']]
+    if touched:
+        ROLLUPS.rebuild(today, today, touched)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Trendlyne Data Backfill Script")
     parser.add_argument('--full', action='store_true', help='Perform a full-day backfill instead of the default last 15 minutes.')
+    parser.add_argument('--live', action='store_true', help='Snapshot every symbol each minute until the close (NSE fallback).')
+    parser.add_argument('--symbol', action='append', help='Symbol (repeatable; default: NIFTY, BANKNIFTY, RELIANCE)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+    parser.add_argument('--rps', type=float, default=5, help='Trendlyne request budget (requests per second)')
+    parser.add_argument('--base-url', help='Trendlyne API root, e.g. a local fake server')
+    add_profiling_args(parser)
     args = parser.parse_args()
 
-    target_symbols = ["NIFTY", "BANKNIFTY", "RELIANCE"]
-    run_backfill(target_symbols, full_run=args.full)
-    print("\n[DB PATH]:", os.path.abspath("sos_master_data.db"))
+    if args.base_url:
+        TL.base_url = args.base_url
+    target_symbols = args.symbol or ["NIFTY", "BANKNIFTY", "RELIANCE"]
+    profiler = profiler_from_args("backfill_trendlyne", args)
+    with LiveSnapshotService(target_symbols, max_concurrency=args.concurrency, requests_per_second=args.rps,
+                             profiler=profiler) as service:
+        if args.live:
+            try:
+                asyncio.run(service.run())
+            except KeyboardInterrupt:
+                pass
+            service.report()
+        else:
+            run_backfill(target_symbols, full_run=args.full, profiler=profiler, service=service)
+    print("\n[DB PATH]:", os.path.abspath(STORE.db_name))
@@ -1,15 +1,93 @@
 import time
 import json
-import sqlite3
-import pandas as pd
-from datetime import datetime, timedelta
-from clients import TrendlyneClient, TVClient, NSEClient
-from database import Database
+import argparse
+from clients import TrendlyneClient, TVClient
+from database import Database, OptionDatabase
+from rollups import RollupManager
+from trading_calendar import TradingCalendar
+from buildup import BuildupFetcher
+from trendlyne_ingest import parse_oi_snapshot, chain_pcr
+from profiling import Profiler, add_profiling_args, profiler_from_args
 import sys
 import os
 
+# Option rows buffered before a write; flushes always end on a minute boundary
+CHUNK_ROWS = 5000
+
+def ohlcv_by_minute(ohlcv_df):
+    """TradingView bars as {'HH:MM': (open, high, low, close, volume)}, built column-wise."""
+    columns = [ohlcv_df[c].tolist() for c in ('open', 'high', 'low', 'close', 'volume')]
+    return dict(zip(ohlcv_df.index.strftime("%H:%M"), zip(*columns)))
+
+def iter_snapshots(tl, stock_id, expiry, time_slots, delay=0.05, skip=()):
+    """Fetch stage: yields (HH:MM, Trendlyne snapshot or None), one minute at a time. Minutes in skip are not fetched."""
+    for ts_hhmm in time_slots:
+        if ts_hhmm in skip:
+            yield ts_hhmm, None
+            continue
+        yield ts_hhmm, tl.get_oi_snapshot(stock_id, expiry, ts_hhmm)
+        # Small delay to prevent hitting rate limits
+        if delay: time.sleep(delay)
+
+def iter_minute_rows(symbol, date_str, expiry, snapshots, ohlcv_map, stored=None, market=()):
+    """
+    Parse stage: yields (market_row, option_rows) per minute as plain tuples in
+    database.MARKET_COLUMNS / OPTION_COLUMNS order. Minutes without a snapshot
+    still yield their OHLCV bar when there is one.
+    stored: Database.option_minutes() for minutes whose option rows are already
+            in the DB; they yield the market row only, with PCR from the stored chain.
+    market: Database.market_minutes() for minutes that already have a market row;
+            it is kept (market_row is None) rather than replaced by the TV bar.
+    """
+    stored = stored or {}
+    prev_pcr = None
+    for ts_hhmm, snapshot in snapshots:
+        timestamp_full = f"{date_str} {ts_hhmm}:00"
+        ohlc = ohlcv_map.get(ts_hhmm)
+        o, h, l, c, v = ohlc if ohlc is not None else (None,) * 5
+        if snapshot:
+            option_rows, total_call_oi, total_put_oi = parse_oi_snapshot(snapshot, symbol, timestamp_full, expiry)
+            current_pcr = chain_pcr(total_call_oi, total_put_oi)
+        elif ts_hhmm in stored:
+            # A carried-over minute (None) repeats the previous stored chain
+            option_rows = []
+            current_pcr = chain_pcr(*stored[ts_hhmm]) if stored[ts_hhmm] else prev_pcr
+        else:
+            if ohlc is not None and ts_hhmm not in market:
+                yield (timestamp_full, symbol, c, o, h, l, c, v, None, None), []
+            continue
+
+        pcr_change = (current_pcr - prev_pcr) if prev_pcr is not None and current_pcr is not None else 0
+        prev_pcr = current_pcr
+        if ts_hhmm not in market:
+            yield (timestamp_full, symbol, c, o, h, l, c, v, current_pcr, pcr_change), option_rows
+        elif option_rows:
+            yield None, option_rows
+
+def write_in_chunks(db, minutes, chunk_rows=CHUNK_ROWS):
+    """Batch + write stage: buffers whole minutes, flushing every ~chunk_rows rows. Returns (market rows, option rows)."""
+    market_buf, option_buf = [], []
+    written = [0, 0]
+
+    def flush():
+        if market_buf: db.save_market_rows(market_buf)
+        if option_buf: db.save_option_rows(option_buf)
+        written[0] += len(market_buf)
+        written[1] += len(option_buf)
+        market_buf.clear()
+        option_buf.clear()
+
+    for market_row, option_rows in minutes:
+        if market_row is not None:
+            market_buf.append(market_row)
+        option_buf.extend(option_rows)
+        if len(option_buf) >= chunk_rows or len(market_buf) >= chunk_rows:
+            flush()
+    flush()
+    return tuple(written)
+
 class Backfiller:
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", profiler=None):
         if not os.path.exists(config_path):
             print(f"Config file not found: {config_path}")
             sys.exit(1)
@@ -19,179 +97,146 @@ class Backfiller:
 
         self.tv = TVClient()
         self.tl = TrendlyneClient()
-        self.nse = NSEClient()
         db_name = self.config.get("db_name", "options_data.db")
         self.db = Database(db_name)
+        self.rollups = RollupManager(self.db, OptionDatabase(self.config.get("master_db_name", "sos_master_data.db")))
+        self.calendar = TradingCalendar.from_config(self.config)
+        self.chunk_rows = self.config.get("backfill_chunk_rows", CHUNK_ROWS)
+        # Replaces snapshot callClose/putClose with per-strike buildup premiums when enabled
+        self.buildup = None
+        if self.config.get("buildup_prices", False):
+            self.buildup = BuildupFetcher(self.tl, max_workers=self.config.get("buildup_workers", 8),
+                                          requests_per_second=self.config.get("trendlyne_requests_per_second", 5))
         self.symbols = self.config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"])
+        # One profiler cycle per symbol-day
+        self.profiler = profiler or Profiler("backfiller", install_signals=False)
         print(f"Using database: {os.path.abspath(db_name)}")
 
     def get_clean_symbol(self, symbol):
         return symbol.split('|')[-1] if '|' in symbol else symbol
 
-    def get_strike_gap(self, clean_symbol):
-        gaps = self.config.get("strike_gaps", {})
-        return gaps.get(clean_symbol, 100)
-
-    def backfill_date(self, date_str):
+    def backfill_date(self, date_str, symbols=None, slots=None, finalize=True):
+        """
+        symbols: subset of the configured symbols (default: all)
+        slots: 'HH:MM' minutes to fetch (default: the whole session, skipping symbols that look complete)
+        finalize: write the day's pcr_history afterwards (backfill_todo does it once per date instead)
+        """
         print(f"--- Starting Backfill for {date_str} ---")
+        day_slots = self.calendar.minute_slots(date_str)
+        if not day_slots:
+            print(f"{date_str} is not a trading day")
+            return
 
-        for symbol in self.symbols:
-            clean_symbol = self.get_clean_symbol(symbol)
+        for symbol in symbols or self.symbols:
+            with self.profiler.cycle(f"{symbol} {date_str}"):
+                self.backfill_symbol(symbol, date_str, day_slots, slots)
 
-            # Skip if already in DB for this date
-            with self.db._get_connection() as conn:
-                count = conn.execute("SELECT COUNT(*) FROM market_data WHERE symbol=? AND timestamp LIKE ?", (symbol, f"{date_str}%")).fetchone()[0]
-                if count >= 370: # Roughly full day
-                    print(f"\n[Skipping {symbol}] Already has {count} records for {date_str}")
-                    continue
+        if finalize:
+            self.rollups.finalize_day(date_str, self.symbols)
+        print(f"\n--- Backfill complete for {date_str} ---")
 
-            print(f"\n[Processing {symbol}]")
+    def backfill_symbol(self, symbol, date_str, day_slots, slots=None):
+        clean_symbol = self.get_clean_symbol(symbol)
 
-            # 1. Fetch OHLCV from TV
-            print(f"Fetching OHLCV for {clean_symbol} from TradingView...")
-            ohlcv_df = self.tv.get_ohlcv(clean_symbol, n_bars=5000)
+        # Skip if already in DB for this date
+        with self.db._get_connection() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM market_data WHERE symbol=? AND timestamp LIKE ?", (symbol, f"{date_str}%")).fetchone()[0]
+            if slots is None and count >= len(day_slots) - 6: # Roughly full day
+                print(f"\n[Skipping {symbol}] Already has {count} records for {date_str}")
+                return
 
-            if ohlcv_df is not None and not ohlcv_df.empty:
-                ohlcv_df = ohlcv_df[ohlcv_df.index.strftime('%Y-%m-%d') == date_str]
-                print(f"Bars after filtering for {date_str}: {len(ohlcv_df)}")
-            else:
-                print("No data returned from TradingView.")
-                continue
-
-            if ohlcv_df.empty:
-                print(f"No OHLCV data for {date_str}")
-                continue
-
-            # 2. Get Stock ID and Expiry
-            stock_id = self.tl.get_stock_id_for_symbol(clean_symbol)
-            if not stock_id:
-                print(f"Could not find stock ID for {clean_symbol}")
-                continue
-
-            expiries = self.tl.get_expiry_dates(stock_id)
-            current_expiry = None
-            for exp in expiries:
-                if exp >= date_str:
-                    current_expiry = exp
-                    break
-            if not current_expiry:
-                print(f"Could not determine expiry for {date_str}")
-                continue
-
-            print(f"Date: {date_str}, Expiry: {current_expiry}, Stock ID: {stock_id}")
-
-            # 3. Generate time slots (every minute)
-            start_dt = datetime.strptime(f"{date_str} 09:15", "%Y-%m-%d %H:%M")
-            end_dt = datetime.strptime(f"{date_str} 15:30", "%Y-%m-%d %H:%M")
-            time_slots = []
-            curr = start_dt
-            while curr <= end_dt:
-                time_slots.append(curr.strftime("%H:%M"))
-                curr += timedelta(minutes=1)
-
-            # 4. Fetch Snapshots and collect data
-            all_market_records = []
-            all_option_records = []
-
-            # Map OHLCV by time for easy lookup
-            ohlcv_map = {ts.strftime("%H:%M"): row for ts, row in ohlcv_df.iterrows()}
-
-            prev_pcr = None
-
-            for ts_hhmm in time_slots:
-                snapshot = self.tl.get_oi_snapshot(stock_id, current_expiry, ts_hhmm)
-
-                if snapshot:
-                    oi_data = snapshot.get('oiData', {})
-                    total_call_oi = 0
-                    total_put_oi = 0
-
-                    timestamp_full = f"{date_str} {ts_hhmm}:00"
-
-                    for strike_str, strike_data in oi_data.items():
-                        c_oi = float(strike_data.get('callOi', 0))
-                        p_oi = float(strike_data.get('putOi', 0))
-                        total_call_oi += c_oi
-                        total_put_oi += p_oi
-
-                        # Add option records
-                        all_option_records.append({
-                            'timestamp': timestamp_full,
-                            'symbol': symbol,
-                            'strike_price': float(strike_str),
-                            'expiry_date': current_expiry,
-                            'option_type': 'CE',
-                            'price': strike_data.get('callClose', 0),
-                            'oi': c_oi,
-                            'oi_change': float(strike_data.get('callOiChange', 0))
-                        })
-                        all_option_records.append({
-                            'timestamp': timestamp_full,
-                            'symbol': symbol,
-                            'strike_price': float(strike_str),
-                            'expiry_date': current_expiry,
-                            'option_type': 'PE',
-                            'price': strike_data.get('putClose', 0),
-                            'oi': p_oi,
-                            'oi_change': float(strike_data.get('putOiChange', 0))
-                        })
-
-                    current_pcr = round(total_put_oi / total_call_oi, 4) if total_call_oi > 0 else 1.0
-                    pcr_change = (current_pcr - prev_pcr) if prev_pcr is not None else 0
-                    prev_pcr = current_pcr
-
-                    # Match with OHLCV
-                    ohlc = ohlcv_map.get(ts_hhmm)
-                    market_record = {
-                        'timestamp': timestamp_full,
-                        'symbol': symbol,
-                        'spot_price': ohlc['close'] if ohlc is not None else None,
-                        'open': ohlc['open'] if ohlc is not None else None,
-                        'high': ohlc['high'] if ohlc is not None else None,
-                        'low': ohlc['low'] if ohlc is not None else None,
-                        'close': ohlc['close'] if ohlc is not None else None,
-                        'volume': ohlc['volume'] if ohlc is not None else None,
-                        'total_pcr': current_pcr,
-                        'pcr_change': pcr_change
-                    }
-                    all_market_records.append(market_record)
-                else:
-                    # If snapshot fails, still try to save OHLCV if available
-                    ohlc = ohlcv_map.get(ts_hhmm)
-                    if ohlc is not None:
-                        timestamp_full = f"{date_str} {ts_hhmm}:00"
-                        all_market_records.append({
-                            'timestamp': timestamp_full,
-                            'symbol': symbol,
-                            'spot_price': ohlc['close'],
-                            'open': ohlc['open'],
-                            'high': ohlc['high'],
-                            'low': ohlc['low'],
-                            'close': ohlc['close'],
-                            'volume': ohlc['volume'],
-                            'total_pcr': None,
-                            'pcr_change': None
-                        })
-
-                # Small delay to prevent hitting rate limits
-                time.sleep(0.05)
-
-            # 5. Bulk Save
-            if all_market_records:
-                print(f"Saving {len(all_market_records)} market data records...")
-                for record in all_market_records:
-                    self.db.save_market_data(record)
-
-            if all_option_records:
-                print(f"Saving {len(all_option_records)} option records...")
-                self.db.save_option_data(all_option_records)
+        print(f"\n[Processing {symbol}]")
 
-        print(f"\n--- Backfill complete for {date_str} ---")
+        # 1. Fetch OHLCV from TV
+        print(f"Fetching OHLCV for {clean_symbol} from TradingView...")
+        with self.profiler.step("ohlcv"):
+            ohlcv_df = self.tv.get_ohlcv(clean_symbol, n_bars=5000)
+
+        if ohlcv_df is not None and not ohlcv_df.empty:
+            ohlcv_df = ohlcv_df[ohlcv_df.index.strftime('%Y-%m-%d') == date_str]
+            print(f"Bars after filtering for {date_str}: {len(ohlcv_df)}")
+        else:
+            print("No data returned from TradingView.")
+            return
+
+        if ohlcv_df.empty:
+            print(f"No OHLCV data for {date_str}")
+            return
+
+        # 2. Get Stock ID and Expiry
+        stock_id = self.tl.get_stock_id_for_symbol(clean_symbol)
+        if not stock_id:
+            print(f"Could not find stock ID for {clean_symbol}")
+            return
+
+        current_expiry = self.tl.get_expiry_for_date(stock_id, date_str)
+        if not current_expiry:
+            # Expiries follow a fixed weekday (weekly or monthly per symbol); no need to ask the network.
+            # This is a guess: a shifted (holiday) or changed expiry fetches empty snapshots.
+            current_expiry = self.calendar.expiry_for(date_str, symbol=symbol)
+            print(f"Trendlyne has no expiry for {clean_symbol} on {date_str}; using calendar expiry {current_expiry}")
+        if not current_expiry:
+            print(f"Could not determine expiry for {date_str}")
+            return
+
+        print(f"Date: {date_str}, Expiry: {current_expiry}, Stock ID: {stock_id}")
+
+        # 3. Session minute slots from the calendar
+        time_slots = day_slots
+        if slots is not None:
+            wanted = set(slots)
+            time_slots = [t for t in time_slots if t in wanted]
+
+        # Minutes whose chain is already stored (collector, backfill_trendlyne.py) are not fetched
+        # again on a full-day run; health-driven runs refetch what they were given (stale minutes)
+        stored = self.db.option_minutes(symbol, date_str) if slots is None else {}
+        if stored:
+            print(f"{len(stored)} minutes already have option rows; fetching {len(set(time_slots) - set(stored))}")
+
+        # 4. Stream fetch -> parse -> batch -> write; memory stays at one chunk however wide the chain
+        minutes = iter_minute_rows(symbol, date_str, current_expiry,
+                                   iter_snapshots(self.tl, stock_id, current_expiry, time_slots, skip=stored),
+                                   ohlcv_by_minute(ohlcv_df), stored, self.db.market_minutes(symbol, date_str))
+        with self.profiler.step("snapshots"):
+            market_count, option_count = write_in_chunks(self.db, minutes, self.chunk_rows)
+        print(f"Saved {market_count} market data records and {option_count} option records")
+
+        if (option_count or stored) and self.buildup is not None:
+            with self.profiler.step("buildup"):
+                self.buildup.backfill_prices(self.db, symbol, date_str, current_expiry, clean_symbol)
+
+        with self.profiler.step("rollups"):
+            self.rollups.rebuild(date_str, date_str, [symbol])
+
+    def backfill_todo(self, todo):
+        """todo: HealthCheck.todo() entries ({'symbol', 'date', 'slots'}); only the listed minutes are fetched."""
+        dates = []
+        for task in todo:
+            print(f"\n[Health] {task['symbol']} {task['date']}: {len(task['slots'])} minutes to fill")
+            self.backfill_date(task['date'], symbols=[task['symbol']], slots=task['slots'], finalize=False)
+            if task['date'] not in dates:
+                dates.append(task['date'])
+        for date_str in dates:
+            self.rollups.finalize_day(date_str, self.symbols)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python backfiller.py YYYY-MM-DD")
+    parser = argparse.ArgumentParser(description="Backfill historical market and option data")
+    parser.add_argument('date', nargs='?', help='YYYY-MM-DD to backfill in full')
+    parser.add_argument('--from-health', nargs=2, metavar=('START', 'END'),
+                        help='Fill only the missing/stale minutes check_db.py reports for this date range')
+    parser.add_argument('--todo', help='Work list written by check_db.py --todo')
+    add_profiling_args(parser)
+    args = parser.parse_args()
+
+    if args.date:
+        Backfiller(profiler=profiler_from_args("backfiller", args)).backfill_date(args.date)
+    elif args.from_health:
+        from check_db import HealthCheck
+        bf = Backfiller(profiler=profiler_from_args("backfiller", args))
+        health = HealthCheck(bf.db, bf.calendar)
+        bf.backfill_todo(health.todo(args.from_health[0], args.from_health[1], bf.symbols))
+    elif args.todo:
+        with open(args.todo, "r") as f:
+            Backfiller(profiler=profiler_from_args("backfiller", args)).backfill_todo(json.load(f))
     else:
-        date = sys.argv[1]
-        bf = Backfiller()
-        bf.backfill_date(date)
+        parser.print_help()
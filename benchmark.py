@@ -0,0 +1,562 @@
+"""
+Micro-benchmarks for the collector's hot paths, run against synthetic data.
+Usage: python benchmark.py <name> [options]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+def synthetic_nse_chain(spot=24000.0, strike_gap=50, strikes_per_side=60, expiries=12):
+    """Builds an NSE option-chain payload shaped like /api/option-chain-indices."""
+    atm = round(spot / strike_gap) * strike_gap
+    expiry_dates = [f"{d:02d}-Jan-2030" for d in range(1, expiries + 1)]
+    data = []
+    for expiry in expiry_dates:
+        for i in range(-strikes_per_side, strikes_per_side + 1):
+            strike = atm + i * strike_gap
+            row = {'strikePrice': strike, 'expiryDate': expiry}
+            for opt_type in ('CE', 'PE'):
+                row[opt_type] = {
+                    'strikePrice': strike, 'expiryDate': expiry, 'underlying': 'NIFTY',
+                    'identifier': f"OPTIDXNIFTY{expiry}{opt_type}{strike}.00",
+                    'openInterest': random.randint(0, 200000), 'changeinOpenInterest': random.randint(-5000, 5000),
+                    'pchangeinOpenInterest': random.random(), 'totalTradedVolume': random.randint(0, 10 ** 6),
+                    'impliedVolatility': random.random() * 30, 'lastPrice': round(random.random() * 500, 2),
+                    'change': random.random(), 'pChange': random.random(),
+                    'totalBuyQuantity': random.randint(0, 10 ** 5), 'totalSellQuantity': random.randint(0, 10 ** 5),
+                    'bidQty': 75, 'bidprice': round(random.random() * 500, 2),
+                    'askQty': 75, 'askPrice': round(random.random() * 500, 2), 'underlyingValue': spot
+                }
+            data.append(row)
+    return {
+        'records': {'expiryDates': expiry_dates, 'data': data, 'timestamp': "01-Jan-2030 10:30:00",
+                    'underlyingValue': spot, 'strikePrices': sorted({r['strikePrice'] for r in data})},
+        'filtered': {'data': data[:2 * strikes_per_side + 1],
+                     'CE': {'totOI': 123456, 'totVol': 1}, 'PE': {'totOI': 234567, 'totVol': 1}}
+    }
+
+def measure(fn, repeat):
+    """Returns (cpu seconds per call, peak bytes allocated during one call, bytes still held by its result)."""
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    cpu = (time.process_time() - start) / repeat
+
+    tracemalloc.start()
+    result = fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return cpu, peak, retained
+
+def bench_decode(args):
+    from clients import load_json_backend, slim_option_chain
+
+    raw = json.dumps(synthetic_nse_chain(strikes_per_side=args.strikes, expiries=args.expiries)).encode()
+    print(f"Payload: {len(raw) / 1024:.0f} KB, repeat={args.repeat}")
+
+    # Every path decodes the whole payload; slim_option_chain only shrinks what the collector keeps
+    fast_loads = load_json_backend()
+    cases = [
+        ("json.loads", lambda: json.loads(raw)),
+        ("json.loads + slim", lambda: slim_option_chain(json.loads(raw), strike_gap=50)),
+    ]
+    if fast_loads is not json.loads:
+        cases.append((f"{fast_loads.__module__}.loads + slim", lambda: slim_option_chain(fast_loads(raw), strike_gap=50)))
+    else:
+        print("orjson/ujson not installed; the collector falls back to json.loads")
+    for name, fn in cases:
+        cpu, peak, retained = measure(fn, args.repeat)
+        print(f"{name:<24} cpu={cpu * 1000:8.2f} ms/payload  peak_alloc={peak / 1024:8.0f} KB  "
+              f"retained={retained / 1024:8.0f} KB")
+
+def legacy_save_snapshot(db_path, symbol, trading_date, timestamp, expiry, aggregates, details):
+    """The pre-pooling OptionDatabase.save_snapshot: reconnect, re-run DDL, one INSERT per strike."""
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("CREATE TABLE IF NOT EXISTS option_aggregates (symbol TEXT, date TEXT, timestamp TEXT, expiry TEXT, "
+                 "call_oi INTEGER, put_oi INTEGER, pcr REAL, PRIMARY KEY (symbol, date, timestamp))")
+    conn.execute("CREATE TABLE IF NOT EXISTS option_chain_details (symbol TEXT, date TEXT, timestamp TEXT, strike REAL, "
+                 "call_oi INTEGER, put_oi INTEGER, call_oi_chg INTEGER, put_oi_chg INTEGER, "
+                 "PRIMARY KEY (symbol, date, timestamp, strike))")
+    conn.execute("CREATE TABLE IF NOT EXISTS market_depth_history (timestamp INTEGER, symbol TEXT, rvol REAL, "
+                 "pcr REAL, adv_dec_ratio REAL, PRIMARY KEY (timestamp, symbol))")
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("INSERT OR REPLACE INTO option_aggregates VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (symbol, trading_date, timestamp, expiry, aggregates['call_oi'], aggregates['put_oi'], aggregates['pcr']))
+    for strike, d in details.items():
+        conn.execute("INSERT OR REPLACE INTO option_chain_details VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (symbol, trading_date, timestamp, float(strike),
+                      d['call_oi'], d['put_oi'], d['call_oi_chg'], d['put_oi_chg']))
+    conn.commit()
+    conn.close()
+
+def synthetic_trendlyne_day(symbols, strikes, minutes=376):
+    """Yields save_snapshot argument tuples for a full synthetic trading day."""
+    for symbol in symbols:
+        for minute in range(minutes):
+            ts = f"{9 + (15 + minute) // 60:02d}:{(15 + minute) % 60:02d}"
+            details = {str(24000 + 50 * i): {'call_oi': random.randint(0, 10 ** 6), 'put_oi': random.randint(0, 10 ** 6),
+                                             'call_oi_chg': random.randint(-10 ** 4, 10 ** 4),
+                                             'put_oi_chg': random.randint(-10 ** 4, 10 ** 4)}
+                       for i in range(strikes)}
+            aggregates = {'call_oi': 1, 'put_oi': 1, 'pcr': 1.0}
+            yield (symbol, "2030-01-01", ts, "2030-01-02", aggregates, details)
+
+def bench_snapshot_writes(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_writes_"))
+    from backfill_trendlyne import OptionDatabase
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    snapshots = list(synthetic_trendlyne_day(symbols, args.strikes))
+    rows = sum(1 + len(s[5]) for s in snapshots)
+    print(f"Synthetic day: {len(symbols)} symbols x 376 minutes x {args.strikes} strikes = {rows} rows")
+
+    start = time.perf_counter()
+    for snapshot in snapshots:
+        legacy_save_snapshot("legacy.db", *snapshot)
+    legacy = time.perf_counter() - start
+
+    db = OptionDatabase("bench_master.db")
+    start = time.perf_counter()
+    for snapshot in snapshots:
+        db.save_snapshot(*snapshot)
+    pooled = time.perf_counter() - start
+    db.close()
+
+    print(f"{'legacy (connect per call, row inserts)':<42} {legacy:7.2f}s  {rows / legacy:10.0f} rows/s")
+    print(f"{'pooled + executemany':<42} {pooled:7.2f}s  {rows / pooled:10.0f} rows/s  ({legacy / pooled:.1f}x)")
+
+def synthetic_option_day(symbol, strikes, minutes=376, day="2030-01-01", expiry="2030-01-02"):
+    """Random-walk premiums and OI for ATM+-strikes CE/PE, one option_data dict per series per minute."""
+    rows = []
+    for i in range(-strikes, strikes + 1):
+        for opt_type in ('CE', 'PE'):
+            price, oi = random.uniform(20, 400), random.randint(10 ** 4, 10 ** 6)
+            for minute in range(minutes):
+                change = random.randint(-2000, 2000)
+                price = max(0.05, round(price + random.gauss(0, 1.5), 2))
+                oi = max(0, oi + change)
+                rows.append({'timestamp': f"{day} {9 + (15 + minute) // 60:02d}:{(15 + minute) % 60:02d}:00",
+                             'symbol': symbol, 'strike_price': 24000.0 + 50 * i, 'expiry_date': expiry,
+                             'option_type': opt_type, 'price': price, 'oi': oi, 'oi_change': change})
+    return rows
+
+def bench_block_storage(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_blocks_"))
+    from database import Database
+    from block_store import BlockStore
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    days = {s: synthetic_option_day(s, args.strikes) for s in symbols}
+    rows = sum(len(d) for d in days.values())
+    print(f"Synthetic day: {len(symbols)} symbols x {2 * (2 * args.strikes + 1)} series x 376 minutes = {rows} rows")
+
+    db = Database("rows.db")
+    store = BlockStore("blocks.db")
+    for symbol, records in days.items():
+        db.save_option_data(records)
+        store.import_rows(db, symbol, "2030-01-01")
+    for path in ("rows.db", "blocks.db"):
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.close()
+    row_size, block_size = os.path.getsize("rows.db"), os.path.getsize("blocks.db")
+    print(f"{'option_data rows (with indexes)':<32} {row_size / 1024:9.0f} KB  {row_size / rows:6.1f} B/row")
+    print(f"{'option_blocks':<32} {block_size / 1024:9.0f} KB  {block_size / rows:6.1f} B/row"
+          f"  ({row_size / block_size:.1f}x smaller)")
+
+    def read_rows():
+        for symbol in symbols:
+            with db._get_connection() as conn:
+                conn.execute("SELECT timestamp, symbol, strike_price, expiry_date, option_type, price, oi, oi_change "
+                             "FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ? "
+                             "ORDER BY timestamp, strike_price, option_type",
+                             (symbol, "2030-01-01", "2030-01-02")).fetchall()
+
+    cases = [
+        ("SQL row read", read_rows),
+        ("blocks -> option_data tuples", lambda: [store.get_option_rows(s, "2030-01-01", "2030-01-02") for s in symbols]),
+        ("blocks -> NumPy columns", lambda: [store.get_day(s, "2030-01-01") for s in symbols]),
+    ]
+    for name, fn in cases:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fn()
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{name:<32} {elapsed * 1000:9.1f} ms/day  {rows / elapsed:12.0f} rows/s")
+
+class FakeBuildupClient:
+    """Stands in for TrendlyneClient.get_options_buildup: fixed latency, 5-minute bars shaped like body.data_v2."""
+    def __init__(self, latency, minutes=376):
+        self.latency = latency
+        self.minutes = minutes
+
+    def get_options_buildup(self, symbol, expiry_date, strike, option_type, interval=5):
+        time.sleep(self.latency)
+        bars = []
+        for m in range(interval, self.minutes, interval):
+            start, end = 9 * 60 + 15 + m - interval, 9 * 60 + 15 + m
+            bars.append({'interval': f"{start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}",
+                         'close_price': round(random.uniform(20, 400), 2), 'open_interest': random.randint(0, 10 ** 6)})
+        return {'head': {'status': '0'}, 'body': {'data_v2': bars}}
+
+def bench_buildup(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_buildup_"))
+    from database import Database
+    from buildup import BuildupFetcher
+
+    db = Database("rows.db")
+    db.save_option_data(synthetic_option_day("SYM", args.strikes, day="2030-01-01", expiry="2030-01-02"))
+    strikes = [24000.0 + 50 * i for i in range(-args.strikes, args.strikes + 1)]
+    client = FakeBuildupClient(args.latency)
+    print(f"{len(strikes)} strikes x CE/PE = {2 * len(strikes)} series, {args.latency * 1000:.0f} ms/request, "
+          f"budget {args.rps} req/s")
+
+    for workers in (1, args.workers):
+        fetcher = BuildupFetcher(client, max_workers=workers, requests_per_second=args.rps)
+        start = time.perf_counter()
+        bars = fetcher.fetch("SYM", "2030-01-01", "2030-01-02", strikes)
+        elapsed = time.perf_counter() - start
+        print(f"{f'fetch, {workers} worker(s)':<24} {elapsed:7.2f}s  {2 * len(strikes) / elapsed:6.1f} req/s  {len(bars)} bars")
+
+    fetcher.merge_prices(db, "SYM", "2030-01-01", "2030-01-02", bars)
+    print(f"{'merge':<24} {fetcher.stats['merge_seconds'] * 1000:7.1f} ms "
+          f"{fetcher.stats['merged'] / fetcher.stats['merge_seconds']:10.0f} rows/s")
+
+def synthetic_refresh_times(session_seconds=376 * 60, seed=7):
+    """
+    Seconds (from the open) at which a synthetic NSE chain publishes new data:
+    every ~20s through the first half hour, every 1-4 minutes midday, every ~30s into the close.
+    """
+    rng = random.Random(seed)
+    times, t = [], 0.0
+    while t < session_seconds:
+        times.append(t)
+        if t < 1800:
+            t += rng.uniform(15, 25)
+        elif t > session_seconds - 1800:
+            t += rng.uniform(25, 40)
+        else:
+            t += rng.uniform(60, 240)
+    return times
+
+def bench_polling(args):
+    import bisect
+    from polling import AdaptivePoller, snapshot_hash, snapshot_bytes
+
+    session_seconds = 376 * 60
+    refresh_times = synthetic_refresh_times(session_seconds)
+    options = synthetic_option_day("SYM", 7, minutes=1)
+    size = snapshot_bytes({'symbol': "SYM", 'spot_price': 24000.0}, options)
+    # Some refreshes only bump the timestamp; the stored content is unchanged
+    rng = random.Random(11)
+    content = []
+    for i in range(len(refresh_times)):
+        content.append(content[-1] if content and rng.random() < args.idle else i)
+    distinct = len(set(content))
+    print(f"Synthetic session: {len(refresh_times)} NSE refreshes, {distinct} with new content, ~{size} bytes/snapshot")
+
+    def version_at(t):
+        return bisect.bisect_right(refresh_times, t) - 1
+
+    def simulate(poller):
+        seen, t = set(), 0.0
+        while t < session_seconds:
+            v = version_at(t)
+            spot = 24000.0 + content[v] % 50
+            changed = poller.observe("SYM", t, f"v{v}", snapshot_hash({'spot_price': spot}, options[:1]) + str(content[v]),
+                                     spot, boost=t < 15 * 60, size=size)
+            if changed:
+                seen.add(content[v])
+            t = poller.state["SYM"]['due']
+        return poller.stats["SYM"], seen
+
+    fixed_fetches = session_seconds // 60
+    fixed_seen = {content[version_at(m * 60)] for m in range(fixed_fetches)}
+    print(f"{'fixed 60s':<10} fetches={fixed_fetches:4d} stored={fixed_fetches:4d} bytes={fixed_fetches * size:8d} "
+          f"content versions captured={len(fixed_seen)}/{distinct}")
+
+    stats, seen = simulate(AdaptivePoller(min_interval=args.min_interval, max_interval=args.max_interval))
+    print(f"{'adaptive':<10} fetches={stats['fetches']:4d} stored={stats['stored']:4d} bytes={stats['bytes_stored']:8d} "
+          f"content versions captured={len(seen)}/{distinct} (skipped {stats['skipped']} unchanged)")
+
+class FakeSnapshotClient:
+    """Stands in for TrendlyneClient.get_oi_snapshot: an oiData chain of `strikes` strikes per call."""
+    def __init__(self, strikes):
+        self.strikes = strikes
+        self.calls = 0
+
+    def get_oi_snapshot(self, stock_id, expiry_date, timestamp_hhmm, min_time="09:15"):
+        self.calls += 1
+        return {'oiData': {str(20000 + 50 * i): {
+            'callOi': random.randint(0, 10 ** 6), 'putOi': random.randint(0, 10 ** 6),
+            'callOiChange': random.randint(-10 ** 4, 10 ** 4), 'putOiChange': random.randint(-10 ** 4, 10 ** 4),
+            'callClose': round(random.uniform(1, 500), 2), 'putClose': round(random.uniform(1, 500), 2)}
+            for i in range(self.strikes)}}
+
+def legacy_backfill_rows(tl, symbol, date_str, slots):
+    """The pre-pipeline Backfiller shape: every option record of the day held as a dict until the end."""
+    all_option_records = []
+    for ts_hhmm in slots:
+        for strike_str, d in tl.get_oi_snapshot(1, "2030-01-02", ts_hhmm)['oiData'].items():
+            for opt_type, prefix in (('CE', 'call'), ('PE', 'put')):
+                all_option_records.append({'timestamp': f"{date_str} {ts_hhmm}:00", 'symbol': symbol,
+                                           'strike_price': float(strike_str), 'expiry_date': "2030-01-02",
+                                           'option_type': opt_type, 'price': d[f'{prefix}Close'],
+                                           'oi': float(d[f'{prefix}Oi']), 'oi_change': float(d[f'{prefix}OiChange'])})
+    return all_option_records
+
+def bench_backfill_memory(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_backfill_"))
+    import pandas as pd
+    from database import Database
+    from trading_calendar import slot_strings
+    from backfiller import iter_snapshots, iter_minute_rows, write_in_chunks, ohlcv_by_minute
+
+    slots = slot_strings("09:15", "15:30")
+    db = Database("backfill.db")
+
+    def pipeline(strikes, days):
+        tl = FakeSnapshotClient(strikes)
+        for day in range(days):
+            date_str = f"2030-01-{day + 1:02d}"
+            index = pd.to_datetime([f"{date_str} {s}" for s in slots])
+            ohlcv = pd.DataFrame({c: [1.0] * len(slots) for c in ('open', 'high', 'low', 'close', 'volume')}, index=index)
+            minutes = iter_minute_rows("SYM", date_str, "2030-01-31", iter_snapshots(tl, 1, "2030-01-31", slots, delay=0),
+                                       ohlcv_by_minute(ohlcv))
+            write_in_chunks(db, minutes, args.chunk_rows)
+
+    def peak_of(fn):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak / 2 ** 20, elapsed
+
+    failed = False
+    for strikes, days in ((args.strikes // 4, 1), (args.strikes, 1), (args.strikes, args.days)):
+        peak, elapsed = peak_of(lambda: pipeline(strikes, days))
+        rows = 376 * 2 * strikes * days
+        ok = peak <= args.max_peak_mb
+        failed |= not ok
+        print(f"pipeline  {strikes:4d} strikes x {days} day(s) {rows:9d} rows  peak {peak:7.1f} MB  "
+              f"{rows / elapsed:8.0f} rows/s  {'OK' if ok else 'OVER CEILING'}")
+
+    peak, _ = peak_of(lambda: legacy_backfill_rows(FakeSnapshotClient(args.strikes), "SYM", "2030-01-01", slots))
+    print(f"legacy    {args.strikes:4d} strikes x 1 day(s) {376 * 2 * args.strikes:9d} rows  peak {peak:7.1f} MB  (records only, before saving)")
+    print(f"Ceiling {args.max_peak_mb} MB: {'FAILED' if failed else 'passed'}")
+    if failed:
+        raise SystemExit(1)
+
+def bench_dual_ingest(args):
+    """backfill_trendlyne.py then backfiller.py on the same day: two stores (legacy) vs one ingestion stage."""
+    base = tempfile.mkdtemp(prefix="bench_ingest_")
+    import pandas as pd
+    from database import Database, OptionDatabase
+    from trading_calendar import slot_strings
+    from backfiller import iter_snapshots, iter_minute_rows, write_in_chunks, ohlcv_by_minute
+    from trendlyne_ingest import SnapshotIngestor
+
+    slots = slot_strings("09:15", "15:30")
+    date_str, expiry, symbol = "2030-01-01", "2030-01-02", "NSE|INDEX|NIFTY"
+    index = pd.to_datetime([f"{date_str} {s}" for s in slots])
+    ohlcv_map = ohlcv_by_minute(pd.DataFrame({c: [1.0] * len(slots) for c in ('open', 'high', 'low', 'close', 'volume')},
+                                             index=index))
+
+    def backfiller_run(db, tl, stored):
+        minutes = iter_minute_rows(symbol, date_str, expiry, iter_snapshots(tl, 1, expiry, slots, delay=0, skip=stored),
+                                   ohlcv_map, stored, db.market_minutes(symbol, date_str))
+        write_in_chunks(db, minutes)
+
+    def legacy(tl):
+        # The old backfill_trendlyne.py: per-strike OI without prices into the monthly DB
+        option_db = OptionDatabase("sos_master_data.db")
+        for ts in slots:
+            body = tl.get_oi_snapshot(1, expiry, ts)
+            details = {k: {'call_oi': int(d['callOi']), 'put_oi': int(d['putOi']), 'call_oi_chg': int(d['callOiChange']),
+                           'put_oi_chg': int(d['putOiChange'])} for k, d in body['oiData'].items()}
+            call_oi = sum(d['call_oi'] for d in details.values())
+            put_oi = sum(d['put_oi'] for d in details.values())
+            option_db.save_snapshot("NIFTY", date_str, ts, expiry,
+                                    {'call_oi': call_oi, 'put_oi': put_oi, 'pcr': round(put_oi / call_oi, 2)}, details)
+        option_db.close()
+        backfiller_run(Database("options_data.db"), tl, {})
+
+    def unified(tl):
+        db = Database("options_data.db")
+        ingestor = SnapshotIngestor(db, tl)
+        stored = ingestor.stored_slots(symbol, date_str)
+        for ts in slots:
+            ingestor.ingest(symbol, 1, expiry, ts, date_str, stored)
+        backfiller_run(db, tl, db.option_minutes(symbol, date_str))
+        with db._get_connection() as conn:
+            details = conn.execute("SELECT COUNT(*) FROM option_chain_details WHERE symbol=?", (symbol,)).fetchone()[0]
+        print(f"option_chain_details view: {details} rows ({len(slots)} minutes x {args.strikes} strikes)")
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("unified", unified)):
+        os.mkdir(os.path.join(base, name))
+        os.chdir(os.path.join(base, name))
+        tl = FakeSnapshotClient(args.strikes)
+        start = time.perf_counter()
+        fn(tl)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(f) for f in os.listdir(".") if os.path.isfile(f))
+        results[name] = (tl.calls, size)
+        print(f"{name:<8} fetches={tl.calls:4d}  disk={size / 2 ** 20:6.2f} MB  ({elapsed:.1f}s)")
+
+    (legacy_calls, legacy_size), (calls, size) = results["legacy"], results["unified"]
+    print(f"unified/legacy: fetches {calls / legacy_calls:.2f}x, disk {size / legacy_size:.2f}x")
+
+class FakeTrendlyneHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Trendlyne API: contract search, expiry list and live-oi-data after `latency` seconds."""
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    strikes = 40
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith("/search-contract-stock/"):
+            code = query['query'][0].upper()
+            body = {'data': [{'stock_id': zlib.crc32(code.encode()) % 10 ** 6, 'stock_code': code}]}
+        elif url.path.endswith("/fno/get-expiry-dates/"):
+            body = {'expiryDates': ["2099-12-31"]}
+        elif url.path.endswith("/live-oi-data/"):
+            time.sleep(self.latency)
+            body = FakeSnapshotClient(self.strikes).get_oi_snapshot(None, None, query['maxTime'][0])
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps({'head': {'status': '0'}, 'body': body}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def bench_live_snapshots(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_live_"))
+    import asyncio
+    from datetime import date
+    from clients import TrendlyneClient
+    from database import Database
+    from trading_calendar import slot_strings
+    from trendlyne_ingest import SnapshotIngestor, canonical_symbol
+    from backfill_trendlyne import LiveSnapshotService
+
+    FakeTrendlyneHandler.latency = args.latency
+    FakeTrendlyneHandler.strikes = args.strikes
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTrendlyneHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tl = TrendlyneClient(base_url=f"http://127.0.0.1:{server.server_address[1]}", pool_size=args.concurrency)
+
+    date_str = date.today().strftime("%Y-%m-%d")
+    slots = slot_strings("09:15", "15:30")[:args.minutes]
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    # Contracts resolved up front so both runs time only the snapshots
+    contracts = {}
+    for symbol in symbols:
+        stock_id = tl.get_stock_id_for_symbol(symbol)
+        contracts[symbol] = (stock_id, tl.get_expiry_for_date(stock_id, date_str))
+    print(f"Fake Trendlyne at {tl.base_url}: {len(symbols)} symbols x {len(slots)} minutes, "
+          f"{args.strikes} strikes, {args.latency * 1000:.0f} ms per snapshot")
+
+    # The previous run_backfill shape: one symbol, one minute, one write at a time
+    ingestor = SnapshotIngestor(Database("sequential.db"), tl)
+    start = time.perf_counter()
+    for symbol in symbols:
+        for ts in slots:
+            ingestor.ingest(canonical_symbol(symbol), *contracts[symbol], ts, date_str, stored=set())
+    sequential = time.perf_counter() - start
+
+    service = LiveSnapshotService(symbols, db=Database("concurrent.db"), tl=tl, max_concurrency=args.concurrency)
+    start = time.perf_counter()
+    asyncio.run(service.backfill(slots, date_str))
+    concurrent = time.perf_counter() - start
+    service.close()
+    server.shutdown()
+
+    service.report()
+    print(f"{'sequential':<11} {sequential / len(slots):6.2f} s per minute ({ingestor.stats['fetched']} fetches)")
+    print(f"{'concurrent':<11} {concurrent / len(slots):6.2f} s per minute "
+          f"({sum(st['ok'] for st in service.stats.values())} fetches, {sequential / concurrent:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Collector micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("decode", help="NSE option-chain decode per JSON backend, and what slimming to the ATM window keeps")
+    p.add_argument('--strikes', type=int, default=60, help='Strikes on each side of ATM per expiry')
+    p.add_argument('--expiries', type=int, default=12)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("snapshot-writes", help="OptionDatabase.save_snapshot throughput on a synthetic full day")
+    p.add_argument('--symbols', type=int, default=5)
+    p.add_argument('--strikes', type=int, default=60)
+    p.set_defaults(func=bench_snapshot_writes)
+
+    p = sub.add_parser("block-storage", help="option_data rows vs delta-encoded blocks: size and full-day decode")
+    p.add_argument('--symbols', type=int, default=2)
+    p.add_argument('--strikes', type=int, default=7, help='Strikes on each side of ATM')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_block_storage)
+
+    p = sub.add_parser("buildup", help="Concurrent buildup fetch (simulated latency) and as-of price merge")
+    p.add_argument('--strikes', type=int, default=7, help='Strikes on each side of ATM')
+    p.add_argument('--latency', type=float, default=0.3, help='Simulated seconds per request')
+    p.add_argument('--rps', type=float, default=5, help='Request budget (requests per second)')
+    p.add_argument('--workers', type=int, default=8)
+    p.set_defaults(func=bench_buildup)
+
+    p = sub.add_parser("polling", help="Fixed 60s vs adaptive polling on a simulated NSE refresh pattern")
+    p.add_argument('--idle', type=float, default=0.3, help='Share of NSE refreshes whose content is unchanged')
+    p.add_argument('--min-interval', type=float, default=15)
+    p.add_argument('--max-interval', type=float, default=120)
+    p.set_defaults(func=bench_polling)
+
+    p = sub.add_parser("backfill-memory", help="Backfill pipeline peak memory vs chain width and days; fails over --max-peak-mb")
+    p.add_argument('--strikes', type=int, default=200, help='Strikes in each synthetic oiData chain')
+    p.add_argument('--days', type=int, default=3)
+    p.add_argument('--chunk-rows', type=int, default=5000)
+    p.add_argument('--max-peak-mb', type=float, default=16)
+    p.set_defaults(func=bench_backfill_memory)
+
+    p = sub.add_parser("dual-ingest", help="backfill_trendlyne + backfiller on one day: fetches and disk, legacy vs unified")
+    p.add_argument('--strikes', type=int, default=40, help='Strikes in each synthetic oiData chain')
+    p.set_defaults(func=bench_dual_ingest)
+
+    p = sub.add_parser("live-snapshots", help="Sequential vs concurrent Trendlyne snapshots against a local fake server")
+    p.add_argument('--symbols', type=int, default=20)
+    p.add_argument('--minutes', type=int, default=3)
+    p.add_argument('--strikes', type=int, default=40)
+    p.add_argument('--latency', type=float, default=0.2, help='Simulated server seconds per snapshot')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.set_defaults(func=bench_live_snapshots)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
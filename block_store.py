@@ -0,0 +1,226 @@
+"""
+Block storage for option time series. Each (symbol, day, expiry, strike, type)
+series is one row holding a compressed, delta-encoded block of timestamps,
+prices and OI, instead of one row per minute.
+
+Blocks are an archive format: finished days are packed from option_data with
+`python block_store.py pack START END`. The collectors, rollups and readers
+keep working on option_data.
+"""
+import json
+import argparse
+import sqlite3
+import struct
+import threading
+import zlib
+import numpy as np
+from datetime import datetime, timedelta
+
+MAGIC = b"OB1"
+PRICE_SCALE = 100  # premiums are stored in paise
+MISSING = np.iinfo(np.int64).min
+DTYPES = (np.int8, np.int16, np.int32, np.int64)
+FIELDS = ('seconds', 'price', 'oi', 'oi_change')
+
+def _to_int(values, scale=1):
+    """Scaled int64 column; None and NaN become MISSING."""
+    arr = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(arr)
+    out = np.round(np.where(missing, 0, arr) * scale).astype(np.int64)
+    out[missing] = MISSING
+    return out
+
+def encode_block(seconds, price, oi, oi_change):
+    """
+    seconds: seconds since midnight; price/oi/oi_change: numbers or None.
+    Each column is delta-encoded, packed into the narrowest integer type that
+    holds its deltas, and the whole block is zlib-compressed.
+    """
+    columns = (np.asarray(seconds, dtype=np.int64), _to_int(price, PRICE_SCALE), _to_int(oi), _to_int(oi_change))
+    parts = [MAGIC, struct.pack("<I", len(columns[0]))]
+    for col in columns:
+        # Missing values would blow up every delta around them; keep them in a separate mask
+        missing = col == MISSING
+        filled = np.where(missing, 0, col)
+        deltas = np.diff(filled, prepend=0)
+        lo, hi = (int(deltas.min()), int(deltas.max())) if len(deltas) else (0, 0)
+        code = next(i for i, dt in enumerate(DTYPES) if np.iinfo(dt).min <= lo and hi <= np.iinfo(dt).max)
+        has_missing = bool(missing.any())
+        parts.append(struct.pack("<BB", code, has_missing))
+        parts.append(deltas.astype(DTYPES[code]).tobytes())
+        if has_missing:
+            parts.append(np.packbits(missing).tobytes())
+    return zlib.compress(b"".join(parts), 6)
+
+def decode_block(blob):
+    """Returns {'seconds': int64[], 'price': float64[], 'oi': float64[], 'oi_change': float64[]} (NaN where missing)."""
+    raw = zlib.decompress(blob)
+    if raw[:3] != MAGIC:
+        raise ValueError("Not an option block")
+    n = struct.unpack_from("<I", raw, 3)[0]
+    offset = 7
+    out = {}
+    for field in FIELDS:
+        code, has_missing = struct.unpack_from("<BB", raw, offset)
+        offset += 2
+        dtype = DTYPES[code]
+        deltas = np.frombuffer(raw, dtype=dtype, count=n, offset=offset)
+        offset += n * np.dtype(dtype).itemsize
+        values = np.cumsum(deltas, dtype=np.int64)
+        if field == 'seconds':
+            out[field] = values
+            continue
+        values = values.astype(np.float64)
+        if has_missing:
+            mask_len = (n + 7) // 8
+            missing = np.unpackbits(np.frombuffer(raw, dtype=np.uint8, count=mask_len, offset=offset))[:n].astype(bool)
+            offset += mask_len
+            values[missing] = np.nan
+        out[field] = values / PRICE_SCALE if field == 'price' else values
+    return out
+
+def _seconds(timestamp):
+    return int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19] or 0)
+
+def _timestamp(day, seconds):
+    return f"{day} {seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class BlockStore:
+    """
+    Stores option_data-shaped rows as one delta-encoded block per series.
+    import_rows() packs a stored day; get_option_rows() returns tuples in
+    option_data column order and get_day() flat NumPy columns.
+    """
+    def __init__(self, db_name="options_blocks.db"):
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_name, timeout=10)
+
+    def _create_tables(self):
+        with self._get_connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS option_blocks (
+                    symbol TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    expiry_date TEXT NOT NULL,
+                    strike_price REAL NOT NULL,
+                    option_type TEXT NOT NULL,
+                    points INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (symbol, day, expiry_date, strike_price, option_type)
+                )
+            ''')
+            conn.commit()
+
+    def append(self, option_records):
+        """
+        option_records: option_data dicts (as passed to Database.save_option_data).
+        Points are merged into their series; a repeated timestamp replaces the old point.
+        """
+        series = {}
+        for r in option_records:
+            key = (r['symbol'], r['timestamp'][:10], r['expiry_date'], float(r['strike_price']), r['option_type'])
+            series.setdefault(key, {})[_seconds(r['timestamp'])] = (r.get('price'), r.get('oi'), r.get('oi_change'))
+
+        with self._lock, self._get_connection() as conn:
+            for key, points in series.items():
+                seconds = np.fromiter(points, dtype=np.int64, count=len(points))
+                values = np.array(list(points.values()), dtype=np.float64).reshape(len(points), 3)
+                row = conn.execute('''SELECT data FROM option_blocks WHERE symbol=? AND day=? AND expiry_date=?
+                                      AND strike_price=? AND option_type=?''', key).fetchone()
+                if row:
+                    # New points go last so np.unique below keeps them over the stored ones
+                    existing = decode_block(row[0])
+                    seconds = np.concatenate([existing['seconds'], seconds])
+                    values = np.concatenate([np.column_stack([existing['price'], existing['oi'], existing['oi_change']]),
+                                             values])
+                # Last occurrence of each second, in time order
+                _, last = np.unique(seconds[::-1], return_index=True)
+                keep = len(seconds) - 1 - last
+                blob = encode_block(seconds[keep], values[keep, 0], values[keep, 1], values[keep, 2])
+                conn.execute("INSERT OR REPLACE INTO option_blocks VALUES (?, ?, ?, ?, ?, ?, ?)", key + (len(keep), blob))
+            conn.commit()
+
+    def get_series(self, symbol, day, expiry_date, strike_price, option_type):
+        with self._get_connection() as conn:
+            row = conn.execute('''SELECT data FROM option_blocks WHERE symbol=? AND day=? AND expiry_date=?
+                                  AND strike_price=? AND option_type=?''',
+                               (symbol, day, expiry_date, float(strike_price), option_type)).fetchone()
+        return decode_block(row[0]) if row else None
+
+    def get_option_rows(self, symbol, start, end):
+        """
+        Rows for symbol with start <= timestamp < end, as
+        (timestamp, symbol, strike_price, expiry_date, option_type, price, oi, oi_change)
+        ordered like option_data reads (timestamp, strike, type). Missing values are None.
+        """
+        with self._get_connection() as conn:
+            blocks = conn.execute('''SELECT day, expiry_date, strike_price, option_type, data FROM option_blocks
+                                     WHERE symbol=? AND day >= ? AND day <= ?''', (symbol, start[:10], end[:10])).fetchall()
+        rows = []
+        for day, expiry_date, strike_price, option_type, blob in blocks:
+            d = decode_block(blob)
+            for s, price, oi, oi_change in zip(d['seconds'].tolist(), d['price'].tolist(), d['oi'].tolist(), d['oi_change'].tolist()):
+                ts = _timestamp(day, s)
+                if start <= ts < end:
+                    rows.append((ts, symbol, strike_price, expiry_date, option_type,
+                                 None if price != price else price, None if oi != oi else oi,
+                                 None if oi_change != oi_change else oi_change))
+        rows.sort(key=lambda r: (r[0], r[2], r[4]))
+        return rows
+
+    def get_day(self, symbol, day, expiry_date=None):
+        """
+        Every series of symbol on day, decoded into flat NumPy columns:
+        seconds, strike_price, option_type ('CE'/'PE'), price, oi, oi_change.
+        """
+        query = "SELECT strike_price, option_type, data FROM option_blocks WHERE symbol=? AND day=?"
+        params = [symbol, day]
+        if expiry_date is not None:
+            query += " AND expiry_date=?"
+            params.append(expiry_date)
+        with self._get_connection() as conn:
+            blocks = conn.execute(query, params).fetchall()
+
+        decoded = [(strike, opt_type, decode_block(blob)) for strike, opt_type, blob in blocks]
+        if not decoded:
+            return {f: np.array([]) for f in ('seconds', 'strike_price', 'option_type', 'price', 'oi', 'oi_change')}
+        out = {f: np.concatenate([d[f] for _, _, d in decoded]) for f in FIELDS}
+        out['strike_price'] = np.concatenate([np.full(len(d['seconds']), strike) for strike, _, d in decoded])
+        out['option_type'] = np.concatenate([np.full(len(d['seconds']), opt_type) for _, opt_type, d in decoded])
+        return out
+
+    def import_rows(self, db, symbol, day):
+        """Packs one symbol-day of a Database's option_data rows into blocks."""
+        with db._get_connection() as conn:
+            cursor = conn.execute('''SELECT timestamp, symbol, strike_price, expiry_date, option_type, price, oi, oi_change
+                                     FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?''',
+                                  (symbol, day, (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")))
+            columns = [c[0] for c in cursor.description]
+            records = [dict(zip(columns, r)) for r in cursor]
+        self.append(records)
+        return len(records)
+
+if __name__ == "__main__":
+    from database import Database
+    from trading_calendar import TradingCalendar
+
+    parser = argparse.ArgumentParser(description="Pack stored option_data days into compressed blocks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="Pack START..END (YYYY-MM-DD) into block_db_name")
+    pack.add_argument('start')
+    pack.add_argument('end')
+    pack.add_argument('--symbol', action='append', help='Symbol (repeatable; default: config symbols)')
+    pack.add_argument('--config', default="config.json")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    db = Database(config.get("db_name", "options_data.db"))
+    store = BlockStore(config.get("block_db_name", "options_blocks.db"))
+    for day in TradingCalendar.from_config(config).trading_days(args.start, args.end).astype(str):
+        for symbol in args.symbol or config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"]):
+            print(f"[Blocks] {symbol} {day}: {store.import_rows(db, symbol, day)} rows packed")
@@ -0,0 +1,168 @@
+"""
+Per-strike premium history from Trendlyne's buildup endpoint. All strikes of
+a symbol-day are fetched concurrently for both option types within a request
+budget, and the 5-minute close prices are merged into option_data.price.
+Usage: python buildup.py YYYY-MM-DD [--symbol NSE|INDEX|NIFTY]
+"""
+import re
+import json
+import time
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from clients import TrendlyneClient, RateLimiter
+
+OPTION_TYPES = {'CE': 'call', 'PE': 'put'}
+TIME_PATTERN = re.compile(r"(\d{1,2}):(\d{2})")
+# Payload shapes already reported as unparseable, so a changed API is logged once, not per strike
+_UNPARSED_SHAPES = set()
+
+def _warn_unparsed(what, keys):
+    shape = (what, tuple(sorted(keys)))
+    if shape in _UNPARSED_SHAPES: return
+    _UNPARSED_SHAPES.add(shape)
+    print(f"[Buildup] WARNING: non-empty payload gave no bars ({what}: {', '.join(shape[1]) or 'none'}); "
+          f"the buildup format may have changed")
+
+def parse_buildup(payload, date_str):
+    """
+    Buildup payload -> DataFrame[timestamp, price, oi], one row per bar, stamped
+    at the bar's close. Rows are read from body.data_v2 (or body.data); the bar
+    time is the last HH:MM in its 'interval'/'time' field, e.g. '09:15 - 09:20'.
+    A non-empty payload that yields no bars is logged (once per payload shape).
+    """
+    body = payload.get('body', payload) if isinstance(payload, dict) else {}
+    if not isinstance(body, dict): body = {}
+    rows = body.get('data_v2') or body.get('data') or []
+    bars = []
+    for row in rows:
+        if not isinstance(row, dict): continue
+        times = TIME_PATTERN.findall(str(row.get('interval') or row.get('time') or row.get('timestamp') or ""))
+        price = next((row[k] for k in ('close_price', 'close', 'ltp', 'price') if row.get(k) is not None), None)
+        if not times or price is None: continue
+        hour, minute = times[-1]
+        bars.append((f"{date_str} {int(hour):02d}:{minute}:00", float(price),
+                     next((float(row[k]) for k in ('open_interest', 'oi') if row.get(k) is not None), None)))
+    if not bars:
+        if rows:
+            first = next((row for row in rows if isinstance(row, dict)), {})
+            _warn_unparsed("row keys", first.keys())
+        elif body:
+            _warn_unparsed("body keys", body.keys())
+    df = pd.DataFrame(bars, columns=['timestamp', 'price', 'oi'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+class BuildupFetcher:
+    """
+    Fetches buildup series for many (strike, type) pairs on a thread pool. Every
+    request first takes a slot from rate_limiter, so the pool never exceeds the budget.
+    """
+    def __init__(self, tl=None, max_workers=8, requests_per_second=5, rate_limiter=None, interval=5):
+        self.tl = tl or TrendlyneClient()
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter(1.0 / requests_per_second)
+        self.interval = interval
+        self.stats = {'requests': 0, 'failed': 0, 'fetch_seconds': 0.0, 'merged': 0, 'merge_seconds': 0.0}
+
+    def _fetch_one(self, clean_symbol, expiry_date, strike, option_type):
+        self.rate_limiter.wait()
+        return self.tl.get_options_buildup(clean_symbol, expiry_date, int(strike) if float(strike).is_integer() else strike,
+                                           OPTION_TYPES[option_type], interval=self.interval)
+
+    def fetch(self, clean_symbol, date_str, expiry_date, strikes):
+        """Buildup bars for every strike x CE/PE as DataFrame[timestamp, strike_price, option_type, price, oi]."""
+        tasks = [(float(strike), option_type) for strike in strikes for option_type in OPTION_TYPES]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="buildup") as pool:
+            payloads = list(pool.map(lambda t: self._fetch_one(clean_symbol, expiry_date, *t), tasks))
+        self.stats['fetch_seconds'] += time.perf_counter() - start
+        self.stats['requests'] += len(tasks)
+
+        frames = []
+        for (strike, option_type), payload in zip(tasks, payloads):
+            bars = parse_buildup(payload, date_str) if payload else None
+            if bars is None or bars.empty:
+                self.stats['failed'] += 1
+                continue
+            frames.append(bars.assign(strike_price=strike, option_type=option_type))
+        if not frames:
+            return pd.DataFrame(columns=['timestamp', 'strike_price', 'option_type', 'price', 'oi'])
+        return pd.concat(frames, ignore_index=True)[['timestamp', 'strike_price', 'option_type', 'price', 'oi']]
+
+    def merge_prices(self, db, symbol, date_str, expiry_date, bars):
+        """
+        Sets option_data.price for symbol's rows on date_str to the close of the
+        latest buildup bar at or before each row (no look-ahead), in one as-of
+        join. Rows before the first bar keep their snapshot price. minute_coverage
+        price totals (and the block store, if any) follow. Returns rows updated.
+        """
+        next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with db._get_connection() as conn:
+            rows = pd.read_sql_query(
+                "SELECT id, timestamp, strike_price, option_type, price, oi, oi_change FROM option_data "
+                "WHERE symbol=? AND expiry_date=? AND timestamp >= ? AND timestamp < ?",
+                conn, params=(symbol, expiry_date, date_str, next_day))
+            if rows.empty or bars.empty:
+                return 0
+
+            start = time.perf_counter()
+            rows['timestamp'] = pd.to_datetime(rows['timestamp'])
+            merged = pd.merge_asof(rows.sort_values('timestamp'),
+                                   bars[['timestamp', 'strike_price', 'option_type', 'price']]
+                                   .rename(columns={'price': 'bar_price'}).sort_values('timestamp'),
+                                   on='timestamp', by=['strike_price', 'option_type'], direction='backward')
+            changed = merged[merged['bar_price'].notna() & (merged['bar_price'] != merged['price'])]
+            conn.executemany("UPDATE option_data SET price=? WHERE id=?",
+                             zip(changed['bar_price'].tolist(), changed['id'].tolist()))
+            if len(changed):
+                db.refresh_price_totals(conn, symbol, date_str)
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        self.stats['merged'] += len(rows)
+        self.stats['merge_seconds'] += elapsed
+        print(f"[Buildup] {symbol} {date_str}: {len(changed)}/{len(rows)} prices updated from {len(bars)} bars, "
+              f"merge {elapsed * 1000:.1f} ms ({len(rows) / elapsed if elapsed else 0:.0f} rows/s)")
+        return len(changed)
+
+    def backfill_prices(self, db, symbol, date_str, expiry_date, clean_symbol=None):
+        """Fetches buildup for every strike symbol has on date_str and merges it into option_data."""
+        clean_symbol = clean_symbol or symbol.split('|')[-1]
+        next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with db._get_connection() as conn:
+            strikes = [r[0] for r in conn.execute(
+                "SELECT DISTINCT strike_price FROM option_data WHERE symbol=? AND expiry_date=? AND timestamp >= ? AND timestamp < ?",
+                (symbol, expiry_date, date_str, next_day))]
+        if not strikes:
+            return 0
+        requests_before, fetch_before = self.stats['requests'], self.stats['fetch_seconds']
+        bars = self.fetch(clean_symbol, date_str, expiry_date, strikes)
+        print(f"[Buildup] {clean_symbol} {date_str}: {self.stats['requests'] - requests_before} series in "
+              f"{self.stats['fetch_seconds'] - fetch_before:.1f}s, {len(bars)} bars")
+        return self.merge_prices(db, symbol, date_str, expiry_date, bars)
+
+if __name__ == "__main__":
+    from database import Database, OptionDatabase
+    from rollups import RollupManager
+
+    parser = argparse.ArgumentParser(description="Merge Trendlyne buildup premiums into option_data")
+    parser.add_argument('date', help='YYYY-MM-DD')
+    parser.add_argument('--symbol', action='append', help='Symbol (repeatable; default: config symbols)')
+    parser.add_argument('--config', default="config.json")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    db = Database(config.get("db_name", "options_data.db"))
+    rollups = RollupManager(db, OptionDatabase(config.get("master_db_name", "sos_master_data.db")))
+    fetcher = BuildupFetcher(max_workers=config.get("buildup_workers", 8),
+                             requests_per_second=config.get("trendlyne_requests_per_second", 5))
+    for symbol in args.symbol or config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"]):
+        stock_id = fetcher.tl.get_stock_id_for_symbol(symbol.split('|')[-1])
+        expiry = fetcher.tl.get_expiry_for_date(stock_id, args.date) if stock_id else None
+        if not expiry:
+            print(f"[SKIP] No expiry for {symbol} on {args.date}")
+            continue
+        if fetcher.backfill_prices(db, symbol, args.date, expiry):
+            rollups.rebuild(args.date, args.date, [symbol])
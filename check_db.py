@@ -1,21 +1,190 @@
-import sqlite3
-import pandas as pd
+"""
+Coverage and health report for the collector DB. Reads the minute_coverage
+counters that Database keeps current on write, so a report over any date range
+is a primary-key range read instead of a scan of option_data.
+Usage: python check_db.py START_DATE [END_DATE] [--symbol S] [--refresh] [--todo todo.json]
+"""
+import json
+import argparse
+from datetime import datetime, timedelta, date
+from database import Database
+from trading_calendar import TradingCalendar
 
-def check_db():
-    conn = sqlite3.connect("options_data.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-    print(f"Tables: {tables}")
+class HealthCheck:
+    """
+    Per-(symbol, day) coverage: missing-minute ranges, strikes per minute and
+    stale-snapshot runs (consecutive stored minutes whose chain is identical to
+    the previous one; minutes the collector carried over from an unchanged
+    chain are not stale). todo() turns the findings into the backfiller's work list.
+    """
+    def __init__(self, db, calendar=None, min_stale_run=3):
+        """
+        db: Database
+        calendar: TradingCalendar deciding which days and minutes are expected
+        min_stale_run: shortest run of repeated snapshots worth reporting
+        """
+        self.db = db
+        self.calendar = calendar or TradingCalendar()
+        self.min_stale_run = min_stale_run
 
-    for table in tables:
-        t_name = table[0]
-        if t_name == 'sqlite_sequence': continue
-        cursor.execute(f"SELECT COUNT(*) FROM {t_name}")
-        count = cursor.fetchone()[0]
-        print(f"Table {t_name} has {count} rows")
+    def refresh(self, start_date, end_date, symbols=None):
+        """
+        Rebuilds minute_coverage from market_data/option_data, e.g. for rows written
+        before the counters existed. Carried minutes have no rows of their own and are kept.
+        """
+        end = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with self.db._get_connection() as conn:
+            if symbols is None:
+                symbols = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT symbol FROM market_data WHERE timestamp >= ? AND timestamp < ?", (start_date, end))]
+            for symbol in symbols:
+                params = (symbol, start_date, end)
+                conn.execute("DELETE FROM minute_coverage WHERE symbol=? AND minute >= ? AND minute < ? AND NOT carried", params)
+                conn.execute("UPDATE minute_coverage SET market = 0 WHERE symbol=? AND minute >= ? AND minute < ?", params)
+                conn.execute('''
+                    INSERT INTO minute_coverage (symbol, minute, market)
+                    SELECT symbol, substr(timestamp, 1, 16), 1 FROM market_data
+                    WHERE symbol=? AND timestamp >= ? AND timestamp < ?
+                    GROUP BY substr(timestamp, 1, 16)
+                    ON CONFLICT(symbol, minute) DO UPDATE SET market = 1
+                ''', params)
+                conn.execute('''
+                    INSERT INTO minute_coverage (symbol, minute, strikes, options, oi_total, price_total)
+                    SELECT symbol, substr(timestamp, 1, 16), COUNT(DISTINCT strike_price), COUNT(*),
+                           TOTAL(oi), TOTAL(price)
+                    FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?
+                    GROUP BY substr(timestamp, 1, 16)
+                    ON CONFLICT(symbol, minute) DO UPDATE SET
+                        strikes = excluded.strikes, options = excluded.options,
+                        oi_total = excluded.oi_total, price_total = excluded.price_total, carried = 0
+                ''', params)
+                conn.execute("DELETE FROM day_coverage WHERE symbol=? AND day >= ? AND day < ?", params)
+                self.db.refresh_day_coverage(conn, symbol, start_date, end_date)
+            conn.commit()
+        return symbols
 
-    conn.close()
+    def _session(self, day):
+        """(first, last) datetime of the minutes the collector should have filled on day (up to now, for today)."""
+        hours = self.calendar.session(day)
+        start = datetime.combine(day, hours[0])
+        end = datetime.combine(day, hours[1])
+        if day == date.today():
+            end = min(end, datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=1))
+        return start, end
+
+    def _stale_runs(self, rows):
+        """
+        rows: (hh:mm, options, oi_total, price_total, carried) in minute order -> [(first, last, length)]
+        of repeated minutes. A carried minute ends a run and is never part of one.
+        """
+        runs, current, prev = [], [], None
+        for minute, options, oi_total, price_total, carried in rows:
+            if carried:
+                if len(current) >= self.min_stale_run:
+                    runs.append((current[0], current[-1], len(current)))
+                current, prev = [], None
+                continue
+            if options and prev is not None and prev[1] and (prev[2], prev[3]) == (oi_total, price_total):
+                current.append(minute)
+            else:
+                if len(current) >= self.min_stale_run:
+                    runs.append((current[0], current[-1], len(current)))
+                current = []
+            prev = (minute, options, oi_total, price_total)
+        if len(current) >= self.min_stale_run:
+            runs.append((current[0], current[-1], len(current)))
+        return runs
+
+    def report(self, start_date, end_date, symbols):
+        """One dict per (symbol, trading day) in [start_date, end_date]."""
+        days = list(self.calendar.trading_days(start_date, min(end_date, date.today().strftime("%Y-%m-%d"))).astype(date))
+
+        results = []
+        with self.db._get_connection() as conn:
+            for symbol in symbols:
+                summary = {r[0]: r[1:] for r in conn.execute(
+                    "SELECT day, complete, min_strikes, max_strikes, repeats FROM day_coverage "
+                    "WHERE symbol=? AND day >= ? AND day <= ?", (symbol, start_date, end_date))}
+
+                for day in days:
+                    day_str = day.strftime("%Y-%m-%d")
+                    start, end = self._session(day)
+                    expected = max(0, int((end - start).total_seconds() // 60) + 1)
+                    complete, min_strikes, max_strikes, repeats = summary.get(day_str, (0, None, None, 0))
+                    entry = {'symbol': symbol, 'date': day_str, 'expected': expected, 'complete': complete,
+                             'strikes': (min_strikes, max_strikes), 'missing': [], 'stale': []}
+                    # Minute detail is only read for days that are not clean
+                    if complete < expected or repeats:
+                        rows = conn.execute('''
+                            SELECT substr(minute, 12, 5), market, options, oi_total, price_total, carried FROM minute_coverage
+                            WHERE symbol=? AND minute >= ? AND minute <= ? ORDER BY minute
+                        ''', (symbol, start.strftime("%Y-%m-%d %H:%M"), end.strftime("%Y-%m-%d %H:%M"))).fetchall()
+                        present = {r[0] for r in rows if r[1] and r[2]}
+                        slots = expand_minutes(start.strftime("%H:%M"), end.strftime("%H:%M")) if expected else []
+                        entry['missing'] = compress_minutes([m for m in slots if m not in present])
+                        entry['stale'] = self._stale_runs([(r[0],) + r[2:] for r in rows])
+                    results.append(entry)
+        return results
+
+    def todo(self, start_date, end_date, symbols):
+        """Backfill work list: [{'symbol', 'date', 'slots': ['HH:MM', ...]}] covering missing and stale minutes."""
+        todo = []
+        for entry in self.report(start_date, end_date, symbols):
+            slots = set()
+            for first, last in entry['missing']:
+                slots.update(expand_minutes(first, last))
+            for first, last, _ in entry['stale']:
+                slots.update(expand_minutes(first, last))
+            if slots:
+                todo.append({'symbol': entry['symbol'], 'date': entry['date'], 'slots': sorted(slots)})
+        return todo
+
+def _minute_of_day(hhmm):
+    return int(hhmm[:2]) * 60 + int(hhmm[3:5])
+
+def compress_minutes(minutes):
+    """['09:15', '09:16', '09:20'] -> [('09:15', '09:16'), ('09:20', '09:20')]"""
+    ranges = []
+    for m in minutes:
+        if ranges and _minute_of_day(m) - _minute_of_day(ranges[-1][1]) == 1:
+            ranges[-1][1] = m
+        else:
+            ranges.append([m, m])
+    return [tuple(r) for r in ranges]
+
+def expand_minutes(first, last):
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in range(_minute_of_day(first), _minute_of_day(last) + 1)]
+
+def print_report(entries):
+    for e in entries:
+        status = "OK" if not e['missing'] and not e['stale'] else "GAPS"
+        strikes = f"{e['strikes'][0]}-{e['strikes'][1]}" if e['strikes'][0] is not None else "-"
+        print(f"{e['symbol']:<22} {e['date']} {status:<4} {e['complete']:>3}/{e['expected']} minutes, strikes/min {strikes}")
+        if e['missing']:
+            print("    missing: " + ", ".join(a if a == b else f"{a}-{b}" for a, b in e['missing']))
+        if e['stale']:
+            print("    stale:   " + ", ".join(f"{a}-{b} ({n})" for a, b, n in e['stale']))
 
 if __name__ == "__main__":
-    check_db()
+    parser = argparse.ArgumentParser(description="Collector DB coverage and health report")
+    parser.add_argument('start', help='YYYY-MM-DD')
+    parser.add_argument('end', nargs='?', help='YYYY-MM-DD (default: start)')
+    parser.add_argument('--symbol', action='append', help='Symbol to check (repeatable; default: config symbols)')
+    parser.add_argument('--config', default="config.json")
+    parser.add_argument('--refresh', action='store_true', help='Rebuild the coverage counters from the raw tables first')
+    parser.add_argument('--todo', help='Write the backfill work list to this JSON file (see backfiller.py --todo)')
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    end_date = args.end or args.start
+    symbols = args.symbol or config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"])
+    health = HealthCheck(Database(config.get("db_name", "options_data.db")), TradingCalendar.from_config(config))
+    if args.refresh:
+        health.refresh(args.start, end_date, symbols)
+    print_report(health.report(args.start, end_date, symbols))
+    if args.todo:
+        todo = health.todo(args.start, end_date, symbols)
+        with open(args.todo, "w") as f:
+            json.dump(todo, f, indent=1)
+        print(f"Wrote {len(todo)} backfill tasks to {args.todo}")
@@ -1,11 +1,134 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
+import json
+import threading
+import multiprocessing
+import importlib
 import pandas as pd
 from tvDatafeed import TvDatafeed, Interval
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from metadata_cache import MetadataCache
+
+# Fast JSON decoders tried in order; the stdlib decoder is the fallback.
+JSON_BACKENDS = ("orjson", "ujson")
+
+OPTION_LEG_FIELDS = ("lastPrice", "openInterest", "changeinOpenInterest")
+
+# Underlyings NSE serves from the indices option-chain endpoint
+INDEX_SYMBOLS = ("NIFTY", "BANKNIFTY", "FINNIFTY", "MIDCPNIFTY", "NIFTYNXT50")
+
+# Index display names some sources report instead of the F&O symbol
+INDEX_ALIASES = {"NIFTY 50": "NIFTY", "NIFTY BANK": "BANKNIFTY", "NIFTY FIN SERVICE": "FINNIFTY",
+                 "NIFTY MID SELECT": "MIDCPNIFTY", "NIFTY NEXT 50": "NIFTYNXT50"}
+
+def index_name(symbol):
+    """'NSE|INDEX|BANKNIFTY' / 'banknifty' / 'NIFTY BANK' -> 'BANKNIFTY'; None for anything that is not an index."""
+    name = symbol.upper().split('|')[-1].strip()
+    name = INDEX_ALIASES.get(name, name)
+    return name if name in INDEX_SYMBOLS else None
+
+def underlying_code(symbol):
+    """F&O code for any symbol form: exact index names are normalised, others pass through ('NSE|EQ|SBIN' -> 'SBIN')."""
+    return index_name(symbol) or symbol.upper().split('|')[-1].strip()
+
+def load_json_backend(name=None):
+    """
+    Returns a loads(bytes) callable. name: 'orjson', 'ujson', 'json' or None for the fastest available.
+    """
+    candidates = (name,) if name else JSON_BACKENDS
+    for module_name in candidates:
+        if module_name == "json": break
+        try:
+            return importlib.import_module(module_name).loads
+        except ImportError:
+            continue
+    # Plain json.loads (accepts bytes); slim_option_chain trims the tree after decoding
+    return json.loads
+
+def infer_strike_gap(strikes):
+    strikes = sorted(set(strikes))
+    gaps = [b - a for a, b in zip(strikes, strikes[1:]) if b > a]
+    return min(gaps) if gaps else None
+
+def slim_option_chain(data, strike_gap=None, strike_range=7, expiry=None):
+    """
+    Reduces a decoded NSE option-chain payload to what the collector uses:
+    spot, expiry list, snapshot timestamp, filtered PCR totals and the
+    CE/PE price/OI legs of the ATM +/- strike_range strikes of one expiry.
+    """
+    if not data: return None
+    records = data.get('records', {})
+    spot = records.get('underlyingValue')
+    expiry_dates = records.get('expiryDates', [])
+    if expiry is None and expiry_dates: expiry = expiry_dates[0]
+
+    rows = [r for r in records.get('data', []) if r.get('expiryDate') == expiry]
+    if strike_gap is None:
+        strike_gap = infer_strike_gap(r['strikePrice'] for r in rows)
+
+    if spot and strike_gap:
+        atm = round(spot / strike_gap) * strike_gap
+        low, high = atm - strike_range * strike_gap, atm + strike_range * strike_gap
+        rows = [r for r in rows if low <= r['strikePrice'] <= high]
+
+    slim_rows = []
+    for r in rows:
+        row = {'strikePrice': r['strikePrice'], 'expiryDate': r['expiryDate']}
+        for opt_type in ('CE', 'PE'):
+            if opt_type in r:
+                leg = r[opt_type]
+                row[opt_type] = {f: leg.get(f) for f in OPTION_LEG_FIELDS}
+        slim_rows.append(row)
+
+    filtered = data.get('filtered', {})
+    return {
+        'records': {
+            'timestamp': records.get('timestamp'),
+            'underlyingValue': spot,
+            'expiryDates': expiry_dates,
+            'strikeGap': strike_gap,
+            'data': slim_rows
+        },
+        'filtered': {
+            'CE': {'totOI': filtered.get('CE', {}).get('totOI', 0)},
+            'PE': {'totOI': filtered.get('PE', {}).get('totOI', 0)}
+        }
+    }
+
+class RateLimiter:
+    """
+    Spaces calls at least min_interval seconds apart. Built with shared(), the
+    schedule lives in multiprocessing primitives and is honoured across processes.
+    """
+    def __init__(self, min_interval=1.0, lock=None, next_slot=None):
+        self.min_interval = min_interval
+        self._lock = lock if lock is not None else threading.Lock()
+        self._next_slot = next_slot
+        self._local_next = 0.0
+
+    @classmethod
+    def shared(cls, min_interval=1.0):
+        return cls(min_interval, lock=multiprocessing.Lock(), next_slot=multiprocessing.Value('d', 0.0, lock=False))
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.value if self._next_slot is not None else self._local_next)
+            if self._next_slot is not None:
+                self._next_slot.value = slot + self.min_interval
+            else:
+                self._local_next = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
 
 class NSEClient:
-    def __init__(self):
+    def __init__(self, json_backend=None, keep_alive=True, session_ttl=300, refresh_margin=60, rate_limiter=None,
+                 min_refresh_interval=30, max_backoff=300):
+        """
+        min_refresh_interval: seconds between session rebuilds, however short NSE's cookies are
+        max_backoff: cap on the retry delay (doubling from 10s) while NSE is unreachable
+        """
         self.base_url = "https://www.nseindia.com"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -14,46 +137,156 @@ class NSEClient:
             "Accept-Encoding": "gzip, deflate, br",
             "Connection": "keep-alive"
         }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        self._init_session()
+        self.json_loads = load_json_backend(json_backend)
+        self.rate_limiter = rate_limiter or RateLimiter(1.0)
+
+        # Session keeper: cookies are refreshed in the background before they
+        # expire and the new session is swapped in, so requests never re-init inline.
+        self.session_ttl = session_ttl
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.max_backoff = max_backoff
+        self._last_refresh_at = 0.0
+        self.session = None
+        self.session_created_at = None
+        self._retired_session = None
+        self._rejected_session = None
+        self._session_lock = threading.Lock()
+        self._session_ready = threading.Event()
+        self._refresh_requested = threading.Event()
+        self._stop = threading.Event()
+        self._keeper = None
+        if keep_alive:
+            self._keeper = threading.Thread(target=self._keep_session, name="nse-session-keeper", daemon=True)
+            self._keeper.start()
+        else:
+            self._last_refresh_at = time.time()
+            self._swap_session(self._new_session())
 
-    def _init_session(self):
+    def _init_session(self, session):
         try:
-            self.session.get(self.base_url, timeout=15)
-            self.session.get(f"{self.base_url}/market-data/live-market-indices", timeout=15)
+            session.get(self.base_url, timeout=15)
+            session.get(f"{self.base_url}/market-data/live-market-indices", timeout=15)
+            return True
         except Exception as e:
             print(f"[NSE] Failed to initialize session: {e}")
+            return False
+
+    def _new_session(self):
+        session = requests.Session()
+        session.headers.update(self.headers)
+        self._init_session(session)
+        return session
+
+    def _swap_session(self, session):
+        with self._session_lock:
+            # The previous session may still serve an in-flight request; close the one before it.
+            if self._retired_session is not None:
+                self._retired_session.close()
+            self._retired_session = self.session
+            self.session = session
+            self.session_created_at = time.time()
+        self._session_ready.set()
+
+    def session_expires_at(self):
+        """Earliest of the TTL deadline and the expiry of any cookie NSE set."""
+        with self._session_lock:
+            if self.session is None: return 0
+            deadline = self.session_created_at + self.session_ttl
+            for cookie in self.session.cookies:
+                if cookie.expires:
+                    deadline = min(deadline, cookie.expires)
+            return deadline
+
+    def cookie_age(self):
+        return time.time() - self.session_created_at if self.session_created_at else None
+
+    def request_refresh(self):
+        self._refresh_requested.set()
+
+    def session_rejected(self):
+        """True while the current session is the one NSE last answered 401/403 to (the keeper has not swapped yet)."""
+        return self.session is not None and self.session is self._rejected_session
+
+    def _keep_session(self):
+        failures = 0
+        while not self._stop.is_set():
+            # A rebuild never follows the previous one sooner than min_refresh_interval
+            earliest = self._last_refresh_at + self.min_refresh_interval
+            refresh_at = max(earliest, self.session_expires_at() - self.refresh_margin)
+            due_at = earliest if self._refresh_requested.is_set() else refresh_at
+            if time.time() < due_at:
+                if self._refresh_requested.is_set():
+                    self._stop.wait(due_at - time.time())
+                else:
+                    self._refresh_requested.wait(timeout=min(30.0, due_at - time.time()))
+                continue
+
+            self._refresh_requested.clear()
+            self._last_refresh_at = time.time()
+            session = self._new_session()
+            if session.cookies or self.session is None:
+                self._swap_session(session)
+            else:
+                session.close()
+            if session.cookies:
+                failures = 0
+            else:
+                # NSE unreachable; keep the current session and retry with exponential backoff.
+                failures += 1
+                self._stop.wait(min(self.max_backoff, 10 * 2 ** (failures - 1)))
+                self.request_refresh()
+
+    def wait_ready(self, timeout=None):
+        return self._session_ready.wait(timeout)
+
+    def close(self):
+        self._stop.set()
+        self._refresh_requested.set()
 
     def _make_get_request(self, url, params=None, referer=None):
-        time.sleep(1.0)
+        self.rate_limiter.wait()
         headers = self.headers.copy()
         headers["Referer"] = referer if referer else self.base_url
+        if not self._session_ready.wait(timeout=15):
+            return None
+        session = self.session
         try:
-            response = self.session.get(url, params=params, headers=headers, timeout=15)
+            response = session.get(url, params=params, headers=headers, timeout=15)
             if response.status_code in [401, 403]:
-                self.session.cookies.clear()
-                self._init_session()
-                response = self.session.get(url, params=params, headers=headers, timeout=15)
+                # Cookies went stale early; let the keeper rebuild the session off the hot path.
+                self._rejected_session = session
+                self.request_refresh()
+                return None
             response.raise_for_status()
-            return response.json()
+            return self.json_loads(response.content)
         except Exception:
             return None
 
-    def get_option_chain(self, symbol, indices=True):
-        nse_symbol = symbol
-        if "NIFTY" in symbol and "BANK" not in symbol: nse_symbol = "NIFTY"
-        elif "BANK" in symbol: nse_symbol = "BANKNIFTY"
+    def get_option_chain(self, symbol, indices=True, strike_gap=None, strike_range=None):
+        """
+        With strike_range set, returns only the nearest expiry's ATM +/- strike_range
+        strikes (see slim_option_chain); strike_gap is inferred from the chain when None.
+        """
+        nse_symbol = index_name(symbol) or symbol
 
         url = f"{self.base_url}/api/option-chain-v3"
         params = {"type": "Indices" if indices else "Equities", "symbol": nse_symbol}
         referer = f"{self.base_url}/get-quotes/derivatives?symbol={nse_symbol}"
         data = self._make_get_request(url, params=params, referer=referer)
-        if not data:
+        # The fallback only helps with a session NSE still accepts; never wait for a new one
+        if not data and not self.session_rejected():
             url = f"{self.base_url}/api/option-chain-indices" if indices else f"{self.base_url}/api/option-chain-equities"
             data = self._make_get_request(url, params={"symbol": nse_symbol}, referer=referer)
+        if strike_range is not None:
+            return slim_option_chain(data, strike_gap=strike_gap, strike_range=strike_range)
         return data
 
+    def get_fno_underlyings(self):
+        """Stock underlyings with traded options, e.g. ['RELIANCE', 'SBIN', ...]."""
+        data = self._make_get_request(f"{self.base_url}/api/master-quote")
+        return list(data) if isinstance(data, list) else []
+
     def get_holiday_list(self):
         data = self._make_get_request(f"{self.base_url}/api/holiday-master")
         return [h['tradingDate'] for h in data['trading']] if data and 'trading' in data else []
@@ -67,9 +300,7 @@ class TVClient:
 
     def get_ohlcv(self, symbol, exchange='NSE', interval=Interval.in_1_minute, n_bars=1):
         if not self.tv: return None
-        tv_symbol = symbol
-        if "NIFTY" in symbol and "BANK" not in symbol: tv_symbol = "NIFTY"
-        elif "BANK" in symbol: tv_symbol = "BANKNIFTY"
+        tv_symbol = index_name(symbol) or symbol
 
         try:
             return self.tv.get_hist(symbol=tv_symbol, exchange=exchange, interval=interval, n_bars=n_bars)
@@ -77,8 +308,18 @@ class TVClient:
             return None
 
 class TrendlyneClient:
-    def __init__(self):
-        self.base_url = "https://smartoptions.trendlyne.com/phoenix/api"
+    def __init__(self, cache=None, base_url=None, pool_size=16):
+        """
+        base_url: API root (point it at a local fake server for tests/benchmarks)
+        pool_size: keep-alive connections kept open, one per concurrent caller
+        """
+        self.base_url = base_url or "https://smartoptions.trendlyne.com/phoenix/api"
+        self.cache = cache if cache is not None else MetadataCache()
+        # One pooled session for every request, safe to share across worker threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def format_expiry_for_url(self, expiry_date):
         """
@@ -88,41 +329,62 @@ class TrendlyneClient:
         return dt.strftime("%d-%b-%Y").lower() + "-near"
 
     def get_stock_id_for_symbol(self, symbol):
-        s = symbol.upper().split('|')[-1] if '|' in symbol else symbol.upper()
-        if "NIFTY" in s and "BANK" not in s: search_query = "NIFTY"
-        elif "BANK" in s: search_query = "BANKNIFTY"
-        else: search_query = s
+        search_query = underlying_code(symbol)
+
+        stock_id = self.cache.get_stock_id(search_query)
+        if stock_id: return stock_id
 
         try:
-            response = requests.get(f"{self.base_url}/search-contract-stock/", params={'query': search_query.lower()}, timeout=10)
+            response = self.session.get(f"{self.base_url}/search-contract-stock/", params={'query': search_query.lower()}, timeout=10)
             data = response.json()
             if data and 'body' in data and 'data' in data['body']:
+                stock_id = data['body']['data'][0]['stock_id']
                 for item in data['body']['data']:
                     stock_code = item.get('stock_code', '').upper()
-                    if stock_code == search_query: return item['stock_id']
-                return data['body']['data'][0]['stock_id']
+                    if stock_code == search_query:
+                        stock_id = item['stock_id']
+                        break
+                self.cache.put_stock_id(search_query, stock_id)
+                return stock_id
         except Exception:
             pass
         return None
 
     def get_expiry_dates(self, stock_id):
+        expiries = self.cache.get_expiries(stock_id)
+        if expiries: return expiries
+
         url = f"{self.base_url}/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
         try:
-            response = requests.get(url, timeout=5)
-            return response.json().get('body', {}).get('expiryDates', [])
+            response = self.session.get(url, timeout=5)
+            expiries = response.json().get('body', {}).get('expiryDates', [])
         except Exception:
             return []
+        if expiries:
+            self.cache.put_expiries(stock_id, expiries)
+        return expiries
+
+    def get_expiry_for_date(self, stock_id, date_str):
+        """
+        Nearest expiry on or after date_str ('YYYY-MM-DD'), including past
+        expiries remembered by the cache. Returns None if none is known.
+        """
+        if date_str >= date.today().strftime("%Y-%m-%d"):
+            self.get_expiry_dates(stock_id)
+        expiry = self.cache.expiry_for_date(stock_id, date_str)
+        if expiry is None:
+            self.get_expiry_dates(stock_id)
+            expiry = self.cache.expiry_for_date(stock_id, date_str)
+        return expiry
 
     def get_options_buildup(self, symbol, expiry_date, strike, option_type, interval=5):
         """
-        symbol: 'NIFTY' or 'BANKNIFTY'
+        symbol: 'NIFTY', 'BANKNIFTY' or a stock code such as 'HDFCBANK'
         expiry_date: 'YYYY-MM-DD'
         strike: 25700
         option_type: 'call' or 'put'
         """
-        clean_symbol = symbol.upper()
-        if "NIFTY" in clean_symbol and "BANK" not in clean_symbol: clean_symbol = "NIFTY"
-        elif "BANK" in clean_symbol: clean_symbol = "BANKNIFTY"
+        clean_symbol = underlying_code(symbol)
 
         expiry_formatted = self.format_expiry_for_url(expiry_date)
 
@@ -133,7 +395,7 @@ class TrendlyneClient:
             'option_type': option_type
         }
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -144,15 +406,11 @@ class TrendlyneClient:
         # Kept for compatibility, but buildup is preferred for strike-wise history
         stock_id = self.get_stock_id_for_symbol(symbol)
         if not stock_id: return None
-        expiries = self.get_expiry_dates(stock_id)
-        if not expiries: return None
-
-        current_expiry = None
-        for exp in expiries:
-            if exp >= date_str:
-                current_expiry = exp
-                break
-        if not current_expiry: current_expiry = expiries[0]
+        current_expiry = self.get_expiry_for_date(stock_id, date_str)
+        if not current_expiry:
+            expiries = self.get_expiry_dates(stock_id)
+            if not expiries: return None
+            current_expiry = expiries[0]
 
         dt = datetime.strptime(date_str, "%Y-%m-%d")
         min_time = int(dt.replace(hour=9, minute=15).timestamp() * 1000)
@@ -165,7 +423,7 @@ class TrendlyneClient:
             'maxTime': max_time
         }
         try:
-            response = requests.get(f"{self.base_url}/live-oi-data/", params=params, timeout=10)
+            response = self.session.get(f"{self.base_url}/live-oi-data/", params=params, timeout=10)
             return response.json()
         except Exception:
             return None
@@ -184,7 +442,7 @@ class TrendlyneClient:
         }
 
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             if data['head']['status'] == '0':
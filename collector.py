@@ -1,22 +1,91 @@
 import time
 import json
-import os
-import pandas as pd
-from datetime import datetime, time as dtime
-from clients import NSEClient, TVClient
-from database import Database
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from clients import NSEClient, TVClient, INDEX_SYMBOLS
+from database import Database, OptionDatabase
+from rollups import RollupManager
+from trading_calendar import TradingCalendar
+from write_behind import WriteBehindWriter
+from polling import AdaptivePoller, snapshot_hash, snapshot_bytes
+from profiling import Profiler, add_profiling_args, profiler_from_args
+
+def parse_nse_date(value):
+    """'28-Oct-2025' (NSE) or '2025-10-28' -> date; None when unparseable."""
+    for fmt in ("%d-%b-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
 
 class DataCollector:
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", symbols=None, rate_limiter=None, sink=None, profiler=None,
+                 refresh_calendar=True):
+        """
+        symbols: overrides config["symbols"] (used by sharded workers)
+        rate_limiter: RateLimiter for this collector's NSE session
+        sink: callable(market_record, option_entries) that takes over storage; when
+              None the collector writes to its own DB
+        profiler: Profiler wrapped around every polling cycle (default: control-file only)
+        refresh_calendar: False when another process refreshes the calendar cache; a stale
+                          calendar is then only re-read from disk
+        """
+        self._started_at = time.monotonic()
+        self.metrics = {}
         with open(config_path, "r") as f:
             self.config = json.load(f)
 
-        self.nse = NSEClient()
-        self.tv = TVClient()
-        self.db = Database(self.config.get("db_name", "options_data.db"))
-        self.symbols = self.config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"])
+        self.calendar = TradingCalendar.from_config(self.config)
+        self.refresh_calendar = refresh_calendar
+
+        # Warm-up runs in parallel: the NSE session bootstraps on its keeper thread,
+        # TradingView logs in on the pool and is only awaited on first use.
+        self._warmup = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warmup")
+        self.nse = NSEClient(rate_limiter=rate_limiter)
+        self._tv_future = self._warmup.submit(TVClient)
+        self._calendar_refresh = None
+        self.refresh_calendar_async()
+
+        self.sink = sink
+        self.db = None
+        self.rollups = None
+        self.writer = None
+        if sink is None:
+            self.db = Database(self.config.get("db_name", "options_data.db"))
+            self.rollups = RollupManager(self.db, OptionDatabase(self.config.get("master_db_name", "sos_master_data.db")))
+            if self.config.get("write_behind", True):
+                # Storage runs on its own thread; unwritable rows are journaled and replayed
+                self.writer = WriteBehindWriter(self.db, self.rollups,
+                                                journal_path=self.config.get("journal_path", "collector_journal.jsonl"))
+                self.sink = self.writer.submit
+        self._finalized_date = None
+        self.symbols = symbols or self.config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"])
         self.previous_pcr = {s: None for s in self.symbols}
 
+        # "polling": "fixed" (every symbol once a minute) or "adaptive" (per-symbol cadence, unchanged chains skipped)
+        self.poller = None
+        if self.config.get("polling", "fixed") == "adaptive":
+            self.poller = AdaptivePoller(**self.config.get("adaptive_polling", {}))
+        self.nse_timestamps = {}
+        # Nearest expiry of each symbol as NSE last reported it ('28-Oct-2025')
+        self.nearest_expiry = {}
+        self._poll_reported_date = None
+        self.profiler = profiler or Profiler("collector", install_signals=False)
+
+    @property
+    def tv(self):
+        return self._tv_future.result()
+
+    def refresh_calendar_async(self):
+        if not self.calendar.is_stale(): return
+        if not self.refresh_calendar:
+            self.calendar.reload()
+            return
+        if self._calendar_refresh is None or self._calendar_refresh.done():
+            self._calendar_refresh = self._warmup.submit(self.calendar.refresh, self.nse)
+
     def get_clean_symbol(self, symbol):
         if '|' in symbol:
             return symbol.split('|')[-1]
@@ -26,24 +95,66 @@ class DataCollector:
         return round(spot_price / strike_gap) * strike_gap
 
     def get_strike_gap(self, clean_symbol):
+        """Configured strike gap, or None to infer it from the chain (stock underlyings)."""
         gaps = self.config.get("strike_gaps", {})
-        return gaps.get(clean_symbol, 100)
+        return gaps.get(clean_symbol)
+
+    def is_index(self, full_symbol):
+        return "|INDEX|" in full_symbol or self.get_clean_symbol(full_symbol) in INDEX_SYMBOLS
 
     def process_symbol(self, full_symbol):
+        collected = self.collect_symbol(full_symbol)
+        if collected is None:
+            return False
+        if self.poller is not None and not self.observe(full_symbol, *collected):
+            self.save(collected[0], None)
+            return True
+        self.save(*collected)
+        return True
+
+    def observe(self, full_symbol, market_record, option_entries):
+        """Feeds the adaptive poller; False when the chain is unchanged since the last stored snapshot."""
+        now = datetime.now()
+        return self.poller.observe(full_symbol, time.time(), self.nse_timestamps.get(full_symbol),
+                                   snapshot_hash(market_record, option_entries), market_record['spot_price'],
+                                   boost=self.is_busy_period(full_symbol, now),
+                                   size=snapshot_bytes(market_record, option_entries))
+
+    def is_busy_period(self, full_symbol, now):
+        """
+        The first minutes after the open, and an index's own expiry days (its nearest
+        expiry in the chain, so monthly-only indices are not boosted weekly), are
+        polled at the fastest cadence.
+        """
+        hours = self.calendar.session(now.date())
+        if hours and now < datetime.combine(now.date(), hours[0]) + timedelta(minutes=self.config.get("open_boost_minutes", 15)):
+            return True
+        expiry = self.nearest_expiry.get(full_symbol)
+        return self.is_index(full_symbol) and expiry is not None and parse_nse_date(expiry) == now.date()
+
+    def collect_symbol(self, full_symbol):
+        """Fetches one minute for full_symbol. Returns (market_record, option_entries) or None."""
         clean_symbol = self.get_clean_symbol(full_symbol)
         print(f"[{datetime.now()}] Processing {full_symbol}...")
 
-        # 1. Fetch Option Chain from NSE
-        oc_data = self.nse.get_option_chain(clean_symbol)
+        # 1. Fetch Option Chain from NSE (decoded down to the ATM window)
+        strike_gap = self.get_strike_gap(clean_symbol)
+        oc_data = self.nse.get_option_chain(clean_symbol, indices=self.is_index(full_symbol),
+                                            strike_gap=strike_gap, strike_range=7)
         if not oc_data:
             print(f"Failed to fetch option chain for {clean_symbol}")
-            return
+            return None
+        self.nse_timestamps[full_symbol] = oc_data['records'].get('timestamp')
+        strike_gap = strike_gap or oc_data['records'].get('strikeGap')
 
         # 2. Get Spot Price
         spot_price = oc_data.get('records', {}).get('underlyingValue')
         if not spot_price:
             print(f"No spot price found for {clean_symbol}")
-            return
+            return None
+        if not strike_gap:
+            print(f"Could not determine strike gap for {clean_symbol}")
+            return None
 
         # 3. Fetch OHLCV from TradingView
         # TradingView usually uses just NIFTY or BANKNIFTY for NSE
@@ -60,7 +171,6 @@ class DataCollector:
             }
 
         # 4. Filter Option Chain for +/- 7 strikes around ATM
-        strike_gap = self.get_strike_gap(clean_symbol)
         atm_strike = self.get_atm_strike(spot_price, strike_gap)
 
         relevant_strikes = [atm_strike + i * strike_gap for i in range(-7, 8)]
@@ -68,8 +178,9 @@ class DataCollector:
         records = oc_data.get('records', {}).get('data', [])
         expiry_dates = oc_data.get('records', {}).get('expiryDates', [])
         if not expiry_dates:
-            return
+            return None
         current_expiry = expiry_dates[0]
+        self.nearest_expiry[full_symbol] = current_expiry
 
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -97,11 +208,10 @@ class DataCollector:
 
         total_pcr = total_pe_oi / total_ce_oi if total_ce_oi != 0 else 0
         pcr_change = 0
-        if self.previous_pcr[full_symbol] is not None:
+        if self.previous_pcr.get(full_symbol) is not None:
             pcr_change = total_pcr - self.previous_pcr[full_symbol]
         self.previous_pcr[full_symbol] = total_pcr
 
-        # 6. Save to DB
         market_data_record = {
             'timestamp': timestamp,
             'symbol': full_symbol,
@@ -114,42 +224,105 @@ class DataCollector:
             'total_pcr': total_pcr,
             'pcr_change': pcr_change
         }
+        return market_data_record, option_entries
 
-        self.db.save_market_data(market_data_record)
-        self.db.save_option_data(option_entries)
-        print(f"Saved data for {full_symbol} at {timestamp}")
+    def save(self, market_data_record, option_entries):
+        """
+        option_entries None: the chain is unchanged since the last stored snapshot. The
+        market row is stored as usual; the option minute is only carried in coverage.
+        """
+        if self.sink is not None:
+            self.sink(market_data_record, option_entries)
+        else:
+            self.db.save_market_data(market_data_record)
+            if option_entries is None:
+                self.db.carry_minute(market_data_record['symbol'], market_data_record['timestamp'])
+            else:
+                self.db.save_option_data(option_entries)
+            self.rollups.update_minute(market_data_record['symbol'], market_data_record['timestamp'])
+            print(f"Saved data for {market_data_record['symbol']} at {market_data_record['timestamp']}")
 
-    def is_market_open(self):
-        now = datetime.now()
-        if now.weekday() >= 5: return False
+        if 'time_to_first_minute' not in self.metrics:
+            self.metrics['time_to_first_minute'] = time.monotonic() - self._started_at
+            print(f"[METRIC] time_to_first_collected_minute={self.metrics['time_to_first_minute']:.2f}s")
 
-        m_hours = self.config.get("market_hours", {"start": "09:15", "end": "15:30"})
-        start_h, start_m = map(int, m_hours["start"].split(":"))
-        end_h, end_m = map(int, m_hours["end"].split(":"))
+    def is_market_open(self):
+        return self.calendar.is_market_open()
 
-        return dtime(start_h, start_m) <= now.time() <= dtime(end_h, end_m)
+    def process_symbols(self, symbols):
+        """One polling pass; each symbol's time is recorded as a step of the current profiler cycle."""
+        ok = 0
+        for symbol in symbols:
+            with self.profiler.step(symbol):
+                try:
+                    if self.process_symbol(symbol):
+                        ok += 1
+                except Exception as e:
+                    print(f"Error processing {symbol}: {e}")
+        return ok
 
     def run(self):
+        if self.poller is not None:
+            return self.run_adaptive()
         print(f"Starting Data Collector with symbols: {self.symbols}")
-        holidays = self.nse.get_holiday_list()
 
         while True:
+            self.refresh_calendar_async()
             if self.is_market_open():
-                today_str = datetime.now().strftime("%d-%b-%Y")
-                if today_str in holidays:
-                    time.sleep(3600)
-                    continue
-
-                for symbol in self.symbols:
-                    try:
-                        self.process_symbol(symbol)
-                    except Exception as e:
-                        print(f"Error processing {symbol}: {e}")
+                with self.profiler.cycle(datetime.now().strftime("%H:%M")):
+                    self.process_symbols(self.symbols)
 
                 time.sleep(60)
             else:
+                self.finalize_day_if_closed()
+                time.sleep(60)
+
+    def run_adaptive(self):
+        print(f"Starting Data Collector (adaptive polling) with symbols: {self.symbols}")
+
+        while True:
+            self.refresh_calendar_async()
+            if not self.is_market_open():
+                self.finalize_day_if_closed()
+                self.report_polling()
                 time.sleep(60)
+                continue
+
+            with self.profiler.cycle(datetime.now().strftime("%H:%M:%S")):
+                self.process_symbols(self.poller.due(self.symbols, time.time()))
+            time.sleep(min(60, max(1, self.poller.next_due(self.symbols) - time.time())))
+
+    def report_polling(self):
+        """After the close, logs fetches and bytes stored per symbol against fixed once-a-minute polling."""
+        now = datetime.now()
+        if self._poll_reported_date == now.date() or not self.calendar.is_session_over(now):
+            return
+        session_minutes = len(self.calendar.minute_slots(now.date()))
+        for symbol in self.symbols:
+            print(self.poller.report(symbol, session_minutes))
+        self.poller.stats.clear()
+        self._poll_reported_date = now.date()
+
+    def finalize_day_if_closed(self):
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        if self.rollups is None or self._finalized_date == today or not self.calendar.is_session_over(now):
+            return
+        try:
+            # The day's last minutes may still be queued behind the write-behind thread
+            if self.writer is not None:
+                self.writer.flush()
+            self.rollups.finalize_day(today, self.symbols)
+            self._finalized_date = today
+            print(f"Saved daily PCR history for {today}")
+        except Exception as e:
+            print(f"Error finalizing {today}: {e}")
 
 if __name__ == "__main__":
-    collector = DataCollector()
+    parser = argparse.ArgumentParser(description="Minute-by-minute option chain collector")
+    parser.add_argument('--config', default="config.json")
+    add_profiling_args(parser)
+    args = parser.parse_args()
+
+    collector = DataCollector(args.config, profiler=profiler_from_args("collector", args))
     collector.run()
@@ -1,5 +1,37 @@
 import sqlite3
-from datetime import datetime
+import glob
+import threading
+from datetime import datetime, timedelta
+
+MARKET_COLUMNS = ('timestamp', 'symbol', 'spot_price', 'open', 'high', 'low', 'close', 'volume', 'total_pcr', 'pcr_change')
+OPTION_COLUMNS = ('timestamp', 'symbol', 'strike_price', 'expiry_date', 'option_type', 'price', 'oi', 'oi_change')
+
+# option_data pivoted to one row per strike and minute, in the shape of the
+# monthly option_chain_details table (plus expiry and prices)
+CHAIN_SELECT = '''
+    SELECT symbol, substr(timestamp, 1, 10) AS date, substr(timestamp, 12, 5) AS timestamp, strike_price AS strike,
+           CAST(TOTAL(CASE WHEN option_type = 'CE' THEN oi END) AS INTEGER) AS call_oi,
+           CAST(TOTAL(CASE WHEN option_type = 'PE' THEN oi END) AS INTEGER) AS put_oi,
+           CAST(TOTAL(CASE WHEN option_type = 'CE' THEN oi_change END) AS INTEGER) AS call_oi_chg,
+           CAST(TOTAL(CASE WHEN option_type = 'PE' THEN oi_change END) AS INTEGER) AS put_oi_chg,
+           expiry_date AS expiry,
+           MAX(CASE WHEN option_type = 'CE' THEN price END) AS call_price,
+           MAX(CASE WHEN option_type = 'PE' THEN price END) AS put_price
+    FROM option_data {where}
+    GROUP BY symbol, option_data.timestamp, expiry_date, strike_price
+'''
+
+def _symbol_forms(symbol):
+    """option_data stores collector symbols ('NSE|INDEX|NIFTY'); Trendlyne-era callers pass 'NIFTY'."""
+    return (symbol,) if '|' in symbol else (symbol, f"NSE|INDEX|{symbol}", f"NSE|EQ|{symbol}")
+
+def _pcr(call_oi, put_oi):
+    return round(put_oi / call_oi, 2) if call_oi > 0 else 1.0
+
+def _option_tuples(option_records):
+    return [(r['timestamp'], r['symbol'], r['strike_price'], r['expiry_date'],
+             r['option_type'], r.get('price'), r.get('oi'), r.get('oi_change'))
+            for r in option_records]
 
 class Database:
     def __init__(self, db_name="options_data.db"):
@@ -47,37 +79,559 @@ class Database:
                 )
             ''')
 
+            # Per-symbol time-range reads (rollups, exports, health checks)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_market_data_symbol_ts ON market_data(symbol, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_option_data_symbol_ts ON option_data(symbol, timestamp)")
+
+            # Trendlyne snapshots are stored once, in option_data; the per-strike and
+            # per-minute shapes backfill_trendlyne.py used to write are views over it
+            cursor.execute("CREATE VIEW IF NOT EXISTS option_chain_details AS " + CHAIN_SELECT.format(where=""))
+            cursor.execute('''
+                CREATE VIEW IF NOT EXISTS option_aggregates AS
+                SELECT symbol, date, timestamp, expiry, SUM(call_oi) AS call_oi, SUM(put_oi) AS put_oi,
+                       CASE WHEN SUM(call_oi) > 0 THEN ROUND(1.0 * SUM(put_oi) / SUM(call_oi), 2) ELSE 1.0 END AS pcr
+                FROM option_chain_details GROUP BY symbol, date, timestamp, expiry
+            ''')
+
+            # Per-minute coverage counters, kept current on write (see check_db.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS minute_coverage (
+                    symbol TEXT NOT NULL,
+                    minute TEXT NOT NULL, -- 'YYYY-MM-DD HH:MM'
+                    market INTEGER NOT NULL DEFAULT 0,
+                    strikes INTEGER NOT NULL DEFAULT 0,
+                    options INTEGER NOT NULL DEFAULT 0,
+                    oi_total REAL,
+                    price_total REAL,
+                    carried INTEGER NOT NULL DEFAULT 0, -- 1: unchanged chain, counters copied from the last stored minute
+                    PRIMARY KEY (symbol, minute)
+                ) WITHOUT ROWID
+            ''')
+            if 'carried' not in {r[1] for r in cursor.execute("PRAGMA table_info(minute_coverage)")}:
+                cursor.execute("ALTER TABLE minute_coverage ADD COLUMN carried INTEGER NOT NULL DEFAULT 0")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS day_coverage (
+                    symbol TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    complete INTEGER NOT NULL, -- minutes with market data and option rows
+                    min_strikes INTEGER,
+                    max_strikes INTEGER,
+                    repeats INTEGER NOT NULL, -- stored minutes whose chain equals the previous minute's
+                    PRIMARY KEY (symbol, day)
+                ) WITHOUT ROWID
+            ''')
+
             conn.commit()
 
     def save_market_data(self, data):
         """
         data: dict with keys matching market_data columns
         """
+        self.save_market_rows([(data['timestamp'], data['symbol']) + tuple(data.get(c) for c in MARKET_COLUMNS[2:])])
+
+    def save_market_rows(self, rows):
+        """
+        rows: tuples in MARKET_COLUMNS order, written in one transaction. A symbol
+        keeps one row per minute: a later poll in the same minute replaces the
+        earlier one, since TV's volume is the running total of the minute bar
+        and rollups sum volume across minutes.
+        """
         query = '''
             INSERT OR REPLACE INTO market_data
             (timestamp, symbol, spot_price, open, high, low, close, volume, total_pcr, pcr_change)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
         with self._get_connection() as conn:
-            conn.execute(query, (
-                data['timestamp'], data['symbol'], data.get('spot_price'),
-                data.get('open'), data.get('high'), data.get('low'),
-                data.get('close'), data.get('volume'), data.get('total_pcr'),
-                data.get('pcr_change')
-            ))
+            conn.executemany(
+                "DELETE FROM market_data WHERE timestamp >= ? AND timestamp < ? AND symbol = ? AND timestamp <> ?",
+                [(r[0][:16], r[0][:16] + ':60', r[1], r[0]) for r in rows])
+            conn.executemany(query, rows)
+            conn.executemany('''
+                INSERT INTO minute_coverage (symbol, minute, market) VALUES (?, ?, 1)
+                ON CONFLICT(symbol, minute) DO UPDATE SET market = 1
+            ''', [(r[1], r[0][:16]) for r in rows])
+            for symbol, day in {(r[1], r[0][:10]) for r in rows}:
+                self.refresh_day_coverage(conn, symbol, day)
 
     def save_option_data(self, option_records):
         """
         option_records: list of dicts with keys matching option_data columns
         """
+        self.save_option_rows(_option_tuples(option_records))
+
+    def save_option_rows(self, rows):
+        """
+        rows: tuples in OPTION_COLUMNS order. Every row of a minute must be in the same call.
+        """
         query = '''
             INSERT OR REPLACE INTO option_data
             (timestamp, symbol, strike_price, expiry_date, option_type, price, oi, oi_change)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         '''
         with self._get_connection() as conn:
-            conn.executemany(query, [
-                (r['timestamp'], r['symbol'], r['strike_price'], r['expiry_date'],
-                 r['option_type'], r.get('price'), r.get('oi'), r.get('oi_change'))
-                for r in option_records
-            ])
+            conn.executemany(query, rows)
+            self._update_coverage(conn, rows)
+
+    def carry_minute(self, symbol, timestamp):
+        """
+        Marks timestamp's minute as covered by the last stored snapshot (the chain
+        was polled but had not changed): its option counters are copied and the
+        minute is flagged carried, so it is not reported as stale. option_data is
+        untouched; the minute's market row is saved separately.
+        """
+        with self._get_connection() as conn:
+            conn.execute('''
+                INSERT INTO minute_coverage (symbol, minute, strikes, options, oi_total, price_total, carried)
+                SELECT symbol, ?, strikes, options, oi_total, price_total, 1 FROM minute_coverage
+                WHERE symbol=? AND minute < ? AND options > 0 ORDER BY minute DESC LIMIT 1
+                ON CONFLICT(symbol, minute) DO UPDATE SET
+                    strikes = excluded.strikes, options = excluded.options,
+                    oi_total = excluded.oi_total, price_total = excluded.price_total, carried = 1
+                WHERE minute_coverage.options = 0
+            ''', (timestamp[:16], symbol, timestamp[:16]))
+            self.refresh_day_coverage(conn, symbol, timestamp[:10])
+
+    def _update_coverage(self, conn, rows):
+        # minute -> [strikes, rows, oi total, price total]; a minute's rows arrive in one call
+        minutes = {}
+        for timestamp, symbol, strike, _, _, price, oi, _ in rows:
+            m = minutes.setdefault((symbol, timestamp[:16]), [set(), 0, 0.0, 0.0])
+            m[0].add(strike)
+            m[1] += 1
+            m[2] += oi or 0
+            m[3] += price or 0
+        conn.executemany('''
+            INSERT INTO minute_coverage (symbol, minute, strikes, options, oi_total, price_total) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol, minute) DO UPDATE SET
+                strikes = excluded.strikes, options = excluded.options,
+                oi_total = excluded.oi_total, price_total = excluded.price_total, carried = 0
+        ''', [key + (len(m[0]), m[1], m[2], m[3]) for key, m in minutes.items()])
+        for symbol, day in {(symbol, minute[:10]) for symbol, minute in minutes}:
+            self.refresh_day_coverage(conn, symbol, day)
+
+    def option_minutes(self, symbol, date_str):
+        """
+        {'HH:MM': (call_oi, put_oi)} for every minute of date_str that already has
+        option rows, whoever wrote them. Minutes carried over from an unchanged
+        chain map to None (their snapshot is the previous stored minute's).
+        """
+        end = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with self._get_connection() as conn:
+            rows = conn.execute('''
+                SELECT substr(c.minute, 12, 5), t.call_oi, t.put_oi FROM minute_coverage c
+                LEFT JOIN (SELECT substr(timestamp, 1, 16) AS minute,
+                                  TOTAL(CASE WHEN option_type = 'CE' THEN oi END) AS call_oi,
+                                  TOTAL(CASE WHEN option_type = 'PE' THEN oi END) AS put_oi
+                           FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?
+                           GROUP BY substr(timestamp, 1, 16)) t ON t.minute = c.minute
+                WHERE c.symbol=? AND c.minute >= ? AND c.minute < ? AND c.options > 0
+            ''', (symbol, date_str, end, symbol, date_str, end)).fetchall()
+        return {m: (call_oi, put_oi) if call_oi is not None else None for m, call_oi, put_oi in rows}
+
+    def market_minutes(self, symbol, date_str):
+        """{'HH:MM'} for every minute of date_str that already has a market_data row."""
+        end = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with self._get_connection() as conn:
+            return {r[0] for r in conn.execute(
+                "SELECT substr(minute, 12, 5) FROM minute_coverage WHERE symbol=? AND minute >= ? AND minute < ? AND market = 1",
+                (symbol, date_str, end))}
+
+    def minute_symbols(self, minute):
+        """Symbols with option rows (or a carried-over chain) for minute 'YYYY-MM-DD HH:MM'."""
+        with self._get_connection() as conn:
+            return {r[0] for r in conn.execute(
+                "SELECT symbol FROM minute_coverage WHERE minute=? AND options > 0", (minute,))}
+
+    def _latest_minute(self, conn, symbol):
+        """(stored symbol, timestamp) of symbol's newest option rows, or None."""
+        forms = _symbol_forms(symbol)
+        row = conn.execute(f"SELECT symbol, MAX(timestamp) FROM option_data WHERE symbol IN ({','.join('?' * len(forms))})",
+                           forms).fetchone()
+        return row if row[1] is not None else None
+
+    def get_latest_chain(self, symbol):
+        """Latest stored minute of symbol as option_chain_details-shaped dicts, one per strike."""
+        with self._get_connection() as conn:
+            last = self._latest_minute(conn, symbol)
+            if last is None:
+                return []
+            rows = conn.execute(CHAIN_SELECT.format(where="WHERE symbol=? AND option_data.timestamp=?") + " ORDER BY strike",
+                                last).fetchall()
+        return [{
+            'strike': r[3], 'call_oi': r[4], 'put_oi': r[5], 'call_oi_chg': r[6], 'put_oi_chg': r[7],
+            'expiry': r[8], 'call_price': r[9], 'put_price': r[10]
+        } for r in rows]
+
+    def get_latest_aggregates(self, symbol):
+        """Latest minute of symbol as an option_aggregates row: (symbol, date, timestamp, expiry, call_oi, put_oi, pcr)."""
+        with self._get_connection() as conn:
+            last = self._latest_minute(conn, symbol)
+            if last is None:
+                return None
+            expiry, call_oi, put_oi = conn.execute('''
+                SELECT MIN(expiry_date), TOTAL(CASE WHEN option_type = 'CE' THEN oi END),
+                       TOTAL(CASE WHEN option_type = 'PE' THEN oi END)
+                FROM option_data WHERE symbol=? AND timestamp=?
+            ''', last).fetchone()
+        return (last[0], last[1][:10], last[1][11:16], expiry, int(call_oi), int(put_oi), _pcr(call_oi, put_oi))
+
+    def aggregates_range(self, symbol, start_date, end_date):
+        """option_aggregates rows of symbol's minutes in [start_date, end_date], oldest first."""
+        forms = _symbol_forms(symbol)
+        end = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT symbol, substr(timestamp, 1, 10), substr(timestamp, 12, 5), MIN(expiry_date),
+                       TOTAL(CASE WHEN option_type = 'CE' THEN oi END), TOTAL(CASE WHEN option_type = 'PE' THEN oi END)
+                FROM option_data WHERE symbol IN ({','.join('?' * len(forms))}) AND timestamp >= ? AND timestamp < ?
+                GROUP BY symbol, timestamp ORDER BY timestamp
+            ''', forms + (start_date, end)).fetchall()
+        return [r[:4] + (int(r[4]), int(r[5]), _pcr(r[4], r[5])) for r in rows]
+
+    def chain_range(self, symbol, start_date, end_date, strikes=None):
+        """option_chain_details rows (plus expiry and prices) of symbol in [start_date, end_date]."""
+        forms = _symbol_forms(symbol)
+        end = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        where = f"WHERE symbol IN ({','.join('?' * len(forms))}) AND timestamp >= ? AND timestamp < ?"
+        params = list(forms) + [start_date, end]
+        if strikes:
+            where += f" AND strike_price IN ({','.join('?' * len(strikes))})"
+            params.extend(float(s) for s in strikes)
+        with self._get_connection() as conn:
+            return conn.execute(CHAIN_SELECT.format(where=where) + " ORDER BY option_data.timestamp, strike", params).fetchall()
+
+    def refresh_price_totals(self, conn, symbol, date_str):
+        """
+        Re-derives minute_coverage.price_total of symbol's minutes on date_str after
+        option_data prices were rewritten in place; carried minutes follow the stored
+        minute they copy. day_coverage is refreshed too.
+        """
+        end = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        totals = dict(conn.execute('''
+            SELECT substr(timestamp, 1, 16), TOTAL(price) FROM option_data
+            WHERE symbol=? AND timestamp >= ? AND timestamp < ? GROUP BY substr(timestamp, 1, 16)
+        ''', (symbol, date_str, end)))
+        updates, last = [], None
+        for minute, carried in conn.execute(
+                "SELECT minute, carried FROM minute_coverage WHERE symbol=? AND minute >= ? AND minute < ? ORDER BY minute",
+                (symbol, date_str, end)).fetchall():
+            total = last if carried else totals.get(minute)
+            if total is None: continue
+            updates.append((total, symbol, minute))
+            last = total
+        conn.executemany("UPDATE minute_coverage SET price_total=? WHERE symbol=? AND minute=?", updates)
+        self.refresh_day_coverage(conn, symbol, date_str)
+
+    def refresh_day_coverage(self, conn, symbol, start_date, end_date=None):
+        """Re-derives day_coverage for symbol's days start_date..end_date (inclusive) from minute_coverage."""
+        end = (datetime.strptime(end_date or start_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        conn.execute('''
+            INSERT OR REPLACE INTO day_coverage
+            SELECT symbol, day, SUM(market AND options > 0), MIN(NULLIF(strikes, 0)), MAX(strikes),
+                   SUM(options > 0 AND NOT carried AND prev_oi IS oi_total AND prev_price IS price_total)
+            FROM (SELECT symbol, substr(minute, 1, 10) AS day, market, strikes, options, oi_total, price_total, carried,
+                         LAG(oi_total) OVER w AS prev_oi, LAG(price_total) OVER w AS prev_price
+                  FROM minute_coverage WHERE symbol=? AND minute >= ? AND minute < ?
+                  WINDOW w AS (PARTITION BY substr(minute, 1, 10) ORDER BY minute))
+            GROUP BY day
+        ''', (symbol, start_date, end))
+
+class OptionDatabase:
+    def __init__(self, master_db_path="sos_master_data.db", chain_db=None):
+        """
+        chain_db: Database whose option_data holds the Trendlyne snapshots stored since
+        ingestion moved there (trendlyne_ingest.py). The snapshot readers cover it as well
+        as the monthly partitions, which keep the data written before.
+        """
+        self.master_db_path = master_db_path
+        self.chain_db = chain_db
+        # One cached connection per DB file; schema is created once per file per process
+        self._connections = {}
+        self._initialized = set()
+        self._lock = threading.RLock()
+        self._init_master_db()
+
+    def _get_timeseries_db_path(self, trading_date=None):
+        """Returns the monthly DB path for trading_date ('YYYY-MM-DD', default today), e.g., 'sos_timeseries_2023_12.db'"""
+        month = trading_date[:7].replace('-', '_') if trading_date else datetime.now().strftime('%Y_%m')
+        return f"sos_timeseries_{month}.db"
+
+    def _get_partitions(self, start_date=None, end_date=None):
+        """Existing monthly DB paths overlapping [start_date, end_date], oldest first."""
+        paths = sorted(glob.glob("sos_timeseries_[0-9][0-9][0-9][0-9]_[0-9][0-9].db"))
+        if start_date: paths = [p for p in paths if p >= self._get_timeseries_db_path(start_date)]
+        if end_date: paths = [p for p in paths if p <= self._get_timeseries_db_path(end_date)]
+        return paths
+
+    def _get_connection(self, db_path):
+        """Returns the cached connection for db_path, opening it with WAL mode on first use."""
+        conn = self._connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._connections[db_path] = conn
+        return conn
+
+    def _get_timeseries_connection(self, db_path):
+        if db_path not in self._initialized:
+            self._init_timeseries_db(db_path)
+            self._initialized.add(db_path)
+        return self._get_connection(db_path)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._initialized.clear()
+
+    def _init_master_db(self):
+        conn = self._get_connection(self.master_db_path)
+        cursor = conn.cursor()
+        # This table is for static, slowly changing data
+        cursor.execute('''CREATE TABLE IF NOT EXISTS pcr_history (
+                            symbol TEXT,
+                            date TEXT,
+                            pcr REAL,
+                            call_oi INTEGER,
+                            put_oi INTEGER,
+                            PRIMARY KEY (symbol, date)
+                          )''')
+        conn.commit()
+
+    def _init_timeseries_db(self, db_path):
+        """Initializes tables in the monthly timeseries database."""
+        conn = self._get_connection(db_path)
+        cursor = conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS option_aggregates (
+                            symbol TEXT, date TEXT, timestamp TEXT, expiry TEXT,
+                            call_oi INTEGER, put_oi INTEGER, pcr REAL,
+                            PRIMARY KEY (symbol, date, timestamp)
+                          )''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS option_chain_details (
+                            symbol TEXT, date TEXT, timestamp TEXT, strike REAL,
+                            call_oi INTEGER, put_oi INTEGER, call_oi_chg INTEGER, put_oi_chg INTEGER,
+                            PRIMARY KEY (symbol, date, timestamp, strike)
+                          )''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS market_depth_history (
+                            timestamp INTEGER, symbol TEXT, rvol REAL, pcr REAL, adv_dec_ratio REAL,
+                            PRIMARY KEY (timestamp, symbol)
+                          )''')
+        conn.commit()
+
+    def save_snapshot(self, symbol, trading_date, timestamp, expiry, aggregates, details):
+        return self.save_snapshots([(symbol, trading_date, timestamp, expiry, aggregates, details)])
+
+    def save_snapshots(self, snapshots):
+        """
+        snapshots: list of (symbol, trading_date, timestamp, expiry, aggregates, details)
+        tuples, written in one transaction per monthly partition. Returns False if any
+        partition failed; that partition is rolled back, the others stay committed.
+        """
+        # Each snapshot goes to the partition of its own trading date
+        partitions = {}
+        for symbol, trading_date, timestamp, expiry, aggregates, details in snapshots:
+            aggregate_rows, detail_rows = partitions.setdefault(self._get_timeseries_db_path(trading_date), ([], []))
+            aggregate_rows.append((symbol, trading_date, timestamp, expiry,
+                                   aggregates['call_oi'], aggregates['put_oi'], aggregates['pcr']))
+            detail_rows.extend((symbol, trading_date, timestamp, float(strike),
+                                d['call_oi'], d['put_oi'], d['call_oi_chg'], d['put_oi_chg'])
+                               for strike, d in details.items())
+
+        ok = True
+        with self._lock:
+            for db_path, (aggregate_rows, detail_rows) in partitions.items():
+                conn = self._get_timeseries_connection(db_path)
+                try:
+                    conn.executemany("""INSERT OR REPLACE INTO option_aggregates
+                                        VALUES (?, ?, ?, ?, ?, ?, ?)""", aggregate_rows)
+                    conn.executemany("""INSERT OR REPLACE INTO option_chain_details
+                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", detail_rows)
+                    conn.commit()
+                except Exception as e:
+                    print(f"[DB ERROR] {e}")
+                    conn.rollback()
+                    ok = False
+        return ok
+
+    def save_market_depth(self, ts, symbol, rvol, pcr, ratio, trading_date=None):
+        with self._lock:
+            conn = self._get_timeseries_connection(self._get_timeseries_db_path(trading_date))
+            try:
+                conn.execute("INSERT OR REPLACE INTO market_depth_history VALUES (?, ?, ?, ?, ?)",
+                             (ts, symbol, rvol, pcr, ratio))
+                conn.commit()
+            except Exception as e:
+                print(f"[DB DEPTH ERROR] {e}")
+                conn.rollback()
+
+    def save_breadth(self, trading_date, timestamp, data):
+        # This data is transient and might not need historical persistence in this context
+        # If required, it should go into the timeseries DB.
+        # For now, this can be a no-op or write to a log.
+        pass
+
+    def get_latest_breadth(self):
+        # This would require querying the latest timeseries DB, which is complex.
+        # Market breadth is better handled live.
+        return None
+
+    def get_latest_aggregates(self, symbol):
+        if self.chain_db is not None:
+            row = self.chain_db.get_latest_aggregates(symbol)
+            if row:
+                return self._aggregate_row_to_dict((symbol,) + row[1:])
+        # Newest partition first, so the start of a month still sees last month's data
+        for db_path in reversed(self._get_partitions()):
+            with self._lock:
+                cursor = self._get_timeseries_connection(db_path).cursor()
+                cursor.execute("""SELECT * FROM option_aggregates
+                                  WHERE symbol=?
+                                  ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
+                row = cursor.fetchone()
+            if row:
+                return self._aggregate_row_to_dict(row)
+        return None
+
+    def _aggregate_row_to_dict(self, row):
+        return {
+            'symbol': row[0],
+            'date': row[1],
+            'timestamp': row[2],
+            'expiry': row[3],
+            'call_oi': row[4],
+            'put_oi': row[5],
+            'pcr': row[6]
+        }
+
+    def get_latest_chain(self, symbol):
+        if self.chain_db is not None:
+            chain = self.chain_db.get_latest_chain(symbol)
+            if chain:
+                return chain
+        for db_path in reversed(self._get_partitions()):
+            with self._lock:
+                cursor = self._get_timeseries_connection(db_path).cursor()
+                cursor.execute("""SELECT date, timestamp FROM option_chain_details
+                                  WHERE symbol=?
+                                  ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
+                last = cursor.fetchone()
+                if not last:
+                    continue
+
+                d, ts = last
+                cursor.execute("""SELECT * FROM option_chain_details
+                                  WHERE symbol=? AND date=? AND timestamp=?""", (symbol, d, ts))
+                rows = cursor.fetchall()
+
+            return [{
+                'strike': r[3], 'call_oi': r[4], 'put_oi': r[5],
+                'call_oi_chg': r[6], 'put_oi_chg': r[7]
+            } for r in rows]
+        return []
+
+    def query_range(self, part_sql, start_date, end_date, params=(), outer_sql="SELECT * FROM ({union})"):
+        """
+        Runs part_sql against every monthly partition touching [start_date, end_date]
+        as a single UNION ALL query. part_sql names tables as {db}.table and is run
+        with params in each partition; outer_sql wraps the union, e.g.
+        "SELECT date, AVG(pcr) FROM ({union}) GROUP BY date". Monthly partitions
+        only: the get_*_range readers add chain_db's rows.
+        """
+        paths = self._get_partitions(start_date, end_date)
+        if not paths: return []
+
+        conn = sqlite3.connect(":memory:", timeout=10, uri=True, isolation_level=None)
+        try:
+            max_attached = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            chunks = [paths[i:i + max_attached] for i in range(0, len(paths), max_attached)]
+            for n, chunk in enumerate(chunks):
+                aliases = []
+                for i, db_path in enumerate(chunk):
+                    alias = f"p{i}"
+                    conn.execute("ATTACH DATABASE ? AS " + alias, (f"file:{db_path}?mode=ro",))
+                    aliases.append(alias)
+                union = " UNION ALL ".join(part_sql.format(db=alias) for alias in aliases)
+                union_params = tuple(params) * len(aliases)
+                if len(chunks) == 1:
+                    return conn.execute(outer_sql.format(union=union), union_params).fetchall()
+
+                # More months than SQLite can attach at once: stage each chunk in a temp table
+                if n == 0:
+                    conn.execute(f"CREATE TEMP TABLE range_rows AS {union}", union_params)
+                else:
+                    conn.execute(f"INSERT INTO temp.range_rows {union}", union_params)
+                for alias in aliases:
+                    conn.execute("DETACH DATABASE " + alias)
+            return conn.execute(outer_sql.format(union="SELECT * FROM temp.range_rows")).fetchall()
+        finally:
+            conn.close()
+
+    def get_aggregates_range(self, symbol, start_date, end_date):
+        rows = self.query_range(
+            "SELECT * FROM {db}.option_aggregates WHERE symbol=? AND date BETWEEN ? AND ?",
+            start_date, end_date, (symbol, start_date, end_date),
+            outer_sql="SELECT * FROM ({union}) ORDER BY date, timestamp")
+        if self.chain_db is not None:
+            rows += [(symbol,) + r[1:] for r in self.chain_db.aggregates_range(symbol, start_date, end_date)]
+            rows.sort(key=lambda r: (r[1], r[2]))
+        return [self._aggregate_row_to_dict(r) for r in rows]
+
+    def get_daily_pcr_range(self, symbol, start_date, end_date):
+        """Per trading day: closing PCR/OI (last snapshot) plus the day's mean, min and max PCR."""
+        rows = self.query_range(
+            "SELECT date, timestamp, call_oi, put_oi, pcr FROM {db}.option_aggregates WHERE symbol=? AND date BETWEEN ? AND ?",
+            start_date, end_date, (symbol, start_date, end_date),
+            outer_sql="""SELECT date, pcr, call_oi, put_oi, avg_pcr, min_pcr, max_pcr FROM (
+                             SELECT date, pcr, call_oi, put_oi,
+                                    AVG(pcr) OVER day AS avg_pcr, MIN(pcr) OVER day AS min_pcr, MAX(pcr) OVER day AS max_pcr,
+                                    ROW_NUMBER() OVER (PARTITION BY date ORDER BY timestamp DESC) AS rn
+                             FROM ({union}) WINDOW day AS (PARTITION BY date))
+                         WHERE rn = 1 ORDER BY date""")
+        days = {r[0]: {
+            'date': r[0], 'close_pcr': r[1], 'call_oi': r[2], 'put_oi': r[3],
+            'avg_pcr': r[4], 'min_pcr': r[5], 'max_pcr': r[6]
+        } for r in rows}
+        if self.chain_db is not None:
+            by_date = {}
+            for r in self.chain_db.aggregates_range(symbol, start_date, end_date):
+                by_date.setdefault(r[1], []).append(r)
+            for day, minutes in by_date.items():
+                pcrs = [r[6] for r in minutes]
+                days[day] = {'date': day, 'close_pcr': minutes[-1][6], 'call_oi': minutes[-1][4], 'put_oi': minutes[-1][5],
+                             'avg_pcr': sum(pcrs) / len(pcrs), 'min_pcr': min(pcrs), 'max_pcr': max(pcrs)}
+        return [days[d] for d in sorted(days)]
+
+    def get_chain_range(self, symbol, start_date, end_date, strikes=None):
+        part_sql = "SELECT * FROM {db}.option_chain_details WHERE symbol=? AND date BETWEEN ? AND ?"
+        params = [symbol, start_date, end_date]
+        if strikes:
+            part_sql += f" AND strike IN ({','.join('?' * len(strikes))})"
+            params.extend(float(s) for s in strikes)
+        rows = self.query_range(part_sql, start_date, end_date, params,
+                                outer_sql="SELECT * FROM ({union}) ORDER BY date, timestamp, strike")
+        if self.chain_db is not None:
+            rows += self.chain_db.chain_range(symbol, start_date, end_date, strikes)
+            rows.sort(key=lambda r: (r[1], r[2], r[3]))
+        return [{
+            'date': r[1], 'timestamp': r[2], 'strike': r[3], 'call_oi': r[4], 'put_oi': r[5],
+            'call_oi_chg': r[6], 'put_oi_chg': r[7]
+        } for r in rows]
+
+    def save_daily_stats(self, symbol, trading_date, pcr, call_oi, put_oi):
+        with self._lock:
+            conn = self._get_connection(self.master_db_path)
+            try:
+                conn.execute("INSERT OR REPLACE INTO pcr_history VALUES (?, ?, ?, ?, ?)",
+                             (symbol, trading_date, pcr, call_oi, put_oi))
+                conn.commit()
+            except Exception as e:
+                print(f"[DB STATS ERROR] {e}")
+                conn.rollback()
+
+    def get_pcr_history(self, symbol, days=30):
+        with self._lock:
+            cursor = self._get_connection(self.master_db_path).cursor()
+            cursor.execute("SELECT * FROM pcr_history WHERE symbol=? ORDER BY date DESC LIMIT ?", (symbol, days))
+            return cursor.fetchall()
@@ -1,7 +1,11 @@
 import sqlite3
 import pandas as pd
-import sys
+import numpy as np
+import argparse
+import json
+import os
 from datetime import datetime
+from option_store import OptionStore
 
 def export_to_csv(date_str, output_file=None):
     """
@@ -54,10 +58,92 @@ def export_to_csv(date_str, output_file=None):
         if 'conn' in locals():
             conn.close()
 
+def _strike_label(offset):
+    return "ATM" if offset == 0 else f"ATM{offset:+d}"
+
+def build_wide_frame(market_df, option_df, strike_gap=None, strike_range=7):
+    """
+    Pivots one symbol-day of long option rows into one row per minute with
+    CE/PE price, OI and OI-change columns per strike offset from that minute's ATM.
+    market_df: timestamp, spot_price, total_pcr
+    option_df: timestamp, strike_price, option_type, price, oi, oi_change
+    """
+    if option_df.empty or market_df.empty:
+        return pd.DataFrame()
+
+    if not strike_gap:
+        strikes = np.unique(option_df['strike_price'].to_numpy())
+        strike_gap = np.diff(strikes).min() if len(strikes) > 1 else 1
+
+    market_df = market_df.dropna(subset=['spot_price'])
+    market_df = market_df.assign(atm=(market_df['spot_price'] / strike_gap).round() * strike_gap)
+    df = option_df.merge(market_df[['timestamp', 'atm']], on='timestamp', how='inner')
+    df['offset'] = ((df['strike_price'] - df['atm']) / strike_gap).round().astype(int)
+    df = df[df['offset'].abs() <= strike_range]
+
+    wide = df.pivot_table(observed=True, index='timestamp', columns=['option_type', 'offset'],
+                          values=['price', 'oi', 'oi_change'], aggfunc='last')
+    wide = wide.reorder_levels([1, 2, 0], axis=1).sort_index(axis=1, level=[0, 1])
+    wide.columns = [f"{opt_type}_{_strike_label(offset)}_{field}" for opt_type, offset, field in wide.columns]
+
+    market = market_df.set_index('timestamp')[['spot_price', 'atm', 'total_pcr']]
+    return market.join(wide, how='inner').reset_index()
+
+def export_wide(date_str, symbol=None, output_file=None, strike_range=7, db_file="options_data.db", config_path="config.json"):
+    """
+    Wide export: one row per minute per symbol-day. Returns {symbol: DataFrame};
+    with output_file (or output_file=True for default names) also writes each
+    frame to disk, as Parquet when the name ends in .parquet and CSV otherwise.
+    """
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            config = json.load(f)
+    gaps = config.get("strike_gaps", {})
+
+    store = OptionStore(db_file)
+    frames = {}
+    symbols = [symbol] if symbol else store.get_symbols(date_str, date_str)
+    for sym in symbols:
+        market_df = store.get_market(sym, date_str, date_str)
+        option_df = store.get_chain(sym, date_str, date_str)
+        if option_df.empty: continue
+
+        # Keep the expiry with the most rows (the near-month/near-week contract)
+        option_df = option_df[option_df['expiry_date'] == option_df['expiry_date'].value_counts().idxmax()]
+        clean_symbol = sym.split('|')[-1]
+        frames[sym] = build_wide_frame(market_df, option_df, gaps.get(clean_symbol), strike_range)
+
+    if output_file:
+        for sym, df in frames.items():
+            clean_symbol = sym.split('|')[-1]
+            if output_file is True:
+                path = f"options_wide_{clean_symbol}_{date_str}.csv"
+            elif len(frames) > 1:
+                base, ext = os.path.splitext(output_file)
+                path = f"{base}_{clean_symbol}{ext}"
+            else:
+                path = output_file
+            if path.endswith(".parquet"):
+                df.to_parquet(path, index=False)
+            else:
+                df.to_csv(path, index=False)
+            print(f"Successfully exported {len(df)} minutes x {len(df.columns)} columns to {path}")
+
+    if not frames:
+        print(f"No data found for date: {date_str}")
+    return frames
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python export_data.py YYYY-MM-DD [output_filename.csv]")
+    parser = argparse.ArgumentParser(description="Export collected data for a date")
+    parser.add_argument('date', help='YYYY-MM-DD')
+    parser.add_argument('output', nargs='?', default=None, help='Output file (.csv, or .parquet with --wide)')
+    parser.add_argument('--wide', action='store_true', help='One row per minute with CE/PE columns per strike offset from ATM')
+    parser.add_argument('--symbol', default=None, help='Limit the wide export to one symbol, e.g. NSE|INDEX|NIFTY')
+    parser.add_argument('--strikes', type=int, default=7, help='Strikes on each side of ATM in the wide export')
+    args = parser.parse_args()
+
+    if args.wide:
+        export_wide(args.date, symbol=args.symbol, output_file=args.output or True, strike_range=args.strikes)
     else:
-        date = sys.argv[1]
-        out = sys.argv[2] if len(sys.argv) > 2 else None
-        export_to_csv(date, out)
+        export_to_csv(args.date, args.output)
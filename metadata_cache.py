@@ -0,0 +1,84 @@
+import sqlite3
+import time
+from datetime import date
+
+class MetadataCache:
+    """
+    Persistent Trendlyne metadata (stock IDs and expiry dates) shared by every
+    process that uses TrendlyneClient. Entries expire after their TTL; an
+    expiry list is also dropped as soon as its nearest expiry has passed.
+    Every expiry ever listed is kept so past trading dates can be resolved.
+    """
+    def __init__(self, db_path="trendlyne_cache.db", stock_id_ttl_days=30, expiry_ttl_hours=12):
+        self.db_path = db_path
+        self.stock_id_ttl = stock_id_ttl_days * 86400
+        self.expiry_ttl = expiry_ttl_hours * 3600
+        self._create_tables()
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _create_tables(self):
+        with self._get_connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stock_ids (
+                    symbol TEXT PRIMARY KEY,
+                    stock_id INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            ''')
+            # Current listing per stock: when it was fetched and its nearest expiry
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS expiry_lists (
+                    stock_id INTEGER PRIMARY KEY,
+                    fetched_at REAL NOT NULL,
+                    nearest_expiry TEXT
+                )
+            ''')
+            # Every expiry seen for a stock, including ones that have since passed
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS expiries (
+                    stock_id INTEGER NOT NULL,
+                    expiry TEXT NOT NULL,
+                    PRIMARY KEY (stock_id, expiry)
+                )
+            ''')
+            conn.commit()
+
+    def get_stock_id(self, symbol):
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT stock_id, fetched_at FROM stock_ids WHERE symbol=?", (symbol,)).fetchone()
+        if row and time.time() - row[1] < self.stock_id_ttl:
+            return row[0]
+        return None
+
+    def put_stock_id(self, symbol, stock_id):
+        with self._get_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO stock_ids VALUES (?, ?, ?)", (symbol, stock_id, time.time()))
+
+    def get_expiries(self, stock_id, today=None):
+        """Upcoming expiries (YYYY-MM-DD, ascending), or None if the cached listing is stale."""
+        today = today or date.today().strftime("%Y-%m-%d")
+        with self._get_connection() as conn:
+            listing = conn.execute("SELECT fetched_at, nearest_expiry FROM expiry_lists WHERE stock_id=?", (stock_id,)).fetchone()
+            if not listing: return None
+            fetched_at, nearest_expiry = listing
+            if time.time() - fetched_at >= self.expiry_ttl or (nearest_expiry and nearest_expiry < today):
+                conn.execute("DELETE FROM expiry_lists WHERE stock_id=?", (stock_id,))
+                return None
+            rows = conn.execute("SELECT expiry FROM expiries WHERE stock_id=? AND expiry >= ? ORDER BY expiry",
+                                (stock_id, today)).fetchall()
+        return [r[0] for r in rows]
+
+    def put_expiries(self, stock_id, expiries):
+        with self._get_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO expiry_lists VALUES (?, ?, ?)",
+                         (stock_id, time.time(), min(expiries) if expiries else None))
+            conn.executemany("INSERT OR IGNORE INTO expiries VALUES (?, ?)", [(stock_id, e) for e in expiries])
+
+    def expiry_for_date(self, stock_id, date_str):
+        """Nearest known expiry on or after date_str (YYYY-MM-DD)."""
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT MIN(expiry) FROM expiries WHERE stock_id=? AND expiry >= ?",
+                               (stock_id, date_str)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import pandas as pd
+from collections import OrderedDict
+from datetime import datetime, timedelta, date
+
+CHAIN_COLUMNS = "timestamp, strike_price, expiry_date, option_type, price, oi, oi_change"
+MARKET_COLUMNS = "timestamp, spot_price, open, high, low, close, volume, total_pcr, pcr_change"
+
+class OptionStore:
+    """
+    Read API over the collector DB. Each query is served from whole
+    symbol-days that are decoded once from an indexed range read and kept in
+    an LRU capped at cache_bytes. Today's data is still being written and is never cached.
+    Returned frames may share memory with the cache; treat them as read-only.
+    """
+    def __init__(self, db_name="options_data.db", cache_bytes=256 * 1024 * 1024):
+        self.db_name = db_name
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_name)
+
+    def _read_day(self, table, symbol, day):
+        columns = CHAIN_COLUMNS if table == "option_data" else MARKET_COLUMNS
+        order = "timestamp, expiry_date, strike_price, option_type" if table == "option_data" else "timestamp"
+        next_day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        conn = self._get_connection()
+        try:
+            df = pd.read_sql_query(
+                f"SELECT {columns} FROM {table} WHERE symbol=? AND timestamp >= ? AND timestamp < ? ORDER BY {order}",
+                conn, params=(symbol, day, next_day))
+        finally:
+            conn.close()
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        if table == "option_data":
+            df['expiry_date'] = df['expiry_date'].astype('category')
+            df['option_type'] = df['option_type'].astype('category')
+        return df
+
+    def _get_day(self, table, symbol, day):
+        key = (table, symbol, day)
+        with self._lock:
+            df = self._cache.get(key)
+            if df is not None:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return df
+            self.stats['misses'] += 1
+
+        df = self._read_day(table, symbol, day)
+        if day >= date.today().strftime("%Y-%m-%d"):
+            return df
+
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key not in self._cache and size <= self.cache_bytes:
+                self._cache[key] = df
+                self._cached_bytes += size
+                while self._cached_bytes > self.cache_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cached_bytes -= int(evicted.memory_usage(deep=True).sum())
+                    self.stats['evictions'] += 1
+        return df
+
+    def _get_range(self, table, symbol, start, end):
+        """start/end: 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM[:SS]', both inclusive (a bare end date covers that whole day)."""
+        first = datetime.strptime(start[:10], "%Y-%m-%d")
+        last = datetime.strptime(end[:10], "%Y-%m-%d")
+        if last < first:
+            raise ValueError(f"end {end!r} is before start {start!r}")
+        days = [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((last - first).days + 1)]
+        day_frames = [self._get_day(table, symbol, d) for d in days]
+        frames = [df for df in day_frames if not df.empty] or day_frames[:1]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+        mask = df['timestamp'] >= pd.Timestamp(start)
+        if len(end) > 10:
+            mask &= df['timestamp'] <= pd.Timestamp(end)
+        return df[mask] if not mask.all() else df
+
+    def _as_output(self, df, as_arrays):
+        if as_arrays:
+            return {col: df[col].to_numpy() for col in df.columns}
+        return df.reset_index(drop=True)
+
+    def get_chain(self, symbol, start, end, strikes=None, expiry=None, as_arrays=False):
+        """
+        Option rows (timestamp, strike_price, expiry_date, option_type, price, oi, oi_change)
+        as a DataFrame, or a dict of NumPy column arrays with as_arrays=True.
+        """
+        df = self._get_range("option_data", symbol, start, end)
+        if strikes is not None:
+            df = df[df['strike_price'].isin(strikes)]
+        if expiry is not None:
+            df = df[df['expiry_date'] == expiry]
+        return self._as_output(df, as_arrays)
+
+    def get_market(self, symbol, start, end, as_arrays=False):
+        """Spot/OHLCV/PCR rows for symbol in [start, end]."""
+        return self._as_output(self._get_range("market_data", symbol, start, end), as_arrays)
+
+    def get_symbols(self, start, end):
+        next_day = (datetime.strptime(end[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        conn = self._get_connection()
+        try:
+            rows = conn.execute("SELECT DISTINCT symbol FROM market_data WHERE timestamp >= ? AND timestamp < ?",
+                                (start[:10], next_day)).fetchall()
+        finally:
+            conn.close()
+        return [r[0] for r in rows]
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
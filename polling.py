@@ -0,0 +1,85 @@
+"""
+Change-driven polling cadence for the collector. Each symbol is re-polled on
+its own interval: sub-minute while the chain is moving (the open, expiry days,
+fast spot moves), stretched out while NSE keeps serving the same snapshot.
+"""
+import json
+import hashlib
+
+def snapshot_hash(market_record, option_entries):
+    """Digest of what a snapshot would store, ignoring our own collection timestamp."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((market_record.get('spot_price'), market_record.get('total_pcr'))).encode())
+    for r in sorted(option_entries, key=lambda r: (r['strike_price'], r['option_type'])):
+        h.update(repr((r['strike_price'], r['option_type'], r.get('price'), r.get('oi'), r.get('oi_change'))).encode())
+    return h.hexdigest()
+
+def snapshot_bytes(market_record, option_entries):
+    return len(json.dumps([market_record, option_entries], default=float))
+
+class AdaptivePoller:
+    """
+    Per-symbol poll schedule. observe() is fed every fetched snapshot and
+    decides whether it is new (worth storing) and when to poll next.
+    Times are plain epoch seconds so the schedule can be replayed offline.
+    """
+    def __init__(self, min_interval=15, base_interval=60, max_interval=120, backoff=1.5, active_move_bps=5.0):
+        """
+        min_interval: cadence while active
+        base_interval: cadence after an ordinary change
+        max_interval: ceiling while the chain stays unchanged
+        active_move_bps: spot move since the last stored snapshot that counts as active
+        """
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.active_move_bps = active_move_bps
+        self.state = {}
+        self.stats = {}
+
+    def _symbol_stats(self, symbol):
+        return self.stats.setdefault(symbol, {'fetches': 0, 'stored': 0, 'skipped': 0, 'bytes_stored': 0})
+
+    def due(self, symbols, now):
+        return [s for s in symbols if self.state.get(s, {}).get('due', 0) <= now]
+
+    def next_due(self, symbols):
+        return min((self.state.get(s, {}).get('due', 0) for s in symbols), default=0)
+
+    def observe(self, symbol, now, nse_timestamp, content_hash, spot, boost=False, size=0):
+        """
+        Records one fetched snapshot and schedules the next poll. Returns True
+        when it differs from the last stored one (by NSE timestamp and content).
+        boost: force the active cadence (session open, expiry day)
+        """
+        st = self.state.setdefault(symbol, {'interval': self.base_interval})
+        stats = self._symbol_stats(symbol)
+        stats['fetches'] += 1
+
+        # NSE re-serving the same snapshot keeps its timestamp; a new timestamp with identical content is idle too
+        same_snapshot = nse_timestamp is not None and nse_timestamp == st.get('nse_timestamp')
+        changed = not same_snapshot and content_hash != st.get('hash')
+        st['nse_timestamp'] = nse_timestamp
+        if changed:
+            last_spot = st.get('spot')
+            moved = bool(last_spot and spot and abs(spot / last_spot - 1) * 1e4 >= self.active_move_bps)
+            st['interval'] = self.min_interval if boost or moved else self.base_interval
+            st.update(hash=content_hash, spot=spot)
+            stats['stored'] += 1
+            stats['bytes_stored'] += size
+        else:
+            st['interval'] = min(self.max_interval, max(st['interval'], self.min_interval) * self.backoff)
+            if boost:
+                st['interval'] = min(st['interval'], self.base_interval)
+            stats['skipped'] += 1
+        st['due'] = now + st['interval']
+        return changed
+
+    def report(self, symbol, session_minutes):
+        """One-line comparison against fixed once-a-minute polling over session_minutes."""
+        s = self._symbol_stats(symbol)
+        per_snapshot = s['bytes_stored'] / s['stored'] if s['stored'] else 0
+        fixed_bytes = per_snapshot * session_minutes
+        return (f"[POLL] {symbol}: fetches={s['fetches']} stored={s['stored']} skipped={s['skipped']} "
+                f"bytes={s['bytes_stored']} | fixed 60s: fetches={session_minutes} bytes~{fixed_bytes:.0f}")
@@ -0,0 +1,187 @@
+"""
+On-demand profiling for long-running loops (collector, backfills). Work is
+wrapped in `with profiler.cycle(label):`; requests are picked up between
+cycles, so collection never stops:
+
+    kill -USR1 <pid>        cProfile the next N cycles
+    kill -USR2 <pid>        tracemalloc snapshot with the top allocation sites
+
+Where signals are unavailable (Windows), write commands to <name>.profile.cmd:
+    profile [N] | snapshot | trace FILE | trace off | tracemalloc off
+"""
+import os
+import io
+import json
+import time
+import signal
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+class Profiler:
+    """
+    cProfile covers only the thread running the cycles (the write-behind and
+    session threads are not included); tracemalloc covers the whole process.
+    """
+    def __init__(self, name, profile_dir="profiles", profile_cycles=0, trace_path=None,
+                 default_cycles=5, top=15, install_signals=True):
+        """
+        profile_cycles: cProfile the first N cycles from startup
+        trace_path: append one JSON line of timings per cycle to this file
+        default_cycles: cycles profiled per SIGUSR1 / bare 'profile' command
+        """
+        self.name = name
+        self.profile_dir = profile_dir
+        self.default_cycles = default_cycles
+        self.top = top
+        self.control_path = f"{name}.profile.cmd"
+        self._profile_pending = profile_cycles
+        self._profile_remaining = 0
+        self._profile = None
+        self._snapshot_requested = False
+        self._last_snapshot = None
+        self._trace = None
+        self._cycle = 0
+        self._steps = None
+        if trace_path:
+            self.start_trace(trace_path)
+        if install_signals:
+            self._install_signals()
+
+    def _install_signals(self):
+        if threading.current_thread() is not threading.main_thread(): return
+        # Handlers only set flags; the work happens at the next cycle boundary
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.request_profile())
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, lambda *_: self.request_snapshot())
+
+    def request_profile(self, cycles=None):
+        self._profile_pending = cycles or self.default_cycles
+
+    def request_snapshot(self):
+        self._snapshot_requested = True
+
+    def start_trace(self, path):
+        self.stop_trace()
+        self._trace = open(path, "a")
+        print(f"[Profiler] Writing per-cycle timings to {path}")
+
+    def stop_trace(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def _read_control(self):
+        if not os.path.exists(self.control_path): return
+        try:
+            with open(self.control_path, "r") as f:
+                commands = f.read().splitlines()
+            os.remove(self.control_path)
+        except OSError as e:
+            print(f"[Profiler] Could not read {self.control_path}: {e}")
+            return
+        for line in commands:
+            parts = line.split()
+            if not parts: continue
+            # A bad command is reported and skipped; it must never stop the collection cycle
+            try:
+                if parts[0] == "profile":
+                    self.request_profile(int(parts[1]) if len(parts) > 1 else None)
+                elif parts[0] == "snapshot":
+                    self.request_snapshot()
+                elif parts[0] == "trace" and len(parts) > 1:
+                    self.stop_trace() if parts[1] == "off" else self.start_trace(parts[1])
+                elif parts[:2] == ["tracemalloc", "off"]:
+                    tracemalloc.stop()
+                    self._last_snapshot = None
+                else:
+                    print(f"[Profiler] Unknown command: {line}")
+            except (ValueError, OSError) as e:
+                print(f"[Profiler] Ignoring {line!r}: {e}")
+
+    @contextmanager
+    def cycle(self, label=""):
+        self._read_control()
+        if self._profile_pending and self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile_remaining = self._profile_pending
+            self._profile_pending = 0
+            print(f"[Profiler] Profiling the next {self._profile_remaining} cycles")
+        if self._snapshot_requested and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+        self._cycle += 1
+        self._steps = {}
+        started_at = datetime.now()
+        start = time.perf_counter()
+        if self._profile is not None: self._profile.enable()
+        try:
+            yield self
+        finally:
+            if self._profile is not None: self._profile.disable()
+            elapsed = time.perf_counter() - start
+            if self._trace is not None:
+                self._trace.write(json.dumps({'cycle': self._cycle, 'label': label, 'start': started_at.isoformat(),
+                                              'seconds': round(elapsed, 6),
+                                              'steps': {k: round(v, 6) for k, v in self._steps.items()}}) + "\n")
+                self._trace.flush()
+            self._steps = None
+            if self._profile is not None:
+                self._profile_remaining -= 1
+                if self._profile_remaining <= 0:
+                    self._dump_profile()
+            if self._snapshot_requested:
+                self._snapshot()
+
+    @contextmanager
+    def step(self, name):
+        """Times a named part of the current cycle (summed if repeated) for the trace."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._steps is not None:
+                self._steps[name] = self._steps.get(name, 0.0) + time.perf_counter() - start
+
+    def _output_path(self, kind, ext):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, f"{self.name}_{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_c{self._cycle}.{ext}")
+
+    def _dump_profile(self):
+        profile, self._profile = self._profile, None
+        path = self._output_path("cprofile", "prof")
+        profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+        print(f"[Profiler] Saved {path} (open with python -m pstats)\n{out.getvalue()}")
+
+    def _snapshot(self):
+        self._snapshot_requested = False
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"tracemalloc at cycle {self._cycle}: current={current / 2 ** 20:.1f} MB peak={peak / 2 ** 20:.1f} MB",
+                 f"Top {self.top} allocation sites:"]
+        lines += [f"  {stat}" for stat in snapshot.statistics("lineno")[:self.top]]
+        if self._last_snapshot is not None:
+            lines.append(f"Top {self.top} changes since the previous snapshot:")
+            lines += [f"  {stat}" for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:self.top]]
+        self._last_snapshot = snapshot
+
+        path = self._output_path("tracemalloc", "txt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print("[Profiler] " + "\n".join(lines) + f"\n[Profiler] Saved {path}")
+
+def add_profiling_args(parser):
+    group = parser.add_argument_group("profiling (also: SIGUSR1/SIGUSR2 or <name>.profile.cmd while running)")
+    group.add_argument('--profile-cycles', type=int, default=0, metavar='N', help='cProfile the first N cycles')
+    group.add_argument('--trace-cycles', metavar='FILE', help='Append per-cycle timings to FILE (JSON lines)')
+    group.add_argument('--profile-dir', default="profiles", help='Where .prof and tracemalloc reports go')
+
+def profiler_from_args(name, args):
+    return Profiler(name, args.profile_dir, args.profile_cycles, args.trace_cycles)
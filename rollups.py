@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+# (name, minutes, source level). Each level is built from the one before it,
+# so refreshing a daily bucket reads ~26 rows per series instead of the raw day.
+LEVELS = (
+    ('5m', 5, None),
+    ('15m', 15, '5m'),
+    ('1d', None, '15m'),
+)
+
+def bucket_start(timestamp, minutes):
+    """'YYYY-MM-DD HH:MM:SS' -> start of its bucket ('YYYY-MM-DD' for daily)."""
+    if minutes is None:
+        return timestamp[:10]
+    minute = int(timestamp[14:16]) // minutes * minutes
+    return f"{timestamp[:14]}{minute:02d}:00"
+
+def bucket_end(start, minutes):
+    if minutes is None:
+        return (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return (datetime.strptime(start, "%Y-%m-%d %H:%M:%S") + timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
+
+def bucket_sql(column, minutes):
+    if minutes is None:
+        return f"substr({column}, 1, 10)"
+    return (f"strftime('%Y-%m-%d %H:', {column}) || "
+            f"printf('%02d', CAST(strftime('%M', {column}) AS INTEGER) / {minutes} * {minutes}) || ':00'")
+
+class RollupManager:
+    """
+    Keeps 5m/15m/daily aggregates of option_data and market_data up to date in
+    the same DB: premium OHLC, last OI and summed OI change per strike, and
+    spot OHLC, volume and last PCR per symbol. Buckets are recomputed from
+    their source rows, so updates are idempotent and safe to replay.
+    """
+    def __init__(self, db, option_db=None):
+        """
+        db: Database holding option_data/market_data
+        option_db: OptionDatabase whose pcr_history is filled by finalize_day
+        """
+        self.db = db
+        self.option_db = option_db
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.db._get_connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS option_rollups (
+                    interval TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    strike_price REAL NOT NULL,
+                    expiry_date TEXT NOT NULL,
+                    option_type TEXT NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    oi REAL,
+                    oi_change REAL,
+                    samples INTEGER,
+                    PRIMARY KEY (interval, symbol, bucket, strike_price, expiry_date, option_type)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS market_rollups (
+                    interval TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume REAL,
+                    pcr REAL,
+                    samples INTEGER,
+                    PRIMARY KEY (interval, symbol, bucket)
+                )
+            ''')
+            conn.commit()
+
+    def _refresh(self, conn, level, symbol, start, end):
+        """Recomputes every `level` bucket of symbol in [start, end) from its source level."""
+        name, minutes, source = level
+        if source is None:
+            option_src = f'''
+                SELECT timestamp AS ts, {bucket_sql('timestamp', minutes)} AS bucket, symbol, strike_price,
+                       expiry_date, option_type, price AS open, price AS high, price AS low, price AS close,
+                       oi, oi_change, 1 AS samples
+                FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?'''
+            market_src = f'''
+                SELECT timestamp AS ts, {bucket_sql('timestamp', minutes)} AS bucket, symbol,
+                       COALESCE(open, spot_price) AS open, COALESCE(high, spot_price) AS high,
+                       COALESCE(low, spot_price) AS low, COALESCE(close, spot_price) AS close,
+                       volume, total_pcr AS pcr, 1 AS samples
+                FROM market_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?'''
+            params = (symbol, start, end)
+        else:
+            option_src = f'''
+                SELECT bucket AS ts, {bucket_sql('bucket', minutes)} AS bucket, symbol, strike_price,
+                       expiry_date, option_type, open, high, low, close, oi, oi_change, samples
+                FROM option_rollups WHERE interval=? AND symbol=? AND bucket >= ? AND bucket < ?'''
+            market_src = f'''
+                SELECT bucket AS ts, {bucket_sql('bucket', minutes)} AS bucket, symbol,
+                       open, high, low, close, volume, pcr, samples
+                FROM market_rollups WHERE interval=? AND symbol=? AND bucket >= ? AND bucket < ?'''
+            params = (source, symbol, start, end)
+
+        conn.execute(f'''
+            INSERT OR REPLACE INTO option_rollups
+            SELECT DISTINCT ?, bucket, symbol, strike_price, expiry_date, option_type,
+                   FIRST_VALUE(open) OVER w, MAX(high) OVER w, MIN(low) OVER w, LAST_VALUE(close) OVER w,
+                   LAST_VALUE(oi) OVER w, SUM(oi_change) OVER w, SUM(samples) OVER w
+            FROM ({option_src})
+            WINDOW w AS (PARTITION BY bucket, strike_price, expiry_date, option_type ORDER BY ts
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        ''', (name,) + params)
+        conn.execute(f'''
+            INSERT OR REPLACE INTO market_rollups
+            SELECT DISTINCT ?, bucket, symbol,
+                   FIRST_VALUE(open) OVER w, MAX(high) OVER w, MIN(low) OVER w, LAST_VALUE(close) OVER w,
+                   SUM(volume) OVER w, LAST_VALUE(pcr) OVER w, SUM(samples) OVER w
+            FROM ({market_src})
+            WINDOW w AS (PARTITION BY bucket ORDER BY ts
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        ''', (name,) + params)
+
+    def update_minute(self, symbol, timestamp):
+        """Refreshes the 5m, 15m and daily buckets containing a freshly written minute."""
+        with self.db._get_connection() as conn:
+            for level in LEVELS:
+                start = bucket_start(timestamp, level[1])
+                self._refresh(conn, level, symbol, start, bucket_end(start, level[1]))
+            conn.commit()
+
+    def rebuild(self, start_date, end_date, symbols=None):
+        """Recomputes all rollups for trading dates start_date..end_date ('YYYY-MM-DD')."""
+        end = bucket_end(end_date, None)
+        with self.db._get_connection() as conn:
+            if symbols is None:
+                symbols = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT symbol FROM market_data WHERE timestamp >= ? AND timestamp < ?", (start_date, end))]
+            for symbol in symbols:
+                conn.execute("DELETE FROM option_rollups WHERE symbol=? AND bucket >= ? AND bucket < ?", (symbol, start_date, end))
+                conn.execute("DELETE FROM market_rollups WHERE symbol=? AND bucket >= ? AND bucket < ?", (symbol, start_date, end))
+                for level in LEVELS:
+                    self._refresh(conn, level, symbol, start_date, end)
+            conn.commit()
+        return symbols
+
+    def finalize_day(self, trading_date, symbols=None):
+        """
+        Writes the day's closing CE/PE OI (from the last chain stored that day) into
+        pcr_history for every symbol with option rows that day. The PCR is the day's
+        last market_data.total_pcr, the same filtered-chain figure the collector
+        stores each minute; symbols without market rows (Trendlyne-only) get the
+        PCR of those closing totals.
+        """
+        if self.option_db is None: return
+        end = bucket_end(trading_date, None)
+        rows = []
+        with self.db._get_connection() as conn:
+            day_symbols = [r[0] for r in conn.execute(
+                "SELECT DISTINCT symbol FROM option_data WHERE timestamp >= ? AND timestamp < ?", (trading_date, end))]
+            for symbol in day_symbols:
+                if symbols and symbol not in symbols: continue
+                last = conn.execute("SELECT MAX(timestamp) FROM option_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?",
+                                    (symbol, trading_date, end)).fetchone()[0]
+                call_oi, put_oi = conn.execute('''
+                    SELECT TOTAL(CASE WHEN option_type = 'CE' THEN oi END), TOTAL(CASE WHEN option_type = 'PE' THEN oi END)
+                    FROM option_data WHERE symbol=? AND timestamp=?
+                ''', (symbol, last)).fetchone()
+                market = conn.execute('''
+                    SELECT total_pcr FROM market_data WHERE symbol=? AND timestamp >= ? AND timestamp < ?
+                    AND total_pcr IS NOT NULL ORDER BY timestamp DESC LIMIT 1
+                ''', (symbol, trading_date, end)).fetchone()
+                pcr = market[0] if market else (round(put_oi / call_oi, 4) if call_oi else None)
+                rows.append((symbol, pcr, call_oi, put_oi))
+
+        for symbol, pcr, call_oi, put_oi in rows:
+            self.option_db.save_daily_stats(symbol, trading_date, pcr, call_oi, put_oi)
+        return len(rows)
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from database import Database, OptionDatabase
+
+    if len(sys.argv) < 3:
+        print("Usage: python rollups.py START_DATE END_DATE  (YYYY-MM-DD)")
+    else:
+        with open("config.json", "r") as f:
+            config = json.load(f)
+        manager = RollupManager(Database(config.get("db_name", "options_data.db")),
+                                OptionDatabase(config.get("master_db_name", "sos_master_data.db")))
+        symbols = manager.rebuild(sys.argv[1], sys.argv[2])
+        day = datetime.strptime(sys.argv[1], "%Y-%m-%d")
+        while day.strftime("%Y-%m-%d") <= sys.argv[2]:
+            manager.finalize_day(day.strftime("%Y-%m-%d"))
+            day += timedelta(days=1)
+        print(f"Rebuilt rollups for {len(symbols)} symbols from {sys.argv[1]} to {sys.argv[2]}")
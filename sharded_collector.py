@@ -0,0 +1,216 @@
+"""
+Sharded collector for the full F&O universe. Worker processes each own a
+slice of the symbols and share one cross-process NSE request budget
+(nse_requests_per_second for the whole host); every collected row goes through
+a queue to a single writer process that owns the database. The parent process
+keeps the trading calendar cache fresh for all of them.
+"""
+import math
+import time
+import signal
+import json
+import argparse
+import multiprocessing
+from queue import Empty, Full
+from datetime import datetime, timedelta
+from clients import NSEClient, RateLimiter
+from collector import DataCollector
+from profiling import Profiler
+from database import Database, OptionDatabase
+from rollups import RollupManager
+from trading_calendar import TradingCalendar
+from write_behind import WriteBehindWriter
+
+def load_universe(config):
+    """config["symbols"] plus config["fno_symbols"]; "auto" pulls the stock F&O list from NSE."""
+    symbols = list(config.get("symbols", ["NSE|INDEX|NIFTY", "NSE|INDEX|BANKNIFTY"]))
+    fno_symbols = config.get("fno_symbols", [])
+    if fno_symbols == "auto":
+        nse = NSEClient()
+        fno_symbols = [f"NSE|EQ|{s}" for s in nse.get_fno_underlyings()]
+        nse.close()
+    for symbol in fno_symbols:
+        if symbol not in symbols:
+            symbols.append(symbol)
+    return symbols
+
+def max_symbols(config):
+    """Symbols the shared budget can fetch every minute, leaving room for fallback requests."""
+    return max(1, int(config.get("nse_requests_per_second", 3) * 60 * config.get("nse_budget_headroom", 0.8)))
+
+def fit_universe(config, symbols):
+    """The symbols the budget covers once a minute; the rest (config "symbols" come first) are dropped with a warning."""
+    limit = max_symbols(config)
+    if len(symbols) > limit:
+        print(f"[Sharded] {len(symbols)} symbols exceed the {limit} a {config.get('nse_requests_per_second', 3)} "
+              f"requests/s budget fetches per minute; collecting the first {limit}")
+    return symbols[:limit]
+
+def shard_count(config, symbol_count, shards=None):
+    """
+    Requested shards (--shards, config "shards" or CPU count), capped at the number
+    that keeps the shared budget busy: one shard issues a request about every
+    nse_fetch_seconds, so more shards than that only queue on the limiter.
+    """
+    requested = shards or config.get("shards", multiprocessing.cpu_count())
+    useful = math.ceil(config.get("nse_requests_per_second", 3) * config.get("nse_fetch_seconds", 1.0))
+    return max(1, min(requested, useful, symbol_count))
+
+def refresh_calendar(calendar):
+    if not calendar.is_stale(): return
+    nse = NSEClient(keep_alive=False)
+    try:
+        calendar.refresh(nse)
+    finally:
+        nse.close()
+
+def worker_main(shard_id, symbols, config_path, queue, rate_limiter, stop):
+    # Ctrl-C reaches the whole process group; the parent stops the shards through `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Each worker process answers its own SIGUSR1/SIGUSR2 and shard-N.profile.cmd
+    collector = DataCollector(config_path, symbols=symbols, rate_limiter=rate_limiter,
+                              sink=lambda market, options: queue.put(('data', market, options)),
+                              profiler=Profiler(f"shard-{shard_id}"), refresh_calendar=False)
+    print(f"[Shard {shard_id}] {len(symbols)} symbols")
+
+    while not stop.is_set():
+        # Every shard works on the same minute slot so coverage can be tallied per minute
+        now = datetime.now()
+        cycle = now.replace(second=0, microsecond=0)
+        collector.refresh_calendar_async()
+        if collector.is_market_open():
+            with collector.profiler.cycle(cycle.strftime("%H:%M")):
+                ok = collector.process_symbols(symbols)
+            queue.put(('done', shard_id, cycle.strftime("%Y-%m-%d %H:%M"), ok, len(symbols)))
+
+        next_cycle = cycle + timedelta(minutes=1)
+        stop.wait(max(0, (next_cycle - datetime.now()).total_seconds()))
+    print(f"[Shard {shard_id}] Stopped")
+
+def writer_main(config_path, queue, shard_count):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    db = Database(config.get("db_name", "options_data.db"))
+    rollups = RollupManager(db, OptionDatabase(config.get("master_db_name", "sos_master_data.db")))
+    writer = WriteBehindWriter(db, rollups, journal_path=config.get("sharded_journal_path", "sharded_journal.jsonl"))
+    calendar = TradingCalendar.from_config(config)
+    finalized_date = None
+
+    def finalize_if_closed():
+        nonlocal finalized_date
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        if finalized_date == today or not calendar.is_session_over(now):
+            return
+        writer.flush()
+        rollups.finalize_day(today)
+        finalized_date = today
+        print(f"[Writer] Saved daily PCR history for {today}")
+
+    # cycle -> {shard_id: (ok, total)}
+    coverage = {}
+    while True:
+        try:
+            item = queue.get(timeout=60)
+        except Empty:
+            if calendar.is_stale():
+                calendar.reload()
+            finalize_if_closed()
+            continue
+        if item is None:
+            # Shards have stopped: everything they sent is queued ahead of the sentinel
+            finalize_if_closed()
+            writer.close()
+            break
+
+        if item[0] == 'data':
+            writer.submit(item[1], item[2])
+            continue
+
+        _, shard_id, cycle, ok, total = item
+        shards = coverage.setdefault(cycle, {})
+        shards[shard_id] = (ok, total)
+        if len(shards) == shard_count:
+            report_coverage(cycle, coverage.pop(cycle))
+        # A shard that overran by more than a couple of minutes skipped those slots; report them partially
+        cutoff = (datetime.strptime(cycle, "%Y-%m-%d %H:%M") - timedelta(minutes=2)).strftime("%Y-%m-%d %H:%M")
+        for stale in [c for c in coverage if c < cutoff]:
+            report_coverage(stale, coverage.pop(stale), shard_count)
+        finalize_if_closed()
+
+def report_coverage(cycle, shards, shard_count=None):
+    ok = sum(s[0] for s in shards.values())
+    total = sum(s[1] for s in shards.values())
+    per_shard = " ".join(f"s{sid}={s[0]}/{s[1]}" for sid, s in sorted(shards.items()))
+    missing = f" (missing shards: {shard_count - len(shards)})" if shard_count else ""
+    pct = 100.0 * ok / total if total else 0.0
+    print(f"[COVERAGE] {cycle} {ok}/{total} symbols ({pct:.1f}%) {per_shard}{missing}")
+
+def run_sharded(config_path="config.json", shards=None):
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    symbols = fit_universe(config, load_universe(config))
+    shards = shard_count(config, len(symbols), shards)
+    # One schedule for every shard, so the host never exceeds nse_requests_per_second
+    rate_limiter = RateLimiter.shared(1.0 / config.get("nse_requests_per_second", 3))
+    queue = multiprocessing.Queue(maxsize=config.get("writer_queue_size", 10000))
+    stop = multiprocessing.Event()
+    # Refreshed here only, so the shards never race on the cache file
+    calendar = TradingCalendar.from_config(config)
+    refresh_calendar(calendar)
+
+    print(f"Starting sharded collector: {len(symbols)} symbols across {shards} shards")
+    writer = multiprocessing.Process(target=writer_main, args=(config_path, queue, shards), name="writer")
+    writer.start()
+    workers = [
+        multiprocessing.Process(target=worker_main, args=(i, symbols[i::shards], config_path, queue, rate_limiter, stop),
+                                name=f"shard-{i}", daemon=True)
+        for i in range(shards)
+    ]
+    for w in workers:
+        w.start()
+
+    try:
+        while any(w.is_alive() for w in workers):
+            refresh_calendar(calendar)
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print("Stopping shards...")
+    finally:
+        stop_all(workers, writer, queue, stop, config.get("shutdown_timeout", 90))
+
+def stop_all(workers, writer, queue, stop, timeout):
+    """
+    Lets each shard finish its current cycle and the writer drain the queue.
+    Processes still running after `timeout` seconds are terminated; a shard
+    killed mid-put can lose that cycle's rows.
+    """
+    stop.set()
+    deadline = time.monotonic() + timeout
+    for w in workers:
+        w.join(max(0, deadline - time.monotonic()))
+    for w in workers:
+        if w.is_alive():
+            print(f"[Sharded] {w.name} did not stop within {timeout}s; terminating")
+            w.terminate()
+            w.join()
+
+    if writer.is_alive():
+        try:
+            queue.put(None, timeout=timeout)
+        except Full:
+            print("[Sharded] Writer queue still full; terminating the writer")
+            writer.terminate()
+    writer.join(timeout)
+    if writer.is_alive():
+        print(f"[Sharded] Writer did not finish within {timeout}s; terminating")
+        writer.terminate()
+        writer.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-process collector")
+    parser.add_argument('--config', default="config.json")
+    parser.add_argument('--shards', type=int, default=None, help='Worker processes (default: config "shards" or CPU count)')
+    args = parser.parse_args()
+    run_sharded(args.config, args.shards)
@@ -0,0 +1,238 @@
+import json
+import os
+import time
+import argparse
+import numpy as np
+from functools import lru_cache
+from datetime import datetime, date
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+@lru_cache(maxsize=64)
+def _session_offsets(start, end, interval=1):
+    """Minute offsets from midnight of every slot in [start, end] (datetime.time), as an int64 array."""
+    first = start.hour * 60 + start.minute
+    last = end.hour * 60 + end.minute
+    offsets = np.arange(first, last + 1, interval, dtype=np.int64)
+    offsets.flags.writeable = False
+    return offsets
+
+@lru_cache(maxsize=64)
+def _session_strings(start, end, interval=1):
+    return tuple(f"{m // 60:02d}:{m % 60:02d}" for m in _session_offsets(start, end, interval).tolist())
+
+def slot_strings(start="09:15", end="15:30", interval=1):
+    """'HH:MM' slots from start to end inclusive; built once per session shape."""
+    return list(_session_strings(datetime.strptime(start, "%H:%M").time(), datetime.strptime(end, "%H:%M").time(), interval))
+
+def _as_date(day):
+    if day is None: return date.today()
+    if isinstance(day, str): return datetime.strptime(day[:10], "%Y-%m-%d").date()
+    if isinstance(day, datetime): return day.date()
+    return day
+
+class TradingCalendar:
+    """
+    NSE trading calendar backed by an on-disk cache of holidays and special
+    sessions (e.g. Muhurat trading), so market-open checks, slot generation and
+    gap detection never need the network. refresh() re-fetches the holiday
+    list once the cache is older than ttl_hours.
+    """
+    def __init__(self, cache_path="trading_calendar.json", ttl_hours=24, market_hours=None,
+                 special_sessions=None, expiry_weekday="Tue", weekly_expiry_symbols=("NIFTY",)):
+        """
+        special_sessions: {'YYYY-MM-DD': {'start': 'HH:MM', 'end': 'HH:MM'}} merged into the cached table
+        expiry_weekday: weekday contracts expire on ('Mon'..'Fri')
+        weekly_expiry_symbols: underlyings with weekly contracts; every other index and
+                               stock only has monthly ones (last expiry_weekday of the month)
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl_hours * 3600
+        m_hours = market_hours or {"start": "09:15", "end": "15:30"}
+        self.start = datetime.strptime(m_hours["start"], "%H:%M").time()
+        self.end = datetime.strptime(m_hours["end"], "%H:%M").time()
+        self.expiry_weekday = expiry_weekday
+        self.weekly_expiry_symbols = frozenset(weekly_expiry_symbols)
+        self.holidays = set()
+        self.special_sessions = {}
+        self.fetched_at = 0
+        self._configured_sessions = {day: self._parse_hours(hours) for day, hours in (special_sessions or {}).items()}
+        self._load()
+        self.special_sessions.update(self._configured_sessions)
+        self._index()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("calendar_cache", "trading_calendar.json"),
+                   ttl_hours=config.get("calendar_ttl_hours", 24),
+                   market_hours=config.get("market_hours"),
+                   special_sessions=config.get("special_sessions"),
+                   expiry_weekday=config.get("expiry_weekday", "Tue"),
+                   weekly_expiry_symbols=config.get("weekly_expiry_symbols", ("NIFTY",)))
+
+    @staticmethod
+    def _parse_hours(hours):
+        return (datetime.strptime(hours["start"], "%H:%M").time(), datetime.strptime(hours["end"], "%H:%M").time())
+
+    def _index(self):
+        """Rebuilds the NumPy holiday/special-day arrays used by the vectorized lookups."""
+        self._holiday_array = np.array(sorted(self.holidays), dtype='datetime64[D]')
+        self._special_array = np.array(sorted(self.special_sessions), dtype='datetime64[D]')
+
+    def _load(self):
+        if not os.path.exists(self.cache_path): return
+        try:
+            with open(self.cache_path, "r") as f:
+                cached = json.load(f)
+            self.holidays = set(cached.get("holidays", []))
+            self.special_sessions = {d: self._parse_hours(h) for d, h in cached.get("special_sessions", {}).items()}
+            self.fetched_at = cached.get("fetched_at", 0)
+        except Exception as e:
+            print(f"[Calendar] Ignoring unreadable cache {self.cache_path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        sessions = {d: {"start": s.strftime("%H:%M"), "end": e.strftime("%H:%M")}
+                    for d, (s, e) in sorted(self.special_sessions.items())}
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": self.fetched_at, "holidays": sorted(self.holidays),
+                       "special_sessions": sessions}, f, indent=1)
+        os.replace(tmp_path, self.cache_path)
+
+    def is_stale(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    def reload(self):
+        """Re-reads the cache (refreshed by another process). True when it is newer than the loaded one."""
+        fetched_at = self.fetched_at
+        self._load()
+        self.special_sessions.update(self._configured_sessions)
+        self._index()
+        return self.fetched_at > fetched_at
+
+    def refresh(self, nse):
+        """
+        nse: NSEClient. Replaces the holidays of the years NSE returned and keeps
+        older years, so past ranges stay resolvable offline. Keeps the cache when the fetch fails.
+        """
+        trading_dates = nse.get_holiday_list()
+        if not trading_dates:
+            print("[Calendar] Holiday fetch failed; keeping cached calendar")
+            return False
+        fetched = {datetime.strptime(d, "%d-%b-%Y").strftime("%Y-%m-%d") for d in trading_dates}
+        years = {d[:4] for d in fetched}
+        self.holidays = {d for d in self.holidays if d[:4] not in years} | fetched
+        self.fetched_at = time.time()
+        self._index()
+        self._save()
+        return True
+
+    def add_special_session(self, day, start, end):
+        """Records a one-off session (e.g. Muhurat trading) for day; it counts as a trading day even on a weekend."""
+        self.special_sessions[_as_date(day).strftime("%Y-%m-%d")] = self._parse_hours({"start": start, "end": end})
+        self._index()
+        self._save()
+
+    def is_trading_day(self, day=None):
+        day = _as_date(day)
+        day_str = day.strftime("%Y-%m-%d")
+        if day_str in self.special_sessions: return True
+        return day.weekday() < 5 and day_str not in self.holidays
+
+    def session(self, day=None):
+        """(start, end) datetime.time of day's session, or None when the market is closed all day."""
+        day = _as_date(day)
+        special = self.special_sessions.get(day.strftime("%Y-%m-%d"))
+        if special: return special
+        return (self.start, self.end) if self.is_trading_day(day) else None
+
+    def minute_slots(self, day=None, interval=1):
+        """'HH:MM' slots of day's session (empty on closed days). Shared across days with the same hours."""
+        hours = self.session(day)
+        return list(_session_strings(*hours, interval)) if hours else []
+
+    def minute_array(self, day=None, interval=1):
+        """day's slots as datetime64[m]."""
+        hours = self.session(day)
+        if not hours: return np.array([], dtype='datetime64[m]')
+        return np.datetime64(_as_date(day), 'm') + _session_offsets(*hours, interval).astype('timedelta64[m]')
+
+    def is_market_open(self, now=None):
+        now = now or datetime.now()
+        hours = self.session(now.date())
+        return hours is not None and hours[0] <= now.time() <= hours[1]
+
+    def is_session_over(self, now=None):
+        """True once today's session (if any) has closed."""
+        now = now or datetime.now()
+        hours = self.session(now.date())
+        return hours is not None and now.time() > hours[1]
+
+    def trading_days(self, start, end):
+        """Trading days in [start, end] as a datetime64[D] array, without a per-day Python loop."""
+        days = np.arange(np.datetime64(_as_date(start), 'D'), np.datetime64(_as_date(end), 'D') + 1)
+        mask = np.is_busday(days, holidays=self._holiday_array) | np.isin(days, self._special_array)
+        return days[mask]
+
+    def trading_minutes(self, start, end, interval=1):
+        """Every session slot of every trading day in [start, end] as one sorted datetime64[m] array."""
+        days = self.trading_days(start, end)
+        special = np.isin(days, self._special_array)
+        regular = days[~special].astype('datetime64[m]')
+        offsets = _session_offsets(self.start, self.end, interval).astype('timedelta64[m]')
+        parts = [(regular[:, None] + offsets[None, :]).ravel()]
+        parts += [self.minute_array(d.astype(date), interval) for d in days[special]]
+        return np.sort(np.concatenate(parts))
+
+    def expiry_for(self, days, weekday=None, symbol=None):
+        """
+        Nearest expiry for each day, moved to the previous trading day when it falls
+        on a holiday. Without symbol (or for weekly_expiry_symbols) that is the next
+        `weekday` on or after the day; other symbols ('BANKNIFTY', 'NSE|EQ|SBIN')
+        get the month's last `weekday`. Accepts one day (returns 'YYYY-MM-DD') or
+        an array-like of days (returns datetime64[D]).
+        """
+        mask = [0] * 7
+        mask[WEEKDAYS.index(weekday or self.expiry_weekday)] = 1
+        scalar = isinstance(days, (str, date))
+        arr = np.array([_as_date(days)] if scalar else [_as_date(d) for d in days], dtype='datetime64[D]')
+        if symbol is None or symbol.split('|')[-1].upper() in self.weekly_expiry_symbols:
+            nominal = np.busday_offset(arr, 0, roll='forward', weekmask=mask)
+            expiry = np.busday_offset(nominal, 0, roll='backward', holidays=self._holiday_array)
+        else:
+            months = arr.astype('datetime64[M]')
+            expiry = self._monthly_expiry(months, mask)
+            # Past this month's expiry the next month's contract is the nearest
+            expiry = np.where(expiry >= arr, expiry, self._monthly_expiry(months + 1, mask))
+        return str(expiry[0]) if scalar else expiry
+
+    def _monthly_expiry(self, months, mask):
+        """Last weekday-in-mask of each datetime64[M] month, holiday-adjusted backward."""
+        month_ends = (months + 1).astype('datetime64[D]') - 1
+        nominal = np.busday_offset(month_ends, 0, roll='backward', weekmask=mask)
+        return np.busday_offset(nominal, 0, roll='backward', holidays=self._holiday_array)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline NSE trading calendar")
+    parser.add_argument('--config', default="config.json")
+    parser.add_argument('--refresh', action='store_true', help='Fetch the holiday list from NSE into the cache')
+    parser.add_argument('--session', nargs=3, metavar=('DATE', 'START', 'END'), help='Add a special session, e.g. Muhurat trading')
+    parser.add_argument('--show', nargs=2, metavar=('START', 'END'), help='List trading days, slots and expiries in a range')
+    parser.add_argument('--symbol', help='Expiries shown for this underlying (default: the weekly series)')
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        calendar = TradingCalendar.from_config(json.load(f))
+    if args.refresh:
+        from clients import NSEClient
+        nse = NSEClient(keep_alive=False)
+        calendar.refresh(nse)
+        nse.close()
+    if args.session:
+        calendar.add_special_session(*args.session)
+    if args.show:
+        days = calendar.trading_days(*args.show)
+        for day, expiry in zip(days, calendar.expiry_for(days.astype(date), symbol=args.symbol)):
+            slots = calendar.minute_slots(day.astype(date))
+            print(f"{day}  {slots[0]}-{slots[-1]} ({len(slots)} slots)  expiry {expiry}")
+        print(f"{len(days)} trading days, {len(calendar.trading_minutes(*args.show))} minutes")
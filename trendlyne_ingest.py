@@ -0,0 +1,78 @@
+"""
+Single ingestion stage for Trendlyne live-oi-data snapshots. A snapshot body is
+parsed once into option_data rows, the store the collector and backfiller
+share; the per-strike/per-minute shapes backfill_trendlyne.py used to write
+are the option_chain_details / option_aggregates views over it (see Database).
+Minutes already in option_data are not fetched again, whichever tool wrote them.
+"""
+from datetime import date
+from clients import TrendlyneClient, INDEX_SYMBOLS
+
+def canonical_symbol(symbol):
+    """'NIFTY' -> 'NSE|INDEX|NIFTY', 'SBIN' -> 'NSE|EQ|SBIN'; collector symbols pass through."""
+    if '|' in symbol: return symbol
+    return f"NSE|INDEX|{symbol}" if symbol in INDEX_SYMBOLS else f"NSE|EQ|{symbol}"
+
+def chain_pcr(call_oi, put_oi):
+    return round(put_oi / call_oi, 4) if call_oi > 0 else 1.0
+
+def parse_oi_snapshot(body, symbol, timestamp_full, expiry):
+    """
+    live-oi-data body -> (option_rows, total call OI, total put OI). Rows are
+    CE/PE tuples per strike in database.OPTION_COLUMNS order.
+    """
+    option_rows = []
+    total_call_oi = total_put_oi = 0
+    for strike_str, strike_data in body.get('oiData', {}).items():
+        strike = float(strike_str)
+        c_oi = float(strike_data.get('callOi', 0))
+        p_oi = float(strike_data.get('putOi', 0))
+        total_call_oi += c_oi
+        total_put_oi += p_oi
+        option_rows.append((timestamp_full, symbol, strike, expiry, 'CE', strike_data.get('callClose', 0),
+                            c_oi, float(strike_data.get('callOiChange', 0))))
+        option_rows.append((timestamp_full, symbol, strike, expiry, 'PE', strike_data.get('putClose', 0),
+                            p_oi, float(strike_data.get('putOiChange', 0))))
+    return option_rows, total_call_oi, total_put_oi
+
+def snapshot_rows(body, symbol, expiry, ts_hhmm, date_str=None):
+    """option_data tuples for a fetched body, stamped with the trading date and expiry the body reports."""
+    input_data = body.get('inputData', {})
+    trading_date = input_data.get('tradingDate') or date_str or date.today().strftime("%Y-%m-%d")
+    expiry = (input_data.get('expDateList') or [expiry])[0]
+    return parse_oi_snapshot(body, symbol, f"{trading_date} {ts_hhmm}:00", expiry)[0]
+
+class SnapshotIngestor:
+    """Fetches Trendlyne snapshots for the minutes option_data is missing and stores them there."""
+    def __init__(self, db, tl=None):
+        """db: Database (the collector DB)"""
+        self.db = db
+        self.tl = tl or TrendlyneClient()
+        self.stats = {'fetched': 0, 'skipped': 0, 'rows': 0}
+
+    def stored_slots(self, symbol, date_str=None):
+        """'HH:MM' minutes of date_str (default today) that need no fetch."""
+        return set(self.db.option_minutes(symbol, date_str or date.today().strftime("%Y-%m-%d")))
+
+    def ingest(self, symbol, stock_id, expiry, ts_hhmm, date_str=None, stored=None):
+        """
+        Fetches the snapshot at ts_hhmm and writes it to option_data. stored: result
+        of stored_slots() to skip against (looked up when None). True when the
+        minute is in option_data afterwards.
+        """
+        if stored is None:
+            stored = self.stored_slots(symbol, date_str)
+        if ts_hhmm in stored:
+            self.stats['skipped'] += 1
+            return True
+
+        body = self.tl.get_oi_snapshot(stock_id, expiry, ts_hhmm)
+        self.stats['fetched'] += 1
+        if not body:
+            return False
+        option_rows = snapshot_rows(body, symbol, expiry, ts_hhmm, date_str)
+        if not option_rows:
+            return False
+        self.db.save_option_rows(option_rows)
+        self.stats['rows'] += len(option_rows)
+        return True
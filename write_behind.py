@@ -0,0 +1,126 @@
+import os
+import json
+import queue
+import threading
+
+class WriteBehindWriter:
+    """
+    Stores collector rows on a background thread so a slow disk or a locked
+    database never delays the next fetch. Rows that cannot be written (queue
+    full, database busy, any error) are appended to a local journal, which is
+    replayed on startup and again once the database accepts writes.
+    """
+    def __init__(self, db, rollups=None, journal_path="collector_journal.jsonl", max_queue=1000):
+        self.db = db
+        self.rollups = rollups
+        self.journal_path = journal_path
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._journal_lock = threading.Lock()
+        self._journal_pending = os.path.exists(journal_path)
+        self.stats = {'written': 0, 'carried': 0, 'spilled': 0, 'replayed': 0}
+
+        self.replay()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, market_record, option_entries):
+        try:
+            self.queue.put_nowait((market_record, option_entries))
+        except queue.Full:
+            self._spill(market_record, option_entries)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            try:
+                if self._write(*item):
+                    if self._journal_pending and self.queue.empty():
+                        self.replay()
+                else:
+                    self._spill(*item)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, market_record, option_entries):
+        try:
+            self.db.save_market_data(market_record)
+            if option_entries is None:
+                # Unchanged chain (adaptive polling): no option rows, the last stored snapshot covers the minute
+                self.db.carry_minute(market_record['symbol'], market_record['timestamp'])
+            else:
+                self.db.save_option_data(option_entries)
+            if self.rollups is not None:
+                self.rollups.update_minute(market_record['symbol'], market_record['timestamp'])
+        except Exception as e:
+            print(f"[Writer] Deferring {market_record['symbol']} at {market_record['timestamp']}: {e}")
+            return False
+        self.stats['carried' if option_entries is None else 'written'] += 1
+        print(f"Saved data for {market_record['symbol']} at {market_record['timestamp']}")
+        return True
+
+    def _spill(self, market_record, option_entries):
+        line = json.dumps({'market': market_record, 'options': option_entries}, default=float)
+        with self._journal_lock:
+            with open(self.journal_path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_pending = True
+        self.stats['spilled'] += 1
+
+    def replay(self):
+        """Writes journaled rows to the database; rows that still fail go back to a fresh journal."""
+        replay_path = f"{self.journal_path}.replay"
+        with self._journal_lock:
+            if os.path.exists(self.journal_path) and not os.path.exists(replay_path):
+                os.replace(self.journal_path, replay_path)
+            self._journal_pending = False
+        if not os.path.exists(replay_path):
+            return 0
+
+        replayed = 0
+        with open(replay_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-append
+                if self._write(entry['market'], entry['options']):
+                    replayed += 1
+                else:
+                    self._spill(entry['market'], entry['options'])
+        os.remove(replay_path)
+        with self._journal_lock:
+            self._journal_pending = os.path.exists(self.journal_path)
+        self.stats['replayed'] += replayed
+        if replayed:
+            print(f"[Writer] Replayed {replayed} journaled snapshots from {self.journal_path}")
+        return replayed
+
+    def flush(self):
+        """Blocks until every row submitted so far has been written or journaled."""
+        self.queue.join()
+
+    def close(self, timeout=30):
+        """Drains the queue; rows still queued after timeout seconds are journaled for the next start."""
+        self.queue.put(None)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            return
+        # The thread is stuck on a write; journal everything behind it
+        spilled = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._spill(*item)
+                spilled += 1
+            self.queue.task_done()
+        # Let the thread exit once its current write returns
+        self.queue.put(None)
+        print(f"[Writer] Still writing after {timeout}s; journaled {spilled} queued snapshots to {self.journal_path}")